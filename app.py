@@ -1,12 +1,26 @@
 import os
 import json
-from flask import Flask, request, jsonify
+import time
+import base64
+import binascii
+import gzip
+import hashlib
+from flask import Flask, Response, request, jsonify, stream_with_context
 from datetime import datetime, timezone
 import uuid
 import re
 from loguru import logger
 from werkzeug.utils import secure_filename
-from database import setup_database, session, Upload, User
+from email_validator import validate_email, EmailNotValidError
+from sqlalchemy import select, tuple_
+from database import (setup_database, session, Session, Upload, User, SlideResult, count_slide_results,
+                      find_upload_by_hash, sync_attached_uploads, get_or_create_user, count_slide_results_by_upload,
+                      count_uploads_by_status, load_partial_explanations, UPLOAD_STATUSES)
+from metrics import REGISTRY, CONTENT_TYPE, UPLOAD_SIZE_BYTES, UPLOAD_QUEUE_DEPTH
+from notifier import notify_workers, StatusListener
+from result_store import ResultStore
+from resumable_upload import (ResumableUploadStore, UploadSessionError, UploadOffsetMismatch, DEFAULT_MAX_UPLOAD_SIZE,
+                              READ_BUFFER_SIZE)
 
 app = Flask(__name__)
 
@@ -14,9 +28,34 @@ UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 LOGS_FOLDER = 'logs'
 FLASK_APP_LOGS_FOLDER = os.path.join(LOGS_FOLDER, 'flask_app')
+STREAM_POLL_SECONDS = 0.5
+STREAM_HEARTBEAT_SECONDS = 15
+MAX_STATUS_WAIT_SECONDS = 60
+MAX_BULK_STATUS_UIDS = 1000
+DEFAULT_HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 1000
+HISTORY_BATCH_SIZE = 200  # Rows fetched from the database at a time while streaming history
+MAX_UPLOAD_PRIORITY = 10  # Uploads may ask for a priority between -10 (backfills) and 10
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = DEFAULT_MAX_UPLOAD_SIZE
+
+# Notifications from the workers about changed uploads, for long-polling and streaming clients
+status_listener = StatusListener()
+
+# Compressed /status responses of finished uploads
+status_store = ResultStore(os.path.join(OUTPUT_FOLDER, 'status'))
+
+# Partially uploaded files of resumable uploads
+upload_store = ResumableUploadStore(os.path.join(UPLOAD_FOLDER, '.partial'), DEFAULT_MAX_UPLOAD_SIZE)
+
+def upload_queue_depth():
+    """Count the uploads in each status, for the queue depth gauge."""
+    with Session() as db:
+        return count_uploads_by_status(db)
+
+UPLOAD_QUEUE_DEPTH.set_function(upload_queue_depth)
 
 # Ensure the logs folder exists at startup
 os.makedirs(LOGS_FOLDER, exist_ok=True)
@@ -44,9 +83,342 @@ def extract_timestamp(filename):
             return None
     return None
 
+def build_stored_filename(filename, uid):
+    """Build the name an upload is stored under: original name, upload timestamp and uid."""
+    timestamp = datetime.now(timezone.utc).isoformat()
+    timestamp_formatted = timestamp.replace(':', '-')
+    timestamp_part = timestamp_formatted.split('+')[0]
+    return f"{os.path.splitext(filename)[0]}_{timestamp_part}_{uid}{os.path.splitext(filename)[1]}"
+
+def save_and_hash(file, path):
+    """Write an uploaded file to disk in blocks, computing its SHA-256 on the way."""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as output:
+        for block in iter(lambda: file.stream.read(READ_BUFFER_SIZE), b''):
+            digest.update(block)
+            output.write(block)
+    return digest.hexdigest()
+
+def parse_priority(value):
+    """
+    Validate the optional priority of an upload.
+
+    Raises:
+        ValueError: If the priority is not an integer in the allowed range.
+    """
+    if value in (None, ''):
+        return 0
+    try:
+        priority = int(value)
+    except (TypeError, ValueError):
+        priority = None
+    if priority is None or abs(priority) > MAX_UPLOAD_PRIORITY:
+        raise ValueError(f"Priority must be an integer between {-MAX_UPLOAD_PRIORITY} and {MAX_UPLOAD_PRIORITY}")
+    return priority
+
+def create_upload_record(uid, stored_filename, email, content_hash, priority=0, db=None):
+    """
+    Create the Upload row (and the User if needed) and wake the workers.
+
+    If a presentation with the same content hash has already been explained, the new
+    upload completes immediately and shares that result. If one is still being
+    processed, the new upload is attached to it instead of being processed again.
+    `db` is the session to use; it defaults to the request's session.
+    """
+    db = db or session
+    user = get_or_create_user(db, email) if email else None
+
+    source = find_upload_by_hash(db, content_hash)
+    if source and source.status == 'done' and not os.path.exists(
+            os.path.join(app.config['OUTPUT_FOLDER'], f"{source.uid}.json")):
+        source = None  # The earlier result is gone, so process this upload from scratch
+
+    new_upload = Upload(uid=uid, filename=stored_filename, status='pending', user_id=user.id if user else None,
+                        content_hash=content_hash, source_uid=source.uid if source else None, priority=priority)
+    if source and source.status == 'done':
+        new_upload.status = 'done'
+        new_upload.finish_time = datetime.utcnow()
+    db.add(new_upload)
+    db.commit()
+
+    if source is None:
+        notify_workers()  # Wake idle explainer workers instead of waiting for their next poll
+    else:
+        logger.info(f"Upload {uid} has the same content as {source.uid} and reuses its result.")
+        # The source may have finished between the lookup and the commit above
+        db.refresh(source)
+        sync_attached_uploads(db, source)
+    return new_upload
+
+def get_result_upload(upload):
+    """Return the upload whose slide results belong to `upload`."""
+    if upload.source_uid:
+        return session.query(Upload).filter_by(uid=upload.source_uid).first() or upload
+    return upload
+
+def get_progress(upload):
+    """Return how many slides of an upload have been explained so far."""
+    result_upload = get_result_upload(upload)
+    return {'done': count_slide_results(session, result_upload.id), 'total': result_upload.total_slides}
+
+def encode_history_cursor(upload):
+    """Encode the position of an upload in the history as an opaque cursor."""
+    position = json.dumps([upload.upload_time.isoformat(), upload.id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_history_cursor(cursor):
+    """
+    Decode a history cursor into its (upload_time, id) position.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        upload_time, upload_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        upload_time, upload_id = datetime.fromisoformat(upload_time), int(upload_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not 0 <= upload_id < 2 ** 63:
+        raise ValueError("Invalid cursor: upload id out of range")  # The database would reject it mid-response
+    return upload_time, upload_id
+
+def parse_history_args(args):
+    """
+    Validate the query parameters of a /history request.
+
+    Args:
+        args (Mapping): The request's query parameters.
+
+    Returns:
+        tuple: (limit, cursor, status, since, until); the optional ones are None when not given.
+
+    Raises:
+        ValueError: If a parameter is invalid; the message is meant for the client.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_HISTORY_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_HISTORY_LIMIT:
+        raise ValueError(f"Limit must be an integer between 1 and {MAX_HISTORY_LIMIT}")
+
+    try:
+        cursor = decode_history_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+    try:
+        since = datetime.fromisoformat(args['since']) if args.get('since') else None
+        until = datetime.fromisoformat(args['until']) if args.get('until') else None
+    except ValueError:
+        raise ValueError('Time range must be given as ISO 8601 timestamps')
+
+    status = args.get('status')
+    if status and status not in UPLOAD_STATUSES:
+        raise ValueError(f"Invalid status: {status}. Must be one of {UPLOAD_STATUSES}.")
+    return limit, cursor, status, since, until
+
+def build_history_query(user_id, limit, cursor=None, status=None, since=None, until=None):
+    """
+    Build the SELECT of one page of a user's uploads, newest first.
+
+    It selects one upload more than `limit`, which is not returned but tells whether another page follows.
+    """
+    query = select(Upload).where(Upload.user_id == user_id)
+    if cursor:
+        # The cursor continues right after the last upload of the previous page
+        query = query.where(tuple_(Upload.upload_time, Upload.id) < tuple_(*cursor))
+    if status:
+        query = query.where(Upload.status == status)
+    if since:
+        query = query.where(Upload.upload_time >= since)
+    if until:
+        query = query.where(Upload.upload_time < until)
+    return query.order_by(Upload.upload_time.desc(), Upload.id.desc()).limit(limit + 1)
+
+def history_record(upload):
+    """Return the /history entry of an upload."""
+    return {
+        'uid': upload.uid,
+        'filename': upload.filename,
+        'upload_time': upload.upload_time,
+        'status': upload.status,
+        'finish_time': upload.finish_time,
+        'error_message': upload.error_message
+    }
+
+def status_document(upload, status, explanation, progress):
+    """Build the body of a /status response."""
+    return {
+        'status': status,
+        'filename': upload.filename,
+        'timestamp': upload.upload_time.isoformat(),
+        'explanation': explanation,
+        'progress': progress
+    }
+
+def get_status_tag(upload, progress):
+    """Build the (weak) ETag of the state of an unfinished upload."""
+    return f"{upload.status}-{progress['done']}-{progress['total']}"
+
+def parse_wait(value):
+    """
+    Validate the optional wait of a /status request.
+
+    Returns:
+        float: The number of seconds to wait, capped at MAX_STATUS_WAIT_SECONDS.
+
+    Raises:
+        ValueError: If the wait is not a non-negative number of seconds.
+    """
+    if value in (None, ''):
+        return 0
+    try:
+        wait = float(value)
+    except ValueError:
+        wait = None
+    if wait is None or not wait >= 0:  # Also rejects NaN
+        raise ValueError('Wait must be a non-negative number of seconds')
+    return min(wait, MAX_STATUS_WAIT_SECONDS)
+
+def wait_for_status_change(upload, progress, generation, timeout):
+    """
+    Hold a /status request until the upload's status or progress changes.
+
+    The baseline is the state the client already has (its If-None-Match), or otherwise
+    the state at the start of the request. Changes are signalled by the workers, so the
+    database is only read again when something happened.
+
+    Args:
+        upload (Upload): The upload, as read at the start of the request.
+        progress (dict): Its progress, as read at the start of the request.
+        generation (int): status_listener.generation seen before that read.
+        timeout (float): Maximum number of seconds to wait.
+
+    Returns:
+        tuple: The current upload and progress.
+    """
+    initial_tag = get_status_tag(upload, progress)
+
+    def unchanged(tag):
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(tag)
+        return tag == initial_tag
+
+    deadline = time.monotonic() + timeout
+    result_uid = upload.result_uid
+    while not upload.finish_time and unchanged(get_status_tag(upload, progress)):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not status_listener.wait(result_uid, generation, remaining):
+            break
+        generation = status_listener.generation
+        session.commit()  # End the read transaction so the next read sees the worker's changes
+        upload = session.get(Upload, upload.id)
+        progress = get_progress(upload)
+    return upload, progress
+
+def load_explanation(upload):
+    """Return the explanations of a finished upload, or None if its output is missing."""
+    stored = status_store.get(upload.uid)
+    if stored is not None:
+        return json.loads(gzip.decompress(stored[1]))['explanation']
+    output_file_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{upload.result_uid}.json")
+    if not os.path.exists(output_file_path):
+        return None
+    with open(output_file_path, 'r') as output_file:
+        return json.load(output_file)
+
+def send_stored_status(etag, compressed):
+    """
+    Send a stored status document, honoring If-None-Match and Accept-Encoding.
+
+    Clients that accept gzip receive the stored bytes as they are; others receive them
+    decompressed. Each encoding has its own strong ETag.
+    """
+    use_gzip = request.accept_encodings['gzip'] > 0
+    etag = f"{etag}-gzip" if use_gzip else etag
+    headers = {'ETag': f'"{etag}"', 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        body = compressed
+    else:
+        body = gzip.decompress(compressed)
+    return Response(body, status=200, mimetype='application/json', headers=headers)
+
+def parse_bulk_status_request(data):
+    """
+    Validate the JSON body of a /status/bulk request.
+
+    Returns:
+        tuple: The list of uids and whether to include the explanations.
+
+    Raises:
+        ValueError: If the body is invalid; the message is meant for the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON body with a list of uids')
+    uids = data.get('uids')
+    if not isinstance(uids, list) or not all(isinstance(uid, str) for uid in uids):
+        raise ValueError('Expected a JSON body with a list of uids')
+    if len(uids) > MAX_BULK_STATUS_UIDS:
+        raise ValueError(f"At most {MAX_BULK_STATUS_UIDS} uids can be looked up at once")
+    return uids, bool(data.get('include_explanations'))
+
+def get_bulk_statuses(db, uids):
+    """
+    Look up the status and progress of many uploads with a constant number of queries.
+
+    Args:
+        db (Session): The database session to use.
+        uids (list of str): The uids to look up.
+
+    Returns:
+        tuple: The /status/bulk entry of every uid, and the finished uploads among them by uid,
+            whose explanations can be added with load_explanation.
+    """
+    uploads = db.query(Upload).filter(Upload.uid.in_(set(uids))).all() if uids else []
+    # Uploads that share the result of an identical upload report that upload's progress
+    uploads_by_uid = {upload.uid: upload for upload in uploads}
+    missing_sources = {upload.source_uid for upload in uploads if upload.source_uid} - set(uploads_by_uid)
+    if missing_sources:
+        for source in db.query(Upload).filter(Upload.uid.in_(missing_sources)).all():
+            uploads_by_uid[source.uid] = source
+    result_uploads = {upload.uid: uploads_by_uid.get(upload.result_uid, upload) for upload in uploads}
+    slide_counts = count_slide_results_by_upload(db, {upload.id for upload in result_uploads.values()})
+
+    statuses = {}
+    finished = {}
+    for uid in uids:
+        if uid not in result_uploads:
+            statuses[uid] = {'status': 'not found'}
+            continue
+        upload = uploads_by_uid[uid]
+        result_upload = result_uploads[uid]
+        statuses[uid] = {
+            'status': upload.status,
+            'finish_time': upload.finish_time.isoformat() if upload.finish_time else None,
+            'progress': {'done': slide_counts[result_upload.id], 'total': result_upload.total_slides},
+        }
+        if upload.finish_time:
+            finished[uid] = upload
+    return statuses, finished
+
+def format_sse(event, data):
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """Return the request thread's database session to the pool."""
+    session.remove()
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     ensure_directories_exist()  # Ensure directories exist before file operation
+    stored_path = None
     try:
         logger.info("Starting upload_file function...")  # Log function start
 
@@ -58,41 +430,114 @@ def upload_file():
             logger.error(error_msg)
             return jsonify({'error': 'No file provided in the request'}), 400
 
+        try:
+            priority = parse_priority(request.form.get('priority'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         filename = secure_filename(file.filename)
         uid = generate_uid()
-        timestamp = datetime.now(timezone.utc).isoformat()
-        timestamp_formatted = timestamp.replace(':', '-')
-        timestamp_part = timestamp_formatted.split('+')[0]
+        new_filename = build_stored_filename(filename, uid)
+        stored_path = os.path.join(app.config['UPLOAD_FOLDER'], new_filename)
+        content_hash = save_and_hash(file, stored_path)
+        UPLOAD_SIZE_BYTES.observe(os.path.getsize(stored_path))
+
+        new_upload = create_upload_record(uid, new_filename, email, content_hash, priority)
 
-        new_filename = f"{os.path.splitext(filename)[0]}_{timestamp_part}_{uid}{os.path.splitext(filename)[1]}"
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+        logger.info("File uploaded successfully.")  # Log successful upload
+
+        return jsonify({'uid': uid, 'status': 'File uploaded successfully', 'duplicate_of': new_upload.source_uid}), 200
+    except Exception as e:
+        session.rollback()
+        if stored_path is not None and os.path.exists(stored_path):
+            os.remove(stored_path)  # Do not leave a file behind that no Upload row refers to
+        error_msg = f"Failed to upload file: {str(e)}"
+        logger.error(error_msg)
+        return jsonify({'error': f"Failed to upload file: {str(e)}"}), 500
 
-        user = None
+@app.route('/upload/init', methods=['POST'])
+def init_resumable_upload():
+    ensure_directories_exist()
+    try:
+        data = request.get_json(silent=True) or request.form
+        filename = secure_filename(data.get('filename') or '')
+        if not filename:
+            return jsonify({'error': 'Filename not provided'}), 400
+        total_size = data.get('size')
+        total_size = int(total_size) if total_size is not None else None
+        email = data.get('email')
         if email:
-            user = session.query(User).filter_by(email=email).first()
-            if not user:
-                user = User(email=email)
-                session.add(user)
-                session.commit()
+            try:
+                validate_email(email)
+            except EmailNotValidError as e:
+                return jsonify({'error': f"Invalid email: {e}"}), 400
 
-        new_upload = Upload(uid=uid, filename=new_filename, status='pending', user_id=user.id if user else None)
-        session.add(new_upload)
-        session.commit()
+        upload_id = upload_store.create(filename, email, total_size)
+        logger.info(f"Started resumable upload {upload_id} for {filename}")
+        return jsonify({'upload_id': upload_id, 'offset': 0, 'max_size': upload_store.max_size}), 201
+    except UploadSessionError as e:
+        logger.error(f"Failed to start upload: {e}")
+        return jsonify({'error': str(e)}), e.status_code
+    except ValueError:
+        return jsonify({'error': 'Size must be an integer'}), 400
 
-        logger.info("File uploaded successfully.")  # Log successful upload
+@app.route('/upload/<upload_id>', methods=['GET'])
+def get_resumable_upload(upload_id):
+    try:
+        offset, metadata = upload_store.get_offset(upload_id)
+        return jsonify({'upload_id': upload_id, 'offset': offset, 'size': metadata['total_size']}), 200
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
 
-        return jsonify({'uid': uid, 'status': 'File uploaded successfully'}), 200
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    offset = request.args.get('offset', request.headers.get('Upload-Offset'))
+    if offset is None or not offset.isdigit():
+        return jsonify({'error': 'A numeric chunk offset is required'}), 400
+    try:
+        new_offset = upload_store.append_chunk(upload_id, int(offset), request.stream)
+        return jsonify({'upload_id': upload_id, 'offset': new_offset}), 200
+    except UploadOffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.expected_offset}), e.status_code
+    except UploadSessionError as e:
+        logger.error(f"Failed to store chunk for upload {upload_id}: {e}")
+        return jsonify({'error': str(e)}), e.status_code
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_resumable_upload(upload_id):
+    ensure_directories_exist()
+    try:
+        data = request.get_json(silent=True) or {}
+        _, metadata = upload_store.get_offset(upload_id)
+        uid = generate_uid()
+        new_filename = build_stored_filename(metadata['filename'], uid)
+        stored_path = os.path.join(app.config['UPLOAD_FOLDER'], new_filename)
+        metadata, sha256 = upload_store.complete(upload_id, stored_path, data.get('sha256'))
+        UPLOAD_SIZE_BYTES.observe(os.path.getsize(stored_path))
+
+        try:
+            new_upload = create_upload_record(uid, new_filename, metadata['email'], sha256)
+        except Exception:
+            os.remove(stored_path)  # Do not leave a file behind that no Upload row refers to
+            raise
+
+        logger.info(f"Resumable upload {upload_id} finalized as {uid}.")
+        return jsonify({'uid': uid, 'sha256': sha256, 'status': 'File uploaded successfully',
+                        'duplicate_of': new_upload.source_uid}), 200
+    except UploadSessionError as e:
+        logger.error(f"Failed to finalize upload {upload_id}: {e}")
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         session.rollback()
         error_msg = f"Failed to upload file: {str(e)}"
         logger.error(error_msg)
-        return jsonify({'error': f"Failed to upload file: {str(e)}"}), 500
+        return jsonify({'error': error_msg}), 500
 
 @app.route('/status', methods=['GET'])
 def get_status():
     ensure_directories_exist()  # Ensure directories exist before checking status
     try:
-        logger.info("Starting get_status function...")  # Log function start
+        logger.debug("Starting get_status function...")  # Log function start
 
         uid = request.args.get('uid')
 
@@ -101,6 +546,15 @@ def get_status():
             logger.error(error_msg)
             return jsonify({'error': 'UID not provided'}), 400
 
+        try:
+            wait = parse_wait(request.args.get('wait'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if wait > 0:
+            status_listener.start()
+        # Taken before reading the upload, so a change right after the read still ends the wait
+        generation = status_listener.generation
+
         upload = session.query(Upload).filter_by(uid=uid).first()
 
         if not upload:
@@ -108,59 +562,152 @@ def get_status():
                             'explanation': 'No upload exists with the given UID'}), 404
 
         if upload.finish_time:
-            output_file_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{upload.uid}.json")
+            # Finished results never change, so they are served from the precompressed copy
+            stored = status_store.get(upload.uid)
+            if stored is not None:
+                return send_stored_status(*stored)
+
+        progress = get_progress(upload)
+        if wait > 0 and not upload.finish_time:
+            upload, progress = wait_for_status_change(upload, progress, generation, wait)
+
+        if upload.finish_time:
+            output_file_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{upload.result_uid}.json")
             if os.path.exists(output_file_path):
                 with open(output_file_path, 'r') as output_file:
                     explanation = json.load(output_file)
                 logger.info(f"File explained successfully: {output_file_path}")
-                return jsonify({
-                    'status': 'done',
-                    'filename': upload.filename,
-                    'timestamp': upload.upload_time.isoformat(),
-                    'explanation': explanation
-                }), 200
+                return send_stored_status(*status_store.put(
+                    upload.uid, status_document(upload, 'done', explanation, progress)))
             else:
-                return jsonify({
-                    'status': 'done',
-                    'filename': upload.filename,
-                    'timestamp': upload.upload_time.isoformat(),
-                    'explanation': 'Output file not found'
-                }), 200
+                return jsonify(status_document(upload, 'done', 'Output file not found', progress)), 200
         else:
-            return jsonify({
-                'status': 'pending',
-                'filename': upload.filename,
-                'timestamp': upload.upload_time.isoformat(),
-                'explanation': None
-            }), 200
+            tag = get_status_tag(upload, progress)
+            if request.if_none_match.contains_weak(tag):
+                return Response(status=304, headers={'ETag': f'W/"{tag}"'})
+            response = jsonify(status_document(upload, 'pending', None, progress))
+            response.headers['ETag'] = f'W/"{tag}"'
+            return response, 200
     except Exception as e:
         error_msg = f"Failed to get status: {str(e)}"
         logger.error(error_msg)
         return jsonify({'error': f"Failed to get status: {str(e)}"}), 500
 
+@app.route('/status/bulk', methods=['POST'])
+def get_bulk_status():
+    try:
+        uids, include_explanations = parse_bulk_status_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    statuses, finished = get_bulk_statuses(session, uids)
+    if include_explanations:
+        for uid, upload in finished.items():
+            statuses[uid]['explanation'] = load_explanation(upload)
+    return jsonify({'statuses': statuses}), 200
+
+@app.route('/status/stream', methods=['GET'])
+def stream_status():
+    uid = request.args.get('uid')
+    if not uid:
+        return jsonify({'error': 'UID not provided'}), 400
+
+    upload = session.query(Upload).filter_by(uid=uid).first()
+    if not upload:
+        return jsonify({'error': 'No upload exists with the given UID'}), 404
+    result_upload = get_result_upload(upload)
+    upload_id = result_upload.id
+    result_uid = result_upload.uid
+    status_listener.start()
+    logger.info(f"Streaming status for {uid}")
+
+    def generate():
+        # The stream outlives the request, so it gets its own session
+        stream_session = Session()
+        last_result_id = 0
+        last_partials = {}
+        last_progress = None
+        last_message_time = time.monotonic()
+        try:
+            while True:
+                generation = status_listener.generation
+                results = stream_session.query(SlideResult) \
+                    .filter(SlideResult.upload_id == upload_id, SlideResult.id > last_result_id) \
+                    .order_by(SlideResult.id).all()
+                for result in results:
+                    yield format_sse('slide', {'slide_number': result.slide_number, 'explanation': result.explanation})
+                    last_result_id = result.id
+                # Text generated so far for slides that are still being streamed by the model
+                partials = load_partial_explanations(stream_session, upload_id)
+                for slide_number, partial in sorted(partials.items()):
+                    if last_partials.get(slide_number) != partial:
+                        yield format_sse('partial', {'slide_number': slide_number, 'explanation': partial})
+                        last_message_time = time.monotonic()
+                last_partials = partials
+
+                status, finish_time, total_slides = stream_session.query(
+                    Upload.status, Upload.finish_time, Upload.total_slides).filter(Upload.id == upload_id).one()
+                progress = {'done': count_slide_results(stream_session, upload_id), 'total': total_slides}
+                stream_session.commit()  # End the read transaction so the next pass sees new rows
+                if progress != last_progress:
+                    yield format_sse('progress', progress)
+                    last_progress = progress
+                    last_message_time = time.monotonic()
+                if finish_time:
+                    yield format_sse('done', {'status': status})
+                    return
+
+                if time.monotonic() - last_message_time > STREAM_HEARTBEAT_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_message_time = time.monotonic()
+                if status_listener.running:
+                    # Read again as soon as the worker reports a change
+                    status_listener.wait(result_uid, generation, STREAM_HEARTBEAT_SECONDS)
+                else:
+                    time.sleep(STREAM_POLL_SECONDS)
+        finally:
+            stream_session.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/history', methods=['GET'])
 def get_history():
     email = request.args.get('email')
     if not email:
         return jsonify({'error': 'Email is required'}), 400
 
+    try:
+        limit, cursor, status, since, until = parse_history_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     user = session.query(User).filter_by(email=email).first()
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    uploads = session.query(Upload).filter_by(user_id=user.id).all()
-    history = [
-        {
-            'uid': upload.uid,
-            'filename': upload.filename,
-            'upload_time': upload.upload_time,
-            'status': upload.status,
-            'finish_time': upload.finish_time,
-            'error_message': upload.error_message
-        } for upload in uploads
-    ]
+    query = build_history_query(user.id, limit, cursor, status, since, until)
+
+    def generate():
+        yield '{"uploads": ['
+        count = 0
+        last_upload = None
+        next_cursor = None
+        for upload in session.scalars(query.execution_options(yield_per=HISTORY_BATCH_SIZE)):
+            if count == limit:
+                # The extra upload only shows that another page follows
+                next_cursor = encode_history_cursor(last_upload)
+                break
+            yield (', ' if count else '') + app.json.dumps(history_record(upload))
+            count += 1
+            last_upload = upload
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
 
-    return jsonify(history), 200
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 if __name__ == '__main__':
     setup_database()
@@ -0,0 +1,310 @@
+import os
+import json
+import gzip
+import time
+import asyncio
+import hashlib
+import contextlib
+import aiofiles
+from loguru import logger
+from sqlalchemy import event, select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import parse_accept_header, parse_etags
+from werkzeug.utils import secure_filename
+from app import (app as flask_app, ensure_directories_exist, generate_uid, build_stored_filename, create_upload_record,
+                 encode_history_cursor, parse_history_args, build_history_query, history_record, status_document,
+                 get_status_tag, parse_priority, parse_wait, parse_bulk_status_request, get_bulk_statuses,
+                 load_explanation, status_store, OUTPUT_FOLDER, UPLOAD_FOLDER, HISTORY_BATCH_SIZE)
+from database import DATABASE_URL, SQL_ECHO, Upload, User, SlideResult, configure_sqlite_connection
+from notifier import AsyncStatusListener
+from metrics import REGISTRY, CONTENT_TYPE, UPLOAD_SIZE_BYTES
+from resumable_upload import DEFAULT_MAX_UPLOAD_SIZE, READ_BUFFER_SIZE
+
+# The async driver of the database; for SQLite it is derived from DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', DATABASE_URL.replace('sqlite://', 'sqlite+aiosqlite://', 1))
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=SQL_ECHO, pool_pre_ping=True)
+event.listen(async_engine.sync_engine, 'connect', configure_sqlite_connection)
+# Sessions are short-lived and closed before a request waits, so idle clients hold no connection
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Notifications from the workers about changed uploads, for long-polling clients
+status_listener = AsyncStatusListener()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def save_and_hash(file, path, max_size=DEFAULT_MAX_UPLOAD_SIZE):
+    """Write an uploaded file to disk in blocks without blocking the event loop, computing its SHA-256 on the way."""
+    digest = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(path, 'wb') as output:
+        while True:
+            block = await file.read(READ_BUFFER_SIZE)
+            if not block:
+                break
+            size += len(block)
+            if size > max_size:
+                raise UploadTooLarge(f"File exceeds the maximum upload size of {max_size} bytes")
+            digest.update(block)
+            await output.write(block)
+    return digest.hexdigest()
+
+
+async def get_progress(db, upload):
+    """Return how many slides of an upload have been explained so far."""
+    result_upload = upload
+    if upload.source_uid:
+        result_upload = await db.scalar(select(Upload).where(Upload.uid == upload.source_uid)) or upload
+    done = await db.scalar(select(func.count(SlideResult.id)).where(SlideResult.upload_id == result_upload.id))
+    return {'done': done, 'total': result_upload.total_slides}
+
+
+async def load_upload(uid):
+    """Read an upload and its progress in a session of its own; returns (None, None) if it does not exist."""
+    async with AsyncSession() as db:
+        upload = await db.scalar(select(Upload).where(Upload.uid == uid))
+        if upload is None:
+            return None, None
+        return upload, await get_progress(db, upload)
+
+
+async def read_stored_status(key):
+    """Load a document from the status store with async file I/O; returns None if it is not stored."""
+    try:
+        async with aiofiles.open(status_store.path(key), 'rb') as document_file:
+            return status_store.parse(await document_file.read())
+    except FileNotFoundError:
+        return None
+
+
+def send_stored_status(request, etag, compressed):
+    """Send a stored status document, honoring If-None-Match and Accept-Encoding, like the Flask app."""
+    use_gzip = parse_accept_header(request.headers.get('accept-encoding'))['gzip'] > 0
+    etag = f"{etag}-gzip" if use_gzip else etag
+    headers = {'ETag': f'"{etag}"', 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if parse_etags(request.headers.get('if-none-match')).contains(etag):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        body = compressed
+    else:
+        body = gzip.decompress(compressed)
+    return Response(body, status_code=200, media_type='application/json', headers=headers)
+
+
+async def wait_for_status_change(request, upload, progress, generation, timeout):
+    """
+    Hold a /status request until the upload's status or progress changes.
+
+    Same semantics as the Flask app's version, but waiting costs a future instead of a
+    thread, and no database connection is held while waiting.
+
+    Returns:
+        tuple: The current upload and progress.
+    """
+    if_none_match = parse_etags(request.headers.get('if-none-match'))
+    initial_tag = get_status_tag(upload, progress)
+
+    def unchanged(tag):
+        if request.headers.get('if-none-match'):
+            return if_none_match.contains_weak(tag)
+        return tag == initial_tag
+
+    deadline = time.monotonic() + timeout
+    result_uid = upload.result_uid
+    while not upload.finish_time and unchanged(get_status_tag(upload, progress)):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not await status_listener.wait(result_uid, generation, remaining):
+            break
+        generation = status_listener.generation
+        upload, progress = await load_upload(upload.uid)
+    return upload, progress
+
+
+async def upload_file(request):
+    ensure_directories_exist()
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > DEFAULT_MAX_UPLOAD_SIZE:
+        return JSONResponse({'error': 'File is too large'}, status_code=413)
+
+    stored_path = None
+    try:
+        logger.info("Starting upload_file function...")
+        async with request.form(max_files=1) as form:
+            file = form.get('file')
+            email = form.get('email')
+            if not isinstance(file, UploadFile):
+                logger.error('No file provided in the request')
+                return JSONResponse({'error': 'No file provided in the request'}, status_code=400)
+            try:
+                priority = parse_priority(form.get('priority'))
+            except ValueError as e:
+                return JSONResponse({'error': str(e)}, status_code=400)
+
+            uid = generate_uid()
+            new_filename = build_stored_filename(secure_filename(file.filename or ''), uid)
+            stored_path = os.path.join(UPLOAD_FOLDER, new_filename)
+            content_hash = await save_and_hash(file, stored_path)
+            UPLOAD_SIZE_BYTES.observe(os.path.getsize(stored_path))
+
+        async with AsyncSession() as db:
+            # The deduplication logic is shared with the Flask app and runs on the sync session API
+            duplicate_of = await db.run_sync(
+                lambda sync_db: create_upload_record(uid, new_filename, email, content_hash, priority,
+                                                     db=sync_db).source_uid)
+
+        logger.info("File uploaded successfully.")
+        return JSONResponse({'uid': uid, 'status': 'File uploaded successfully', 'duplicate_of': duplicate_of})
+    except UploadTooLarge as e:
+        os.remove(stored_path)
+        return JSONResponse({'error': str(e)}, status_code=413)
+    except Exception as e:
+        if stored_path is not None and os.path.exists(stored_path):
+            os.remove(stored_path)  # Do not leave a file behind that no Upload row refers to
+        error_msg = f"Failed to upload file: {str(e)}"
+        logger.error(error_msg)
+        return JSONResponse({'error': error_msg}, status_code=500)
+
+
+async def get_status(request):
+    ensure_directories_exist()
+    try:
+        uid = request.query_params.get('uid')
+        if not uid:
+            logger.error('UID not provided')
+            return JSONResponse({'error': 'UID not provided'}, status_code=400)
+
+        try:
+            wait = parse_wait(request.query_params.get('wait'))
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        # Taken before reading the upload, so a change right after the read still ends the wait
+        generation = status_listener.generation
+
+        async with AsyncSession() as db:
+            upload = await db.scalar(select(Upload).where(Upload.uid == uid))
+            if not upload:
+                return JSONResponse({'status': 'not found', 'filename': None, 'timestamp': "Timestamp not found",
+                                     'explanation': 'No upload exists with the given UID'}, status_code=404)
+
+            if upload.finish_time:
+                # Finished results never change, so they are served from the precompressed copy
+                stored = await read_stored_status(upload.uid)
+                if stored is not None:
+                    return send_stored_status(request, *stored)
+
+            progress = await get_progress(db, upload)
+
+        if wait > 0 and not upload.finish_time:
+            upload, progress = await wait_for_status_change(request, upload, progress, generation, wait)
+
+        if upload.finish_time:
+            output_file_path = os.path.join(OUTPUT_FOLDER, f"{upload.result_uid}.json")
+            if not os.path.exists(output_file_path):
+                return JSONResponse(status_document(upload, 'done', 'Output file not found', progress))
+            async with aiofiles.open(output_file_path, 'r') as output_file:
+                explanation = json.loads(await output_file.read())
+            logger.info(f"File explained successfully: {output_file_path}")
+            # Compressing and storing is CPU and disk work, so it runs off the event loop
+            stored = await asyncio.to_thread(
+                status_store.put, upload.uid, status_document(upload, 'done', explanation, progress))
+            return send_stored_status(request, *stored)
+
+        tag = get_status_tag(upload, progress)
+        if parse_etags(request.headers.get('if-none-match')).contains_weak(tag):
+            return Response(status_code=304, headers={'ETag': f'W/"{tag}"'})
+        return JSONResponse(status_document(upload, 'pending', None, progress), headers={'ETag': f'W/"{tag}"'})
+    except Exception as e:
+        error_msg = f"Failed to get status: {str(e)}"
+        logger.error(error_msg)
+        return JSONResponse({'error': error_msg}, status_code=500)
+
+
+async def get_bulk_status(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        uids, include_explanations = parse_bulk_status_request(data)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    async with AsyncSession() as db:
+        statuses, finished = await db.run_sync(lambda sync_db: get_bulk_statuses(sync_db, uids))
+    if include_explanations:
+        # Reading the output files is disk work, so it runs off the event loop
+        explanations = await asyncio.to_thread(
+            lambda: {uid: load_explanation(upload) for uid, upload in finished.items()})
+        for uid, explanation in explanations.items():
+            statuses[uid]['explanation'] = explanation
+    return JSONResponse({'statuses': statuses})
+
+
+async def get_history(request):
+    email = request.query_params.get('email')
+    if not email:
+        return JSONResponse({'error': 'Email is required'}, status_code=400)
+
+    try:
+        limit, cursor, status, since, until = parse_history_args(request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    async with AsyncSession() as db:
+        user_id = await db.scalar(select(User.id).where(User.email == email))
+    if user_id is None:
+        return JSONResponse({'error': 'User not found'}, status_code=404)
+
+    query = build_history_query(user_id, limit, cursor, status, since, until)
+
+    async def generate():
+        yield '{"uploads": ['
+        count = 0
+        last_upload = None
+        next_cursor = None
+        async with AsyncSession() as db:
+            result = await db.stream_scalars(query.execution_options(yield_per=HISTORY_BATCH_SIZE))
+            async for upload in result:
+                if count == limit:
+                    # The extra upload only shows that another page follows
+                    next_cursor = encode_history_cursor(last_upload)
+                    break
+                yield (', ' if count else '') + flask_app.json.dumps(history_record(upload))
+                count += 1
+                last_upload = upload
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return StreamingResponse(generate(), media_type='application/json')
+
+
+async def get_metrics(request):
+    # The queue depth gauge queries the database synchronously, so rendering runs off the event loop
+    return Response(await asyncio.to_thread(REGISTRY.render), media_type=CONTENT_TYPE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    status_listener.start()
+    logger.info("ASGI app started.")
+    yield
+    status_listener.close()
+    await async_engine.dispose()
+    logger.info("ASGI app ended.")
+
+
+app = Starlette(routes=[
+    Route('/upload', upload_file, methods=['POST']),
+    Route('/status', get_status, methods=['GET']),
+    Route('/status/bulk', get_bulk_status, methods=['POST']),
+    Route('/history', get_history, methods=['GET']),
+    Route('/metrics', get_metrics, methods=['GET']),
+], lifespan=lifespan)
@@ -0,0 +1,67 @@
+"""
+Compare the python-pptx and fast streaming slide text extractors.
+
+Usage:
+    python benchmarks/bench_extract.py [--sizes 10 100 1000] [--repeat 3] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extract_txt import extract_slide_texts_pptx, extract_slide_texts_fast  # noqa: E402
+from synthetic_decks import generate_deck  # noqa: E402
+
+DEFAULT_SIZES = [10, 50, 100, 500, 1000]
+
+
+def best_time(function, path, repeat):
+    """Run `function(path)` `repeat` times and return the fastest duration and the last result."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(sizes, repeat, words_per_slide):
+    """Benchmark both extractors on synthetic decks of each size."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for slides in sizes:
+            path = generate_deck(os.path.join(tmp_dir, f"deck_{slides}.pptx"), slides, words_per_slide)
+            pptx_seconds, pptx_texts = best_time(extract_slide_texts_pptx, path, repeat)
+            fast_seconds, fast_texts = best_time(extract_slide_texts_fast, path, repeat)
+            results.append({
+                'slides': slides,
+                'python_pptx_seconds': round(pptx_seconds, 4),
+                'fast_seconds': round(fast_seconds, 4),
+                'speedup': round(pptx_seconds / fast_seconds, 2),
+                'identical_output': pptx_texts == fast_texts,
+            })
+            row = results[-1]
+            print(f"{slides:>6} slides  python-pptx {row['python_pptx_seconds']:>8.3f}s  "
+                  f"fast {row['fast_seconds']:>8.3f}s  speedup {row['speedup']:>6.2f}x  "
+                  f"identical={row['identical_output']}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Slide counts to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per extractor; the fastest is reported')
+    parser.add_argument('--words-per-slide', type=int, default=40, help='Body text density of the synthetic slides')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    benchmark_results = run(args.sizes, args.repeat, args.words_per_slide)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(benchmark_results, output_file, indent=4)
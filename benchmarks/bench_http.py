@@ -0,0 +1,299 @@
+"""
+Compare the throughput of the Flask and ASGI front ends on /status and /history, and how
+each copes with many idle long-polling clients.
+
+Both servers are started against the same seeded SQLite database in a temporary
+directory and driven by the same keep-alive HTTP/1.1 load generator. The server commands
+are templates, so a production setup (e.g. gunicorn in front of the Flask app, or uvicorn
+with several workers) can be compared as well.
+
+Usage:
+    python benchmarks/bench_http.py [--duration 5] [--concurrency 32] [--idle-connections 1000]
+                                    [--flask-command CMD] [--asgi-command CMD] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_FOLDER)
+
+FLASK_COMMAND = ('{python} -m flask --app app run --host 127.0.0.1 --port {port} '
+                 '--with-threads --no-reload --no-debugger')
+ASGI_COMMAND = '{python} -m uvicorn asgi_app:app --host 127.0.0.1 --port {port} --log-level warning --no-access-log'
+EMAIL = 'bench@example.com'
+SEED_UPLOADS = 500
+STARTUP_TIMEOUT_SECONDS = 30
+REQUEST_TIMEOUT_SECONDS = 30
+
+
+def seed_database(folder, uploads=SEED_UPLOADS):
+    """Create the database in `folder` with one user, pending and finished uploads; returns their uids."""
+    database_url = f"sqlite:///{os.path.join(folder, 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    from sqlalchemy import insert
+    from database import Base, engine, Session, User, Upload  # Imported late so they use the benchmark database
+
+    Base.metadata.create_all(engine)
+    os.makedirs(os.path.join(folder, 'outputs'), exist_ok=True)
+    session = Session()
+    # Inserted directly, because validating the address would need a DNS lookup
+    user_id = session.execute(insert(User).values(email=EMAIL)).inserted_primary_key[0]
+    start = datetime.utcnow() - timedelta(days=1)
+    pending_uid = done_uid = None
+    for number in range(uploads):
+        done = number % 2 == 0
+        upload = Upload(filename=f"deck_{number}.pptx", status='done' if done else 'pending', user_id=user_id,
+                        upload_time=start + timedelta(seconds=number), total_slides=20,
+                        finish_time=start + timedelta(seconds=number + 1) if done else None)
+        session.add(upload)
+        session.flush()
+        if done:
+            done_uid = upload.uid
+            explanations = [{'slide': slide, 'explanation': f"Explanation of slide {slide}. " * 20}
+                            for slide in range(1, 21)]
+            with open(os.path.join(folder, 'outputs', f"{upload.uid}.json"), 'w') as output_file:
+                json.dump(explanations, output_file)
+        else:
+            pending_uid = upload.uid
+    session.commit()
+    session.close()
+    engine.dispose()
+    return database_url, pending_uid, done_uid
+
+
+class Connection:
+    """A minimal keep-alive HTTP/1.1 client connection that reconnects when the server closes it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path, headers=None):
+        """Send a GET request and read the whole response; returns (status code, body length)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        lines = [f"GET {path} HTTP/1.1", f"Host: 127.0.0.1:{self.port}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        length = 0
+        if response_headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                length += size
+                if size == 0:
+                    break
+        elif 'content-length' in response_headers:
+            length = len(await self.reader.readexactly(int(response_headers['content-length'])))
+        elif status not in (204, 304):
+            length = len(await self.reader.read())
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, length
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+    }
+
+
+async def measure_throughput(port, path, headers, concurrency, duration):
+    """Keep `concurrency` connections busy with `path` for `duration` seconds."""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        connection = Connection(port)
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = await asyncio.wait_for(connection.get(path, headers), REQUEST_TIMEOUT_SECONDS)
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    errors += 1
+                    connection.close()
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.monotonic() - started)
+
+
+async def measure_idle_connections(port, pending_uid, connections, wait, probes):
+    """
+    Park `connections` long-polling /status requests on the server and measure how fast
+    other requests are answered meanwhile, and how many of the parked requests are
+    answered normally once their wait is over.
+    """
+    async def long_poll():
+        connection = Connection(port)
+        try:
+            status, _ = await asyncio.wait_for(
+                connection.get(f"/status?uid={pending_uid}&wait={wait}"), wait + REQUEST_TIMEOUT_SECONDS)
+            return status == 200
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return False
+        finally:
+            connection.close()
+
+    started = time.monotonic()
+    parked = [asyncio.ensure_future(long_poll()) for _ in range(connections)]
+    await asyncio.sleep(min(1, wait / 4))  # Let the long polls reach the server
+
+    probe_connection = Connection(port)
+    latencies = []
+    errors = 0
+    for _ in range(probes):
+        probe_started = time.perf_counter()
+        try:
+            status, _ = await asyncio.wait_for(probe_connection.get(f"/status?uid={pending_uid}"),
+                                               REQUEST_TIMEOUT_SECONDS)
+            if status >= 400:
+                raise ValueError(status)
+            latencies.append(time.perf_counter() - probe_started)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            errors += 1
+            probe_connection.close()
+    probe_connection.close()
+
+    answered = sum(await asyncio.gather(*parked))
+    result = summarize(latencies, errors, time.monotonic() - started)
+    del result['requests_per_second']
+    result.update({'idle_connections': connections, 'answered': answered,
+                   'seconds': round(time.monotonic() - started, 2)})
+    return result
+
+
+async def wait_until_ready(port, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        connection = Connection(port)
+        try:
+            await connection.get('/status?uid=ready')
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+        finally:
+            connection.close()
+    raise RuntimeError("Server did not start in time")
+
+
+async def benchmark_server(name, command, folder, database_url, pending_uid, done_uid, args):
+    """Start a server from its command template and run every scenario against it."""
+    port = args.port
+    command = shlex.split(command.format(python=sys.executable, port=port))
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=REPO_FOLDER)
+    with open(os.path.join(folder, f"{name}.log"), 'w') as log_file:
+        process = subprocess.Popen(command, cwd=folder, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    try:
+        await wait_until_ready(port, process)
+        scenarios = {
+            'status_pending': (f"/status?uid={pending_uid}", {}),
+            'status_done_gzip': (f"/status?uid={done_uid}", {'Accept-Encoding': 'gzip'}),
+            'history_page_50': (f"/history?email={EMAIL}&limit=50", {}),
+        }
+        results = []
+        for scenario, (path, headers) in scenarios.items():
+            await measure_throughput(port, path, headers, args.concurrency, 1)  # Warm up
+            row = await measure_throughput(port, path, headers, args.concurrency, args.duration)
+            results.append({'server': name, 'scenario': scenario, 'concurrency': args.concurrency, **row})
+            print(f"{name:>6} {scenario:<18} {row['requests_per_second']:>9.1f} req/s  "
+                  f"p50 {row['p50_ms']} ms  p99 {row['p99_ms']} ms  errors {row['errors']}")
+        if args.idle_connections:
+            row = await measure_idle_connections(port, pending_uid, args.idle_connections, args.wait, args.probes)
+            results.append({'server': name, 'scenario': 'idle_long_polls', **row})
+            print(f"{name:>6} {'idle_long_polls':<18} {row['answered']}/{row['idle_connections']} answered  "
+                  f"probe p50 {row['p50_ms']} ms  p99 {row['p99_ms']} ms  errors {row['errors']}")
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def raise_open_file_limit():
+    """Idle connection tests need a file descriptor per connection on both ends."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run(args):
+    raise_open_file_limit()
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        database_url, pending_uid, done_uid = seed_database(folder)
+        for name, command in (('flask', args.flask_command), ('asgi', args.asgi_command)):
+            results += await benchmark_server(name, command, folder, database_url, pending_uid, done_uid, args)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per throughput scenario')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent keep-alive connections')
+    parser.add_argument('--idle-connections', type=int, default=1000,
+                        help='Long-polling connections held open at once; 0 skips the scenario')
+    parser.add_argument('--wait', type=float, default=10, help='Wait parameter of the long-polling requests')
+    parser.add_argument('--probes', type=int, default=50, help='Requests timed while the long polls are parked')
+    parser.add_argument('--port', type=int, default=5099, help='Port the servers are started on')
+    parser.add_argument('--flask-command', default=FLASK_COMMAND, help='Command template starting the Flask app')
+    parser.add_argument('--asgi-command', default=ASGI_COMMAND, help='Command template starting the ASGI app')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    benchmark_results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(benchmark_results, output_file, indent=4)
@@ -0,0 +1,375 @@
+"""
+End-to-end throughput benchmark of the explanation pipeline against a local OpenAI stand-in.
+
+Generates synthetic decks, starts benchmarks/mock_openai.py with the requested latency,
+jitter, share of slow requests and 429 rate, and measures four stages:
+
+- extract: slide text extraction alone (extract_txt).
+- explain: explaining every deck's slides with gpt_explainer, one deck after another, reporting
+  when each slide's first text was available (its first streamed token with --stream, otherwise
+  its whole explanation).
+- pipeline: explainer.process_presentations working through all decks queued at once,
+  reporting decks/min, slides/s and the p50/p95/p99 latency from upload to finished job.
+- fairness: one user queues a backfill of large decks while other users upload small decks
+  one after another, reporting the job latency of both groups.
+
+Every run happens in a temporary directory with its own database and explanation cache,
+so nothing is served from earlier runs.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--decks 20] [--slides 30] [--words-per-slide 40]
+                                        [--latency 0.3] [--jitter 0.1] [--error-rate 0.05]
+                                        [--slow-rate 0.02] [--slow-latency 40]
+                                        [--consumers 4] [--stream] [--ttft 0.1]
+                                        [--output pipeline_results.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import resource
+import platform
+import tempfile
+import subprocess
+import urllib.request
+from datetime import datetime
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+sys.path.insert(0, REPO_FOLDER)
+sys.path.insert(0, BENCHMARKS_FOLDER)
+
+from synthetic_decks import generate_deck  # noqa: E402
+
+STAGES = ['extract', 'explain', 'pipeline', 'fairness']
+MOCK_STARTUP_TIMEOUT_SECONDS = 10
+PIPELINE_POLL_SECONDS = 0.1
+
+
+def percentile(values, fraction):
+    """Return the `fraction` percentile of `values` (nearest rank), or None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB; extraction pool processes are not included."""
+    scale = 1024 * 1024 if platform.system() == 'Darwin' else 1024  # ru_maxrss is in bytes on macOS, KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(args):
+    """Start the mock OpenAI API in its own process so it does not compete for this process's GIL."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS_FOLDER, 'mock_openai.py'), '--port', str(port),
+         '--latency', str(args.latency), '--jitter', str(args.jitter), '--error-rate', str(args.error_rate),
+         '--completion-words', str(args.completion_words), '--ttft', str(args.ttft),
+         '--slow-rate', str(args.slow_rate), '--slow-latency', str(args.slow_latency)],
+        stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + MOCK_STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            mock_stats(port)
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The mock OpenAI server did not start")
+
+
+def mock_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def stats_delta(before, after):
+    return {key: after[key] - before[key] for key in after}
+
+
+def generate_decks(folder, args):
+    """Generate the benchmark decks, each with its own text so no slide is a cache hit."""
+    paths = []
+    for number in range(args.decks):
+        path = os.path.join(folder, f"deck_{number}.pptx")
+        paths.append(generate_deck(path, args.slides, args.words_per_slide, seed=number))
+    return paths
+
+
+def bench_extract(paths):
+    from extract_txt import extract_slide_texts
+
+    started = time.perf_counter()
+    slides = sum(len(extract_slide_texts(path)) for path in paths)
+    elapsed = time.perf_counter() - started
+    return {'stage': 'extract', 'decks': len(paths), 'slides': slides, 'seconds': round(elapsed, 3),
+            'slides_per_second': round(slides / elapsed, 1)}
+
+
+async def bench_explain(paths, port):
+    import openai
+    from extract_txt import extract_slide_texts
+    from gpt_explainer import explain_slide, SlideBatcher, MODEL
+    from model_router import ModelRouter
+    from rate_limiter import AdaptiveRateLimiter
+
+    client = openai.AsyncClient(api_key='benchmark', base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    limiter = AdaptiveRateLimiter()
+    router = ModelRouter(MODEL)
+    batcher = SlideBatcher(client, limiter, router=router)
+    deck_texts = [extract_slide_texts(path) for path in paths]
+
+    before = mock_stats(port)
+    latencies = []
+    first_texts = []
+    started = time.perf_counter()
+
+    async def explain(text, deck_started):
+        first_text = []
+
+        def on_partial(partial):
+            if not first_text:
+                first_text.append(time.perf_counter() - deck_started)
+
+        await explain_slide(client, text, limiter=limiter, batcher=batcher, on_partial=on_partial, router=router)
+        first_texts.append(first_text[0] if first_text else time.perf_counter() - deck_started)
+
+    for texts in deck_texts:
+        deck_started = time.perf_counter()
+        await asyncio.gather(*(explain(text, deck_started) for text in texts))
+        latencies.append(time.perf_counter() - deck_started)
+    elapsed = time.perf_counter() - started
+    await client.close()
+
+    slides = sum(len(texts) for texts in deck_texts)
+    return {'stage': 'explain', 'decks': len(paths), 'slides': slides, 'seconds': round(elapsed, 3),
+            'slides_per_second': round(slides / elapsed, 1),
+            'deck_p50_seconds': round(percentile(latencies, 0.5), 3),
+            'deck_p95_seconds': round(percentile(latencies, 0.95), 3),
+            'first_text_p50_seconds': round(percentile(first_texts, 0.5), 3),
+            'first_text_p95_seconds': round(percentile(first_texts, 0.95), 3),
+            'batches': batcher.stats(), 'api': stats_delta(before, mock_stats(port))}
+
+
+def queue_upload(session, path, user_id=None):
+    """Copy a deck into the uploads folder and queue it like the upload server does; returns its uid."""
+    from explainer import UPLOADS_FOLDER
+    from database import Upload
+    from notifier import notify_workers
+
+    filename = os.path.basename(path)
+    shutil.copy(path, os.path.join(UPLOADS_FOLDER, filename))
+    upload = Upload(filename=filename, status='pending', upload_time=datetime.utcnow(), user_id=user_id)
+    session.add(upload)
+    session.commit()
+    notify_workers()
+    return upload.uid
+
+
+async def run_worker(session, uids, arrivals=None):
+    """
+    Run process_presentations until every upload in `uids` is finished.
+
+    `arrivals` is an optional coroutine that queues more uploads, appending their uids to
+    `uids`, while the worker runs. Returns the elapsed seconds.
+    """
+    from explainer import process_presentations
+    from database import Upload
+
+    started = time.perf_counter()
+    worker = asyncio.create_task(process_presentations())
+    feeder = asyncio.create_task(arrivals) if arrivals else None
+    try:
+        while True:
+            await asyncio.sleep(PIPELINE_POLL_SECONDS)
+            if worker.done():
+                worker.result()  # Raises whatever ended the worker early
+            if feeder is not None and feeder.done():
+                feeder.result()
+            session.commit()  # End the read transaction so the next count sees new results
+            finished = session.query(Upload).filter(Upload.uid.in_(uids), Upload.finish_time.isnot(None)).count()
+            if (feeder is None or feeder.done()) and finished == len(uids):
+                return time.perf_counter() - started
+    finally:
+        for task in (worker, feeder):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+
+def job_latencies(uploads):
+    return [(upload.finish_time - upload.upload_time).total_seconds() for upload in uploads]
+
+
+async def bench_pipeline(paths, port):
+    """Queue every deck as an upload and let process_presentations work through them."""
+    from explainer import UPLOADS_FOLDER, OUTPUTS_FOLDER
+    from database import Session, Upload
+
+    os.makedirs(UPLOADS_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUTS_FOLDER, exist_ok=True)
+    session = Session()
+    uids = [queue_upload(session, path) for path in paths]
+
+    before = mock_stats(port)
+    elapsed = await run_worker(session, uids)
+
+    uploads = session.query(Upload).filter(Upload.uid.in_(uids)).all()
+    latencies = job_latencies(uploads)
+    slides = sum(upload.total_slides or 0 for upload in uploads)
+    failed = sum(upload.status != 'done' for upload in uploads)
+    session.close()
+    return {
+        'stage': 'pipeline', 'decks': len(uploads), 'slides': slides, 'failed': failed,
+        'seconds': round(elapsed, 3),
+        'decks_per_minute': round(len(uploads) / elapsed * 60, 1),
+        'slides_per_second': round(slides / elapsed, 1),
+        'job_p50_seconds': round(percentile(latencies, 0.5), 3),
+        'job_p95_seconds': round(percentile(latencies, 0.95), 3),
+        'job_p99_seconds': round(percentile(latencies, 0.99), 3),
+        'api': stats_delta(before, mock_stats(port)),
+    }
+
+
+async def bench_fairness(folder, port, args):
+    """
+    One user queues a bulk backfill of large decks, then other users upload small decks one
+    at a time while it is processed; reports the latency of both kinds of job.
+    """
+    from sqlalchemy import insert
+    from explainer import UPLOADS_FOLDER, OUTPUTS_FOLDER
+    from database import Session, Upload, User
+
+    os.makedirs(UPLOADS_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUTS_FOLDER, exist_ok=True)
+    session = Session()
+    # Inserted directly, because validating the addresses would need a DNS lookup
+    user_ids = [session.execute(insert(User).values(email=f"user{number}@example.com")).inserted_primary_key[0]
+                for number in range(args.interactive_decks + 1)]
+    session.commit()
+    bulk_user, interactive_users = user_ids[0], user_ids[1:]
+
+    bulk_uids = [queue_upload(session, generate_deck(os.path.join(folder, f"bulk_{number}.pptx"), args.bulk_slides,
+                                                     args.words_per_slide, seed=1000 + number), bulk_user)
+                 for number in range(args.bulk_decks)]
+    interactive_uids = []
+    uids = list(bulk_uids)
+
+    async def interactive_arrivals():
+        for number, user_id in enumerate(interactive_users):
+            await asyncio.sleep(args.interactive_interval)
+            path = generate_deck(os.path.join(folder, f"interactive_{number}.pptx"), args.interactive_slides,
+                                 args.words_per_slide, seed=2000 + number)
+            uid = queue_upload(session, path, user_id)
+            interactive_uids.append(uid)
+            uids.append(uid)
+
+    elapsed = await run_worker(session, uids, interactive_arrivals())
+
+    def summary(job_uids):
+        latencies = job_latencies(session.query(Upload).filter(Upload.uid.in_(job_uids)).all())
+        return {'jobs': len(latencies),
+                'job_p50_seconds': round(percentile(latencies, 0.5), 3),
+                'job_p95_seconds': round(percentile(latencies, 0.95), 3)}
+
+    result = {'stage': 'fairness', 'seconds': round(elapsed, 3),
+              'bulk': summary(bulk_uids), 'interactive': summary(interactive_uids)}
+    session.close()
+    return result
+
+
+def configure_environment(folder, args, port):
+    """Point the pipeline's modules at the temporary directory and the mock server before they are imported."""
+    os.chdir(folder)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(folder, 'benchmark.db')}",
+        'OPENAI_API_KEY': 'benchmark',
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{port}/v1",
+        'EXPLAINER_CONSUMERS': str(args.consumers),
+        'OPENAI_STREAM': '1' if args.stream else '0',
+    })
+    if args.extraction_workers is not None:
+        os.environ['EXTRACTION_WORKERS'] = str(args.extraction_workers)
+    from database import Base, engine
+    Base.metadata.create_all(engine)
+
+
+async def run(args):
+    mock, port = start_mock_server(args)
+    results = []
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            configure_environment(folder, args, port)
+            paths = generate_decks(folder, args)
+            for stage in args.stages:
+                if stage == 'extract':
+                    result = bench_extract(paths)
+                elif stage == 'explain':
+                    result = await bench_explain(paths, port)
+                elif stage == 'pipeline':
+                    result = await bench_pipeline(paths, port)
+                else:
+                    result = await bench_fairness(folder, port, args)
+                result['peak_rss_mb'] = peak_rss_mb()
+                results.append(result)
+                print(json.dumps(result))
+            os.chdir(cwd)
+    finally:
+        mock.terminate()
+        mock.wait()
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': vars(args),
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--decks', type=int, default=20, help='Number of synthetic decks')
+    parser.add_argument('--slides', type=int, default=30, help='Slides per deck')
+    parser.add_argument('--words-per-slide', type=int, default=40, help='Body text density of the slides')
+    parser.add_argument('--latency', type=float, default=0.3, help='Mean mock API response time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Maximum deviation from the mean in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of API requests answered with 429')
+    parser.add_argument('--slow-rate', type=float, default=0.0,
+                        help='Share of API requests answered after --slow-latency seconds')
+    parser.add_argument('--slow-latency', type=float, default=40.0, help='Response time of slow API requests')
+    parser.add_argument('--completion-words', type=int, default=120, help='Words per mock explanation')
+    parser.add_argument('--stream', action='store_true', help='Stream completions (OPENAI_STREAM=1)')
+    parser.add_argument('--ttft', type=float, default=0.1,
+                        help='Seconds until the first token of a streamed mock response')
+    parser.add_argument('--consumers', type=int, default=4, help='EXPLAINER_CONSUMERS for the pipeline stage')
+    parser.add_argument('--extraction-workers', type=int, help='EXTRACTION_WORKERS for the pipeline stage')
+    parser.add_argument('--bulk-decks', type=int, default=10, help='Decks of the bulk user in the fairness stage')
+    parser.add_argument('--bulk-slides', type=int, default=200, help='Slides per bulk deck in the fairness stage')
+    parser.add_argument('--interactive-decks', type=int, default=8,
+                        help='Small decks uploaded by other users during the fairness stage')
+    parser.add_argument('--interactive-slides', type=int, default=5, help='Slides per small deck')
+    parser.add_argument('--interactive-interval', type=float, default=1.0,
+                        help='Seconds between the small uploads of the fairness stage')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='Stages to run, in order')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    benchmark_results = asyncio.run(run(args))
+    if output_path:
+        with open(output_path, 'w') as output_file:
+            json.dump(benchmark_results, output_file, indent=4)
@@ -0,0 +1,231 @@
+"""
+A local stand-in for the OpenAI chat completions API, for benchmarks.
+
+Answers POST /v1/chat/completions after a configurable latency with jitter, stalls a
+configurable share of requests for `slow_latency` seconds to mimic the long tail of real
+completions, and rejects a configurable share of requests with 429 responses carrying a retry hint, like the real
+API does under rate limiting. JSON-mode batch prompts are answered with one explanation
+per slide, so batched and unbatched runs can be compared. Requests with "stream": true are
+answered with Server-Sent Events: the first token after `ttft` seconds and the rest spread
+evenly over the remaining response time, ending with a usage chunk.
+
+Usage:
+    python benchmarks/mock_openai.py [--port 8901] [--latency 0.5] [--jitter 0.2] [--error-rate 0.05]
+                                     [--ttft 0.1] [--slow-rate 0.02] [--slow-latency 40]
+
+Then point the OpenAI client at it with OPENAI_BASE_URL=http://127.0.0.1:8901/v1.
+GET /stats returns the number of requests, 429 responses and completion tokens served.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_COMPLETION_WORDS = 120
+DEFAULT_TTFT_SECONDS = 0.1
+STREAM_CHUNK_WORDS = 10  # Words per streamed chunk, so the server does not spend its time on tiny writes
+RETRY_AFTER_MS = 200
+WORDS = "the slide explains how the team plans to grow revenue while keeping costs and risks under control".split()
+
+
+class MockOpenAIServer:
+    """
+    OpenAI-compatible chat completions server running on a background thread.
+
+    Every request sleeps for `latency` seconds plus or minus up to `jitter` seconds;
+    with probability `error_rate` it is answered with a 429 instead.
+    """
+
+    def __init__(self, port=0, latency=0.5, jitter=0.2, error_rate=0.0, completion_words=DEFAULT_COMPLETION_WORDS,
+                 ttft=DEFAULT_TTFT_SECONDS, slow_rate=0.0, slow_latency=40.0, seed=0):
+        """
+        Args:
+            port (int): Port to listen on; 0 picks a free one.
+            latency (float): Mean response time in seconds.
+            jitter (float): Maximum deviation from the mean response time in seconds.
+            error_rate (float): Share of requests rejected with 429, between 0 and 1.
+            completion_words (int): Words per generated explanation.
+            ttft (float): Seconds until the first token of a streamed response, within its response time.
+            slow_rate (float): Share of requests answered after `slow_latency` instead, between 0 and 1.
+            slow_latency (float): Response time of the slow requests in seconds.
+            seed (int): Seed for the latency and error injection.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.completion_words = completion_words
+        self.ttft = ttft
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.completion_tokens = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'rate_limited': self.rate_limited,
+                    'completion_tokens': self.completion_tokens}
+
+    def _draw(self):
+        """Decide the fate of a request: (delay in seconds, whether to reject it)."""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            if self._rng.random() < self.slow_rate:
+                delay = self.slow_latency
+            rejected = self._rng.random() < self.error_rate
+            if rejected:
+                self.rate_limited += 1
+        return delay, rejected
+
+    def _explanation(self, number):
+        words = [WORDS[(number + index) % len(WORDS)] for index in range(self.completion_words)]
+        return f"Slide {number}: " + " ".join(words) + "."
+
+    def _answer(self, request):
+        """Build the completion text for a chat completion request."""
+        content = request['messages'][-1]['content']
+        if (request.get('response_format') or {}).get('type') == 'json_object':
+            # Batch prompts end with a JSON list of the slides; JSON escapes their line breaks
+            slides = json.loads(content[content.rindex('\n\n[') + 2:])
+            return json.dumps({'explanations': [{'id': slide['id'], 'explanation': self._explanation(slide['id'])}
+                                                for slide in slides]})
+        return self._explanation(len(content) % 100)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass  # Request logging would dominate the benchmark's output
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, request, text, delay, usage):
+                """Send the completion as chat.completion.chunk events, paced over `delay` seconds."""
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                words = text.split(' ')
+                pieces = [' '.join(words[start:start + STREAM_CHUNK_WORDS]) + ' '
+                          for start in range(0, len(words), STREAM_CHUNK_WORDS)]
+                pieces[-1] = pieces[-1].rstrip()
+                first_token = min(server.ttft, delay)
+                chunk = {'id': f"chatcmpl-mock-{server.requests}", 'object': 'chat.completion.chunk',
+                         'created': int(time.time()), 'model': request.get('model', 'mock')}
+
+                def send_event(body):
+                    self.wfile.write(b'data: ' + json.dumps({**chunk, **body}).encode() + b'\n\n')
+                    self.wfile.flush()
+
+                time.sleep(first_token)
+                for index, piece in enumerate(pieces):
+                    if index:
+                        time.sleep((delay - first_token) / max(1, len(pieces) - 1))
+                    send_event({'choices': [{'index': 0, 'finish_reason': None,
+                                             'delta': {'role': 'assistant', 'content': piece}}]})
+                send_event({'choices': [{'index': 0, 'finish_reason': 'stop', 'delta': {}}]})
+                if (request.get('stream_options') or {}).get('include_usage'):
+                    send_event({'choices': [], 'usage': usage})
+                self.wfile.write(b'data: [DONE]\n\n')
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.endswith('/chat/completions'):
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+                    return
+
+                delay, rejected = server._draw()
+                if rejected:
+                    self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                                    'code': 'rate_limit_exceeded'}},
+                                    {'retry-after-ms': str(RETRY_AFTER_MS)})
+                    return
+                text = server._answer(request)
+                prompt_tokens = sum(len(message['content']) for message in request['messages']) // 4
+                completion_tokens = len(text) // 4
+                with server._lock:
+                    server.completion_tokens += completion_tokens
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                         'total_tokens': prompt_tokens + completion_tokens}
+                if request.get('stream'):
+                    self._send_stream(request, text, delay, usage)
+                    return
+                time.sleep(delay)
+                self._send_json(200, {
+                    'id': f"chatcmpl-mock-{server.requests}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': request.get('model', 'mock'),
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': text}}],
+                    'usage': usage,
+                })
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--latency', type=float, default=0.5, help='Mean response time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Maximum deviation from the mean in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--completion-words', type=int, default=DEFAULT_COMPLETION_WORDS)
+    parser.add_argument('--ttft', type=float, default=DEFAULT_TTFT_SECONDS,
+                        help='Seconds until the first token of a streamed response')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Share of requests answered after --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=40.0, help='Response time of slow requests in seconds')
+    args = parser.parse_args()
+
+    mock = MockOpenAIServer(args.port, args.latency, args.jitter, args.error_rate, args.completion_words,
+                            args.ttft, args.slow_rate, args.slow_latency).start()
+    print(f"Mock OpenAI API listening on {mock.base_url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,67 @@
+import random
+from pptx import Presentation
+from pptx.util import Inches
+
+WORDS = (
+    "revenue growth quarter market strategy customer product roadmap pipeline forecast margin "
+    "platform launch hiring retention churn pricing segment partner region budget risk milestone "
+    "architecture latency throughput capacity migration compliance security analytics onboarding"
+).split()
+
+
+def random_sentence(rng, words):
+    """Build a sentence of `words` random words."""
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_deck(path, slides, words_per_slide=40, tables=True, groups=True, notes=True, seed=0):
+    """
+    Generate a synthetic presentation for benchmarks.
+
+    Every slide gets a title and a bulleted text box. Depending on the flags, some slides
+    also get a table, a group of text boxes and speaker notes, so that every text-bearing
+    construct the extractors handle is exercised.
+
+    Args:
+        path (str): Where to save the .pptx file.
+        slides (int): Number of slides.
+        words_per_slide (int): Approximate number of words of body text per slide.
+        tables (bool): Add a small table to every third slide.
+        groups (bool): Add a group of text boxes to every fourth slide.
+        notes (bool): Add speaker notes to every other slide.
+        seed (int): Seed for the random text.
+
+    Returns:
+        str: The path of the generated presentation.
+    """
+    rng = random.Random(seed)
+    presentation = Presentation()
+    layout = presentation.slide_layouts[5]  # Title only
+
+    for index in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = random_sentence(rng, 5)
+
+        body = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(3)).text_frame
+        bullets = max(1, words_per_slide // 10)
+        body.text = random_sentence(rng, 10)
+        for _ in range(bullets - 1):
+            body.add_paragraph().text = random_sentence(rng, 10)
+
+        if tables and index % 3 == 0:
+            table = slide.shapes.add_table(3, 3, Inches(0.5), Inches(4.5), Inches(6), Inches(1.5)).table
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = rng.choice(WORDS)
+
+        if groups and index % 4 == 0:
+            group = slide.shapes.add_group_shape()
+            for offset in range(2):
+                box = group.shapes.add_textbox(Inches(7 + offset), Inches(5), Inches(1), Inches(0.5))
+                box.text_frame.text = rng.choice(WORDS)
+
+        if notes and index % 2 == 0:
+            slide.notes_slide.notes_text_frame.text = random_sentence(rng, 15)
+
+    presentation.save(path)
+    return path
@@ -1,32 +1,44 @@
 import sys
+import json
+import time
+import argparse
+import hashlib
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Define constants
 UPLOAD_URL = 'http://localhost:5000/upload'
+UPLOAD_INIT_URL = 'http://localhost:5000/upload/init'
 STATUS_URL = 'http://localhost:5000/status'
+BULK_STATUS_URL = 'http://localhost:5000/status/bulk'
+MAX_BULK_STATUS_UIDS = 1000
+HISTORY_URL = 'http://localhost:5000/history'
+HISTORY_PAGE_SIZE = 100
 SUPPORTED_EXTENSIONS = {'.pptx'}
+CHUNK_SIZE = 4 * 1024 * 1024
+MAX_CHUNK_ATTEMPTS = 8
+REQUEST_TIMEOUT = 60
+RESUME_STATE_FILE = os.path.join(os.path.expanduser('~'), '.gpt_explainer_uploads.json')
+UPLOAD_PARALLELISM = 4
+UPLOAD_RETRIES = 3
+MANIFEST_FILENAME = 'upload_manifest.json'
+WAIT_POLL_SECONDS = 5
 
 def is_supported_file(filepath):
     """Check if the file has a supported extension."""
     _, ext = os.path.splitext(filepath)
     return ext in SUPPORTED_EXTENSIONS
 
-<<<<<<< HEAD
 def upload_file(filepath, email=None):
-    url = 'http://localhost:5000/upload'
-    try:
-        files = {'file': open(filepath, 'rb')}
-        data = {'email': email} if email else {}
-        response = requests.post(url, files=files, data=data)
-=======
-def upload_file(filepath):
     """
     Upload a file to the server and print the response.
->>>>>>> main
 
     Parameters:
     filepath (str): The path to the file to be uploaded.
+    email (str, optional): The email address to associate with the upload.
     """
     if not is_supported_file(filepath):
         print(f"Unsupported file type: {filepath}. Supported types: {SUPPORTED_EXTENSIONS}")
@@ -35,7 +47,8 @@ def upload_file(filepath):
     try:
         with open(filepath, 'rb') as file:
             files = {'file': file}
-            response = requests.post(UPLOAD_URL, files=files)
+            data = {'email': email} if email else {}
+            response = requests.post(UPLOAD_URL, files=files, data=data)
 
             if response.status_code == 200:
                 try:
@@ -55,16 +68,164 @@ def upload_file(filepath):
     except requests.exceptions.RequestException as e:
         print(f"Request error: {e}")
 
-def check_status(uid):
+def load_resume_state():
+    """Load the record of unfinished resumable uploads."""
+    try:
+        with open(RESUME_STATE_FILE, 'r') as state_file:
+            return json.load(state_file)
+    except (IOError, ValueError):
+        return {}
+
+def save_resume_state(state):
+    """Save the record of unfinished resumable uploads."""
+    with open(RESUME_STATE_FILE, 'w') as state_file:
+        json.dump(state, state_file, indent=4)
+
+def compute_sha256(filepath):
+    """Compute the SHA-256 of a file without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_upload_offset(upload_id):
+    """
+    Ask the server how many bytes of a resumable upload it has received.
+
+    Parameters:
+    upload_id (str): The id of the resumable upload.
+
+    Returns:
+    int or None: The offset to continue from, or None if the server no longer knows the upload.
+    """
+    response = requests.get(f'{UPLOAD_URL}/{upload_id}', timeout=REQUEST_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()['offset']
+
+def send_chunks(filepath, upload_id, offset, size, chunk_size):
+    """
+    Send the file from `offset` onwards, recovering from network errors and server restarts.
+
+    Returns:
+    bool: True once the server has received the whole file.
+    """
+    attempts = 0
+    with open(filepath, 'rb') as file:
+        while offset < size:
+            file.seek(offset)
+            chunk = file.read(chunk_size)
+            try:
+                response = requests.put(f'{UPLOAD_URL}/{upload_id}', params={'offset': offset}, data=chunk,
+                                        headers={'Content-Type': 'application/octet-stream'}, timeout=REQUEST_TIMEOUT)
+                if response.status_code in (200, 409):
+                    # 409 means the server is at a different offset; continue from there
+                    offset = response.json()['offset']
+                    attempts = 0
+                    print(f"Uploaded {offset}/{size} bytes", end='\r')
+                    continue
+                if response.status_code < 500:
+                    print(f"Failed to upload chunk. Status Code: {response.status_code}")
+                    print("Server Response:", response.text)
+                    return False
+                error = f"Status Code: {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                error = e
+
+            attempts += 1
+            if attempts > MAX_CHUNK_ATTEMPTS:
+                print(f"\nGiving up after {MAX_CHUNK_ATTEMPTS} attempts ({error}). Run the same command again to resume.")
+                return False
+            delay = min(30, 2 ** attempts)
+            print(f"\nChunk upload failed ({error}); retrying in {delay}s...")
+            time.sleep(delay)
+            try:
+                server_offset = get_upload_offset(upload_id)
+                if server_offset is None:
+                    print("The server no longer has this upload. Run the same command again to start over.")
+                    return False
+                offset = server_offset
+            except requests.exceptions.RequestException:
+                pass  # Keep our offset; the next PUT will be corrected with a 409 if needed
+    print()
+    return True
+
+def upload_file_resumable(filepath, email=None, chunk_size=CHUNK_SIZE):
+    """
+    Upload a file in chunks so that an interrupted upload can be resumed.
+
+    Progress is remembered in RESUME_STATE_FILE; running the command again for the
+    same, unchanged file continues from the last byte the server received.
+
+    Parameters:
+    filepath (str): The path to the file to be uploaded.
+    email (str, optional): The email address to associate with the upload.
+    chunk_size (int): The number of bytes to send per request.
+    """
+    if not is_supported_file(filepath):
+        print(f"Unsupported file type: {filepath}. Supported types: {SUPPORTED_EXTENSIONS}")
+        return
+
+    try:
+        key = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        state = load_resume_state()
+        entry = state.get(key)
+
+        upload_id = None
+        offset = 0
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            offset = get_upload_offset(entry['upload_id'])
+            if offset is not None:
+                upload_id = entry['upload_id']
+                print(f"Resuming upload {upload_id} at byte {offset}.")
+
+        if upload_id is None:
+            response = requests.post(UPLOAD_INIT_URL, timeout=REQUEST_TIMEOUT, json={
+                'filename': os.path.basename(filepath), 'email': email, 'size': stat.st_size})
+            if response.status_code != 201:
+                print(f"Failed to start upload. Status Code: {response.status_code}")
+                print("Server Response:", response.text)
+                return
+            upload_id = response.json()['upload_id']
+            offset = 0
+            state[key] = {'upload_id': upload_id, 'size': stat.st_size, 'mtime': stat.st_mtime}
+            save_resume_state(state)
+
+        if not send_chunks(filepath, upload_id, offset, stat.st_size, chunk_size):
+            return
+
+        response = requests.post(f'{UPLOAD_URL}/{upload_id}/finalize', json={'sha256': compute_sha256(filepath)},
+                                 timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            print(f"File uploaded successfully. UID: {response.json()['uid']}")
+            state = load_resume_state()
+            state.pop(key, None)
+            save_resume_state(state)
+        else:
+            print(f"Failed to finalize upload. Status Code: {response.status_code}")
+            print("Server Response:", response.text)
+    except requests.exceptions.RequestException as e:
+        print(f"Request error: {e}. Run the same command again to resume.")
+    except IOError as e:
+        print(f"Error opening file: {e}")
+
+def check_status(uid, wait=None):
     """
     Check the status of a file upload.
 
     Parameters:
     uid (str): The unique identifier of the file upload.
+    wait (float, optional): Let the server hold the request for up to this many seconds
+        until the status or progress changes, instead of answering right away.
     """
     url = f'{STATUS_URL}?uid={uid}'
+    if wait:
+        url += f'&wait={wait}'
     try:
-        response = requests.get(url)
+        response = requests.get(url, timeout=REQUEST_TIMEOUT + (wait or 0))
         if response.status_code == 200:
             try:
                 result = response.json()
@@ -83,22 +244,251 @@ def check_status(uid):
     except requests.exceptions.RequestException as e:
         print(f"Request error: {e}")
 
-def get_history(email):
-    url = f'http://localhost:5000/history?email={email}'
+def get_bulk_status(uids, include_explanations=False, http=requests):
+    """
+    Look up the status of many uploads, a thousand uids per request.
+
+    Parameters:
+    uids (list of str): The unique identifiers of the uploads.
+    include_explanations (bool): Also return the explanations of finished uploads.
+    http (requests.Session, optional): Session to send the requests with.
+
+    Returns:
+    dict: Maps each uid to its status, finish time and progress.
+    """
+    statuses = {}
+    for start in range(0, len(uids), MAX_BULK_STATUS_UIDS):
+        response = http.post(BULK_STATUS_URL, json={
+            'uids': uids[start:start + MAX_BULK_STATUS_UIDS],
+            'include_explanations': include_explanations,
+        }, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        statuses.update(response.json()['statuses'])
+    return statuses
+
+def check_bulk_status(uids, include_explanations=False):
+    """
+    Print the status and progress of many uploads.
+
+    Parameters:
+    uids (list of str): The unique identifiers of the uploads.
+    include_explanations (bool): Also print the explanations of finished uploads.
+    """
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            history = response.json()
-            for record in history:
-                print(f"UID: {record['uid']}, Filename: {record['filename']}, Status: {record['status']}, Upload Time: {record['upload_time']}, Finish Time: {record['finish_time']}, Error Message: {record['error_message']}")
-        else:
-            print(f"Failed to get history. Status Code: {response.status_code}")
+        statuses = get_bulk_status(uids, include_explanations)
+    except requests.exceptions.HTTPError as e:
+        print(f"Failed to get status. Status Code: {e.response.status_code}")
+        return
     except requests.exceptions.RequestException as e:
         print(f"Request error: {e}")
+        return
+    for uid in uids:
+        result = statuses[uid]
+        progress = result.get('progress') or {}
+        print(f"UID: {uid}, Status: {result['status']}, Progress: {progress.get('done')}/{progress.get('total')}")
+        if include_explanations and result.get('explanation') is not None:
+            print(f"Explanation: {result['explanation']}")
+
+def iter_history(email, page_size=HISTORY_PAGE_SIZE, status=None):
+    """
+    Yield the uploads of a user, newest first, fetching one page at a time.
+
+    The next page is only requested once the previous one has been consumed, so the
+    first records arrive just as fast no matter how long the history is.
+
+    Parameters:
+    email (str): The email address the uploads were made with.
+    page_size (int): Number of uploads to request per page.
+    status (str, optional): Only return uploads with this status.
+    """
+    params = {'email': email, 'limit': page_size}
+    if status:
+        params['status'] = status
+    while True:
+        response = requests.get(HISTORY_URL, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        yield from page['uploads']
+        if not page['next_cursor']:
+            return
+        params['cursor'] = page['next_cursor']
+
+def get_history(email, status=None):
+    """
+    Print the upload history of a user.
+
+    Parameters:
+    email (str): The email address the uploads were made with.
+    status (str, optional): Only show uploads with this status.
+    """
+    try:
+        for record in iter_history(email, status=status):
+            print(f"UID: {record['uid']}, Filename: {record['filename']}, Status: {record['status']}, Upload Time: {record['upload_time']}, Finish Time: {record['finish_time']}, Error Message: {record['error_message']}")
+    except requests.exceptions.HTTPError as e:
+        print(f"Failed to get history. Status Code: {e.response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Request error: {e}")
+
+def create_http_session(pool_size=UPLOAD_PARALLELISM, retries=UPLOAD_RETRIES):
+    """
+    Create a session that reuses connections and retries transient failures.
+
+    Connection errors and 429/502/503/504 responses are retried with exponential backoff,
+    honoring Retry-After. Uploads are retried too: a repeated upload of the same file is
+    recognized by its content hash on the server and shares the first upload's result.
+
+    Parameters:
+    pool_size (int): Number of connections to keep open, one per concurrent request.
+    retries (int): How many times a request is retried.
+
+    Returns:
+    requests.Session: The configured session.
+    """
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504], allowed_methods=None,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def find_supported_files(directory):
+    """Return the supported files below a directory, in a stable order."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(files) if is_supported_file(name))
+    return found
+
+def send_upload(http, filepath, email=None, priority=None):
+    """
+    Upload one file over a shared session.
+
+    Parameters:
+    http (requests.Session): The session to send the request with.
+    filepath (str): The path to the file to be uploaded.
+    email (str, optional): The email address to associate with the upload.
+    priority (int, optional): Scheduling priority; negative values let other users' uploads go first.
+
+    Returns:
+    dict: A manifest entry with the file, its uid and the duplicate it shares a result with.
+    """
+    with open(filepath, 'rb') as file:
+        data = {'email': email} if email else {}
+        if priority is not None:
+            data['priority'] = priority
+        response = http.post(UPLOAD_URL, files={'file': file}, data=data, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+    return {'file': filepath, 'uid': result['uid'], 'duplicate_of': result.get('duplicate_of')}
+
+def load_manifest(manifest_path):
+    """Load the entries of an earlier manifest, keyed by file path."""
+    try:
+        with open(manifest_path) as manifest_file:
+            return {entry['file']: entry for entry in json.load(manifest_file)}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(manifest_path, entries):
+    """Write the manifest atomically, so an interrupted run never leaves it truncated."""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(entries, manifest_file, indent=4)
+    os.replace(tmp_path, manifest_path)
+
+def upload_directory(directory, email=None, parallelism=UPLOAD_PARALLELISM, manifest_path=None, priority=None):
+    """
+    Upload every supported file below a directory concurrently and write a uid manifest.
+
+    Files that already have a uid in the manifest from an earlier run are skipped, so an
+    interrupted run can simply be repeated.
+
+    Parameters:
+    directory (str): The directory to upload.
+    email (str, optional): The email address to associate with the uploads.
+    parallelism (int): Number of uploads in flight at once.
+    manifest_path (str, optional): Where to write the manifest; defaults to upload_manifest.json in the directory.
+    priority (int, optional): Scheduling priority of the uploads, e.g. -1 for a backfill.
+
+    Returns:
+    list of dict: The manifest entries, one per file, with a uid or an error.
+    """
+    manifest_path = manifest_path or os.path.join(directory, MANIFEST_FILENAME)
+    previous = load_manifest(manifest_path)
+    files = find_supported_files(directory)
+    entries = {path: previous[path] for path in files if previous.get(path, {}).get('uid')}
+    pending = [path for path in files if path not in entries]
+    print(f"Uploading {len(pending)} file(s), {len(entries)} already uploaded.")
+
+    with create_http_session(parallelism) as http, ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {executor.submit(send_upload, http, path, email, priority): path for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                entries[path] = future.result()
+                print(f"Uploaded {path}. UID: {entries[path]['uid']}")
+            except (IOError, ValueError, requests.exceptions.RequestException) as e:
+                entries[path] = {'file': path, 'uid': None, 'error': str(e)}
+                print(f"Failed to upload {path}: {e}")
+
+    manifest = [entries[path] for path in files]
+    save_manifest(manifest_path, manifest)
+    print(f"Manifest written to {manifest_path}")
+    return manifest
+
+def wait_for_uploads(uids, poll_seconds=WAIT_POLL_SECONDS, timeout=None):
+    """
+    Wait until every upload has finished, polling all of them with one bulk request per round.
+
+    Parameters:
+    uids (list of str): The unique identifiers of the uploads.
+    poll_seconds (float): Pause between polls.
+    timeout (float, optional): Stop waiting after this many seconds, even if uploads are still pending.
+
+    Returns:
+    dict: The final status of each uid that finished in time.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    remaining = list(uids)
+    finished = {}
+    with create_http_session(1) as http:
+        while remaining:
+            statuses = get_bulk_status(remaining, http=http)
+            for uid in remaining:
+                if statuses[uid]['status'] in ('done', 'failed', 'not found'):
+                    finished[uid] = statuses[uid]
+            remaining = [uid for uid in remaining if uid not in finished]
+            print(f"{len(finished)}/{len(uids)} upload(s) finished.")
+            if not remaining:
+                break
+            if deadline is not None:
+                time_left = deadline - time.monotonic()
+                if time_left <= 0:
+                    print(f"Stopped waiting; {len(remaining)} upload(s) still pending.")
+                    break
+                time.sleep(min(poll_seconds, time_left))
+            else:
+                time.sleep(poll_seconds)
+    return finished
+
+def parse_upload_dir_args(args):
+    """Parse the arguments of the upload-dir command."""
+    parser = argparse.ArgumentParser(prog='python client.py upload-dir',
+                                     description='Upload every presentation in a directory.')
+    parser.add_argument('directory')
+    parser.add_argument('email', nargs='?')
+    parser.add_argument('--parallel', type=int, default=UPLOAD_PARALLELISM, help='Uploads in flight at once')
+    parser.add_argument('--manifest', help=f"Manifest path (default: <directory>/{MANIFEST_FILENAME})")
+    parser.add_argument('--wait', action='store_true', help='Wait until all uploads are explained')
+    parser.add_argument('--timeout', type=float, help='Stop waiting after this many seconds')
+    parser.add_argument('--priority', type=int,
+                        help='Scheduling priority from -10 to 10; use a negative one for backfills')
+    return parser.parse_args(args)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python client.py <upload|status|history> <file_path|uid|email>")
+        print("Usage: python client.py <upload|upload-resumable|upload-dir|status|status-bulk|history> <file_path|uid|email>")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -107,12 +497,29 @@ if __name__ == "__main__":
         filepath = sys.argv[2]
         email = sys.argv[3] if len(sys.argv) == 4 else None
         upload_file(filepath, email)
-    elif command == "status" and len(sys.argv) == 3:
+    elif command == "upload-resumable" and len(sys.argv) in [3, 4]:
+        filepath = sys.argv[2]
+        email = sys.argv[3] if len(sys.argv) == 4 else None
+        upload_file_resumable(filepath, email)
+    elif command == "upload-dir" and len(sys.argv) >= 3:
+        args = parse_upload_dir_args(sys.argv[2:])
+        manifest = upload_directory(args.directory, args.email, args.parallel, args.manifest, args.priority)
+        if args.wait:
+            wait_for_uploads([entry['uid'] for entry in manifest if entry.get('uid')], timeout=args.timeout)
+    elif command == "status" and len(sys.argv) in [3, 4]:
         uid = sys.argv[2]
-        check_status(uid)
-    elif command == "history" and len(sys.argv) == 3:
+        wait = float(sys.argv[3]) if len(sys.argv) == 4 else None
+        check_status(uid, wait)
+    elif command == "status-bulk" and len(sys.argv) >= 3:
+        include_explanations = "--explanations" in sys.argv[2:]
+        uids = [arg for arg in sys.argv[2:] if arg != "--explanations"]
+        if uids == ["-"]:
+            uids = [line.strip() for line in sys.stdin if line.strip()]
+        check_bulk_status(uids, include_explanations)
+    elif command == "history" and len(sys.argv) in [3, 4]:
         email = sys.argv[2]
-        get_history(email)
+        status = sys.argv[3] if len(sys.argv) == 4 else None
+        get_history(email, status)
     else:
         print("Invalid command or missing arguments.")
-        print("Usage: python client.py <upload|status|history> <file_path|uid|email>")
+        print("Usage: python client.py <upload|upload-resumable|upload-dir|status|status-bulk|history> <file_path|uid|email>")
@@ -1,15 +1,30 @@
 import os
 import uuid
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, func
+from datetime import datetime, timedelta
+from sqlalchemy import (create_engine, event, Column, Boolean, Integer, String, DateTime, ForeignKey, Index,
+                        UniqueConstraint, and_, or_, case, func, inspect, insert, text)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker, validates
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker, validates
 from email_validator import validate_email, EmailNotValidError
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# How long a worker may hold a claimed upload without renewing its lease
+DEFAULT_LEASE_SECONDS = int(os.getenv('EXPLAINER_LEASE_SECONDS', 300))
+# Slides a single user may have in processing at once before other users' uploads are claimed instead; 0 = no cap
+MAX_USER_SLIDES_IN_FLIGHT = int(os.getenv('EXPLAINER_MAX_USER_SLIDES', 0))
+
+UPLOAD_STATUSES = ['pending', 'processing', 'done', 'failed']
+
+# Log every SQL statement; only useful when debugging queries
+SQL_ECHO = os.getenv('SQL_ECHO', '0') == '1'
+# How long SQLite waits for a competing writer before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
 # Create a dedicated db folder if it doesn't exist
 def create_db_folder(folder_path='db'):
     if not os.path.exists(folder_path):
@@ -18,11 +33,24 @@ def create_db_folder(folder_path='db'):
 # Define ORM base and engine
 Base = declarative_base()
 db_path = os.path.join('db', 'database.db')
-engine = create_engine(f'sqlite:///{db_path}', echo=True)
+DATABASE_URL = os.getenv('DATABASE_URL', f'sqlite:///{db_path}')
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO, pool_pre_ping=True)
 
-# Create a new base class using the declarative_base factory function
+@event.listens_for(engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Let readers and a writer work concurrently and make writers wait for each other instead of failing."""
+    if engine.dialect.name != 'sqlite':
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+# Session creates independent sessions; session is a thread-local proxy, so every
+# Flask request thread works with its own session (removed at the end of the request)
 Session = sessionmaker(bind=engine)
-session = Session()
+session = scoped_session(Session)
 
 # Define the User class
 class User(Base):
@@ -33,11 +61,7 @@ class User(Base):
 
     @validates('email')
     def validate_email(self, key, address):
-        try:
-            v = validate_email(address)
-            return v["email"]
-        except EmailNotValidError as e:
-            raise ValueError(f"Invalid email: {e}")
+        return normalize_email(address)
 
 # Define the Upload class
 class Upload(Base):
@@ -45,22 +69,40 @@ class Upload(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     uid = Column(String, default=lambda: str(uuid.uuid4()), unique=True, nullable=False)
     filename = Column(String, nullable=False)
-    upload_time = Column(DateTime, default=func.now())
+    upload_time = Column(DateTime, default=datetime.utcnow)
+    start_time = Column(DateTime)  # When a worker claimed the upload
     finish_time = Column(DateTime)
     status = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey('Users.id'))
     user = relationship('User', back_populates='uploads')
     error_message = Column(String)
+    worker_id = Column(String)
+    lease_expires_at = Column(DateTime)
+    total_slides = Column(Integer)
+    content_hash = Column(String, index=True)
+    source_uid = Column(String)  # Set when this upload reuses the results of an identical upload
+    priority = Column(Integer, default=0)  # Higher priorities are claimed first; NULL counts as 0
+    slide_results = relationship('SlideResult', back_populates='upload', cascade='all, delete, delete-orphan',
+                                 order_by='SlideResult.slide_number')
+
+    __table_args__ = (
+        Index('ix_Uploads_status_upload_time', 'status', 'upload_time'),  # Claiming the oldest pending upload
+        Index('ix_Uploads_user_id_upload_time', 'user_id', 'upload_time'),  # A user's upload history
+        Index('ix_Uploads_user_id_start_time', 'user_id', 'start_time'),  # When a user was last served
+    )
 
     @property
     def upload_path(self):
         return os.path.join('uploads', self.uid)
 
+    @property
+    def result_uid(self):
+        return self.source_uid or self.uid
+
     @validates('status')
     def validate_status(self, key, value):
-        valid_statuses = ['pending', 'processing', 'done', 'failed']
-        if value not in valid_statuses:
-            raise ValueError(f"Invalid status: {value}. Must be one of {valid_statuses}.")
+        if value not in UPLOAD_STATUSES:
+            raise ValueError(f"Invalid status: {value}. Must be one of {UPLOAD_STATUSES}.")
         return value
 
     @validates('finish_time')
@@ -69,10 +111,443 @@ class Upload(Base):
             value = datetime.utcnow()
         return value
 
+# Define the SlideResult class
+class SlideResult(Base):
+    __tablename__ = 'SlideResults'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    upload_id = Column(Integer, ForeignKey('Uploads.id'), nullable=False)
+    slide_number = Column(Integer, nullable=False)
+    explanation = Column(String, nullable=False)
+    # The explanation is an error message; a resumed upload explains the slide again
+    failed = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=func.now())
+    upload = relationship('Upload', back_populates='slide_results')
+
+    __table_args__ = (UniqueConstraint('upload_id', 'slide_number'),)
+
+# Define the PartialExplanation class: the text generated so far for slides whose explanation is being streamed
+class PartialExplanation(Base):
+    __tablename__ = 'PartialExplanations'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    upload_id = Column(Integer, ForeignKey('Uploads.id'), nullable=False)
+    slide_number = Column(Integer, nullable=False)
+    text = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint('upload_id', 'slide_number'),)
+
+def normalize_email(address):
+    """
+    Validate an email address and return its normalized form.
+
+    Raises:
+        ValueError: If the address is not valid.
+    """
+    try:
+        v = validate_email(address)
+        return v["email"]
+    except EmailNotValidError as e:
+        raise ValueError(f"Invalid email: {e}")
+
+def get_or_create_user(session, email):
+    """
+    Return the user with the given email, creating it if it does not exist yet.
+
+    The insert ignores conflicts on the unique email, so concurrent uploads from a new
+    user cannot fail on a duplicate row.
+
+    Args:
+        session (Session): The database session to use.
+        email (str): The user's email address.
+
+    Returns:
+        User: The existing or newly created user.
+
+    Raises:
+        ValueError: If the email is not valid.
+    """
+    email = normalize_email(email)
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        session.execute(dialect_insert(User).values(email=email).on_conflict_do_nothing(index_elements=['email']))
+    else:
+        try:
+            session.execute(insert(User).values(email=email))
+        except IntegrityError:
+            session.rollback()
+    session.commit()
+    return session.query(User).filter_by(email=email).one()
+
+def _user_filter(user_id):
+    """Match the uploads of a user; None stands for anonymous uploads."""
+    return Upload.user_id.is_(None) if user_id is None else Upload.user_id == user_id
+
+def _claimable(now):
+    """Match uploads a worker may claim: pending ones, and ones whose worker let its lease expire."""
+    lease_expired = and_(Upload.status == 'processing',
+                         or_(Upload.lease_expires_at.is_(None), Upload.lease_expires_at < now))
+    return and_(Upload.source_uid.is_(None), or_(Upload.status == 'pending', lease_expired))
+
+def pick_next_user(session, pending_users, max_user_slides=MAX_USER_SLIDES_IN_FLIGHT):
+    """
+    Choose whose upload to process next, so that no user can monopolize the workers.
+
+    Users are ranked by the highest priority among their pending uploads, then by how
+    many of their slides are being processed right now, then by how long ago a worker
+    last started one of their uploads. Without priorities this is round-robin across
+    users, weighted by the size of the decks they already occupy workers with.
+
+    Args:
+        session (Session): The database session to use.
+        pending_users (dict): Maps each user id with pending uploads (None for anonymous uploads)
+            to a tuple of (highest priority, oldest upload time) of those uploads.
+        max_user_slides (int): Users with at least this many slides in processing are skipped,
+            unless they have none in processing; 0 disables the cap.
+
+    Returns:
+        The chosen user id (None for anonymous uploads), or False if every user is at the cap.
+    """
+    # Slides of uploads still being extracted are not known yet and count as one
+    in_flight = dict(session.query(Upload.user_id, func.sum(func.coalesce(Upload.total_slides, 1)))
+                     .filter(Upload.status == 'processing', Upload.lease_expires_at >= datetime.utcnow())
+                     .group_by(Upload.user_id).all())
+    user_ids = [user_id for user_id in pending_users if user_id is not None]
+    served = Upload.user_id.in_(user_ids)
+    if None in pending_users:
+        served = served | Upload.user_id.is_(None)
+    last_started = dict(session.query(Upload.user_id, func.max(Upload.start_time))
+                        .filter(served).group_by(Upload.user_id).all())
+
+    ranked = []
+    for user_id, (priority, oldest_upload) in pending_users.items():
+        slides = in_flight.get(user_id) or 0
+        if max_user_slides and 0 < max_user_slides <= slides:
+            continue
+        ranked.append(((-(priority or 0), slides, last_started.get(user_id) or datetime.min,
+                        oldest_upload or datetime.min), user_id))
+    if not ranked:
+        return False
+    return min(ranked, key=lambda entry: entry[0])[1]
+
+def claim_next_upload(session, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS,
+                      max_user_slides=MAX_USER_SLIDES_IN_FLIGHT, skip_users=()):
+    """
+    Atomically move the next pending upload to 'processing' on behalf of a worker.
+
+    Uploads whose worker's lease has expired, because the worker crashed or hung, are
+    claimed like pending ones; the new worker resumes them from their saved slide results.
+    The user is chosen fairly by pick_next_user; among a user's uploads the one with the
+    highest priority, then the oldest one, is claimed. The status change is a conditional
+    UPDATE, so when several workers race for the same row exactly one of them wins and
+    the others move on to the next candidate.
+
+    Args:
+        session (Session): The database session to use.
+        worker_id (str): Identifier of the claiming worker.
+        lease_seconds (int): How long the claim is valid before it must be renewed.
+        max_user_slides (int): Cap on the slides a user may have in processing; 0 disables it.
+        skip_users (collection): User ids (None for anonymous uploads) whose uploads are not claimed this time.
+
+    Returns:
+        Upload or None: The claimed upload, or None if nothing is pending or every user is at the cap or skipped.
+    """
+    priority = func.coalesce(Upload.priority, 0)
+    while True:
+        now = datetime.utcnow()
+        claimable = (_claimable(now),)
+        pending_users = {user_id: (highest_priority, oldest_upload) for user_id, highest_priority, oldest_upload in
+                         session.query(Upload.user_id, func.max(priority), func.min(Upload.upload_time))
+                         .filter(*claimable).group_by(Upload.user_id).all() if user_id not in skip_users}
+        user_id = pick_next_user(session, pending_users, max_user_slides) if pending_users else False
+        if user_id is False:
+            session.commit()  # End the read transaction so other writers are not held up
+            return None
+
+        candidate = session.query(Upload.id).filter(*claimable, _user_filter(user_id)) \
+            .order_by(priority.desc(), Upload.upload_time, Upload.id).first()
+        if candidate is None:
+            session.commit()  # Claimed by another worker in the meantime; start over with a fresh snapshot
+            continue
+
+        claimed = session.query(Upload).filter(Upload.id == candidate.id, *claimable).update({
+            'status': 'processing',
+            'worker_id': worker_id,
+            'start_time': now,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds),
+        }, synchronize_session=False)
+        session.commit()
+        if claimed:
+            return session.get(Upload, candidate.id)
+
+def find_upload_by_hash(session, content_hash):
+    """
+    Find an upload of identical content whose results can be shared.
+
+    Finished uploads are preferred over ones that are still pending or processing.
+    Uploads that themselves reuse another upload's results are never returned.
+
+    Args:
+        session (Session): The database session to use.
+        content_hash (str): The SHA-256 of the uploaded file.
+
+    Returns:
+        Upload or None: The matching upload, or None if there is none.
+    """
+    return session.query(Upload).filter(
+        Upload.content_hash == content_hash,
+        Upload.source_uid.is_(None),
+        Upload.status.in_(['pending', 'processing', 'done'])
+    ).order_by(case((Upload.status == 'done', 0), else_=1), Upload.upload_time.desc()).first()
+
+def sync_attached_uploads(session, source_upload):
+    """
+    Copy the final outcome of an upload to the uploads attached to it.
+
+    Args:
+        session (Session): The database session to use.
+        source_upload (Upload): The upload whose results are shared.
+    """
+    if source_upload.status not in ('done', 'failed'):
+        return
+    session.query(Upload).filter(Upload.source_uid == source_upload.uid, Upload.status == 'pending').update({
+        'status': source_upload.status,
+        'finish_time': source_upload.finish_time or datetime.utcnow(),
+        'error_message': source_upload.error_message,
+    }, synchronize_session=False)
+    session.commit()
+
+def renew_lease(session, upload_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Extend a worker's lease on an upload it is processing.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the claimed upload.
+        worker_id (str): Identifier of the worker holding the lease.
+        lease_seconds (int): New lease duration counted from now.
+
+    Returns:
+        bool: True if the worker still holds the lease.
+    """
+    renewed = session.query(Upload).filter(
+        Upload.id == upload_id, Upload.worker_id == worker_id, Upload.status == 'processing'
+    ).update({'lease_expires_at': datetime.utcnow() + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    session.commit()
+    return bool(renewed)
+
+def finish_upload(session, upload_id, worker_id, status, error_message=None):
+    """
+    Record the outcome of a claimed upload and release its lease.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the claimed upload.
+        worker_id (str): Identifier of the worker holding the lease.
+        status (str): Either 'done' or 'failed'.
+        error_message (str, optional): Why the upload failed.
+
+    Returns:
+        bool: True if the worker still held the lease and the outcome was recorded.
+    """
+    if status not in ('done', 'failed'):
+        raise ValueError(f"Invalid final status: {status}. Must be 'done' or 'failed'.")
+    finished = session.query(Upload).filter(
+        Upload.id == upload_id, Upload.worker_id == worker_id, Upload.status == 'processing'
+    ).update({
+        'status': status,
+        'finish_time': datetime.utcnow(),
+        'error_message': error_message,
+        'lease_expires_at': None,
+    }, synchronize_session=False)
+    if finished:
+        # Partial explanations are only shown while an upload is being processed
+        session.query(PartialExplanation).filter(PartialExplanation.upload_id == upload_id).delete(
+            synchronize_session=False)
+    session.commit()
+    if finished:
+        sync_attached_uploads(session, session.get(Upload, upload_id))
+    return bool(finished)
+
+def set_total_slides(session, upload_id, total_slides):
+    """
+    Record how many slides an upload has once it has been parsed.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the upload.
+        total_slides (int): The number of slides in the presentation.
+    """
+    session.query(Upload).filter(Upload.id == upload_id).update(
+        {'total_slides': total_slides}, synchronize_session=False)
+    session.commit()
+
+def save_slide_result(session, upload_id, slide_number, explanation, failed=False):
+    """
+    Persist the explanation of a single slide as soon as it is available.
+
+    If the slide already has a result, the existing one is kept.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the upload the slide belongs to.
+        slide_number (int): The 1-based position of the slide in the presentation.
+        explanation (str): The explanation of the slide, or why it could not be explained.
+        failed (bool): Whether the slide could not be explained.
+    """
+    values = dict(upload_id=upload_id, slide_number=slide_number, explanation=explanation, failed=failed)
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        # A worker that lost its lease may still save a slide the new lease holder saved already
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        session.execute(dialect_insert(SlideResult).values(**values).on_conflict_do_nothing(
+            index_elements=['upload_id', 'slide_number']))
+    else:
+        try:
+            session.execute(insert(SlideResult).values(**values))
+        except IntegrityError:
+            session.rollback()
+    session.commit()
+
+def load_slide_results(session, upload_id):
+    """
+    Load the explanations saved so far for an upload, so a resumed upload skips those slides.
+
+    Slides that failed are left out, so they are explained again.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the upload.
+
+    Returns:
+        dict: Maps slide numbers to their explanations.
+    """
+    return dict(session.query(SlideResult.slide_number, SlideResult.explanation)
+                .filter(SlideResult.upload_id == upload_id, SlideResult.failed.is_not(True)).all())
+
+def delete_failed_slide_results(session, upload_id):
+    """
+    Delete the results of the slides of an upload that could not be explained, before they are retried.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the upload.
+
+    Returns:
+        int: The number of deleted results.
+    """
+    deleted = session.query(SlideResult).filter(
+        SlideResult.upload_id == upload_id, SlideResult.failed.is_(True)
+    ).delete(synchronize_session=False)
+    session.commit()
+    return deleted
+
+def save_partial_explanations(session, partials):
+    """
+    Store the text generated so far for slides that are still being explained, in one transaction.
+
+    Args:
+        session (Session): The database session to use.
+        partials (dict): Maps (upload_id, slide_number) pairs to the text generated so far.
+    """
+    if not partials:
+        return
+    now = datetime.utcnow()
+    for upload_id, slide_number in partials:
+        session.query(PartialExplanation).filter(
+            PartialExplanation.upload_id == upload_id, PartialExplanation.slide_number == slide_number
+        ).delete(synchronize_session=False)
+    session.execute(insert(PartialExplanation), [
+        dict(upload_id=upload_id, slide_number=slide_number, text=text, updated_at=now)
+        for (upload_id, slide_number), text in partials.items()])
+    session.commit()
+
+def load_partial_explanations(session, upload_id):
+    """
+    Load the partial explanations of the slides of an upload that have no result yet.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the upload.
+
+    Returns:
+        dict: Maps slide numbers to the text generated so far.
+    """
+    explained = session.query(SlideResult.slide_number).filter(SlideResult.upload_id == upload_id)
+    return dict(session.query(PartialExplanation.slide_number, PartialExplanation.text)
+                .filter(PartialExplanation.upload_id == upload_id,
+                        PartialExplanation.slide_number.not_in(explained)).all())
+
+def count_slide_results(session, upload_id):
+    """
+    Count the slides of an upload that already have an explanation.
+
+    Args:
+        session (Session): The database session to use.
+        upload_id (int): The id of the upload.
+
+    Returns:
+        int: The number of explained slides.
+    """
+    return session.query(func.count(SlideResult.id)).filter(SlideResult.upload_id == upload_id).scalar()
+
+def count_slide_results_by_upload(session, upload_ids):
+    """
+    Count the explained slides of several uploads with a single query.
+
+    Args:
+        session (Session): The database session to use.
+        upload_ids (iterable of int): The ids of the uploads.
+
+    Returns:
+        dict: Maps each upload id to its number of explained slides.
+    """
+    upload_ids = list(upload_ids)
+    counts = dict.fromkeys(upload_ids, 0)
+    if upload_ids:
+        counts.update(session.query(SlideResult.upload_id, func.count(SlideResult.id))
+                      .filter(SlideResult.upload_id.in_(upload_ids)).group_by(SlideResult.upload_id).all())
+    return counts
+
+def count_uploads_by_status(session):
+    """
+    Count the uploads in each status with a single query.
+
+    Args:
+        session (Session): The database session to use.
+
+    Returns:
+        dict: Maps every status in UPLOAD_STATUSES to its number of uploads.
+    """
+    counts = dict.fromkeys(UPLOAD_STATUSES, 0)
+    counts.update(session.query(Upload.status, func.count(Upload.id)).group_by(Upload.status).all())
+    return counts
+
+# Add columns introduced after an existing database was created
+def upgrade_database():
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(engine.dialect)
+                    connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        if engine.dialect.name == 'sqlite' and inspector.has_table(Upload.__tablename__):
+            # Rows created with the old SQL-side default lack microseconds, which breaks the
+            # string comparison SQLite uses for keyset pagination on upload_time
+            connection.execute(text('UPDATE "Uploads" SET upload_time = upload_time || \'.000000\' '
+                                    'WHERE length(upload_time) = 19'))
+
 # Create all tables in the database
 def setup_database():
     create_db_folder()
     Base.metadata.create_all(engine)
+    upgrade_database()
     print("Database setup complete.")
 
 if __name__ == "__main__":
@@ -1,16 +1,32 @@
 import os
 import json
+import uuid
+import socket
+import time
 import asyncio
-from venv import logger
-
-from pptx import Presentation
 import logging
+import functools
 from logging.handlers import TimedRotatingFileHandler
+from datetime import datetime
+
+from concurrent.futures import ProcessPoolExecutor
+
+from extract_txt import get_slide_text, extract_slide_texts
 from dotenv import load_dotenv
 import openai
-from gpt_explainer import generate_prompt, fetch_explanation
-from database import session, Upload
-from datetime import datetime, timezone
+from gpt_explainer import explain_slide, SlideBatcher, MODEL
+from explanation_cache import ExplanationCache
+from rate_limiter import AdaptiveRateLimiter, request_owner
+from model_router import ModelRouter
+from fair_queue import FairQueue
+from notifier import WakeupListener, notify_workers, notify_status_change, FALLBACK_POLL_SECONDS
+from database import (Session, claim_next_upload, renew_lease, finish_upload, set_total_slides, save_slide_result,
+                      load_slide_results, delete_failed_slide_results, save_partial_explanations,
+                      count_uploads_by_status, DEFAULT_LEASE_SECONDS, MAX_USER_SLIDES_IN_FLIGHT)
+from metrics import (start_http_server, UPLOAD_QUEUE_DEPTH, PIPELINE_QUEUE_DEPTH, QUEUE_WAIT_SECONDS,
+                     EXTRACTION_SECONDS, JOBS_TOTAL, SLIDES_TOTAL, WORKER_METRICS_PORT, WORKER_METRICS_PORT_RANGE)
+
+logger = logging.getLogger(__name__)
 
 # Constants
 UPLOADS_FOLDER = 'uploads'
@@ -18,6 +34,19 @@ OUTPUTS_FOLDER = 'outputs'
 LOGS_FOLDER = 'logs'
 PROCESSING_LOG_FILE = os.path.join(LOGS_FOLDER, 'presentation_processing.log')
 SUPPORTED_EXTENSIONS = {'.pptx'}
+# Decks claimed and parsed at once; a deck stops counting once all of its slides are queued
+CONSUMERS = int(os.getenv('EXPLAINER_CONSUMERS', 1))
+# Slides explained at once across all decks; the rate limiter decides how many requests actually run
+PIPELINE_DISPATCHERS = int(os.getenv('EXPLAINER_PIPELINE_DISPATCHERS', 256))
+# Slides of one user, and explanations, that may wait between two stages
+PIPELINE_QUEUE_SIZE = int(os.getenv('EXPLAINER_PIPELINE_QUEUE_SIZE', 64))
+# How often the text of slides that are still being streamed (OPENAI_STREAM=1) is saved for readers
+PARTIAL_FLUSH_SECONDS = float(os.getenv('EXPLAINER_PARTIAL_FLUSH_SECONDS', 1.0))
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', os.cpu_count() or 1))
+# Database calls of the pipeline that fail (e.g. "database is locked") are retried this often,
+# waiting DATABASE_RETRY_SECONDS before the first retry and twice as long before each further one
+DATABASE_RETRY_ATTEMPTS = int(os.getenv('EXPLAINER_DATABASE_RETRY_ATTEMPTS', 5))
+DATABASE_RETRY_SECONDS = float(os.getenv('EXPLAINER_DATABASE_RETRY_SECONDS', 0.5))
 
 def configure_logging():
     """Configure logging for the application."""
@@ -47,75 +76,402 @@ def load_env_variables():
     return os.getenv('OPENAI_API_KEY')
 
 def combine_slide_text(slide):
-    """Combine text from all shapes in a slide."""
-    slide_texts = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
-    return " ".join(slide_texts).strip()
+    """Combine text from all shapes in a slide, including groups, tables and speaker notes."""
+    return get_slide_text(slide)
 
-async def process_slide(slide, client):
+async def process_slide(slide, client, cache=None, limiter=None, batcher=None, router=None):
     """Process a single slide and return its explanation."""
-    slide_text = combine_slide_text(slide)
+    explanation, _ = await process_slide_text(combine_slide_text(slide), client, cache, limiter, batcher,
+                                              router=router)
+    return explanation
+
+async def process_slide_text(slide_text, client, cache=None, limiter=None, batcher=None, on_partial=None,
+                             router=None):
+    """
+    Explain already extracted slide text, turning failures into a placeholder explanation.
+
+    Returns:
+        tuple: The explanation, and whether it is a placeholder because the slide failed.
+    """
     if slide_text:
         try:
-            prompt = generate_prompt(slide_text)
-            explanation = await fetch_explanation(client, prompt)
-            return explanation
+            explanation = await explain_slide(client, slide_text, cache, limiter, batcher, on_partial, router)
+            SLIDES_TOTAL.inc(outcome='explained')
+            return explanation, False
         except Exception as e:
+            SLIDES_TOTAL.inc(outcome='failed')
             logger.error(f"Failed to process slide: {e}")
-            return f"Failed to process slide: {e}"
-    return "No text content"
+            return f"Failed to process slide: {e}", True
+    SLIDES_TOTAL.inc(outcome='empty')
+    return "No text content", False
+
+class Deck:
+    """A claimed upload on its way through the pipeline."""
+
+    def __init__(self, upload):
+        self.id = upload.id
+        self.uid = upload.uid
+        self.user_id = upload.user_id
+        self.filename = upload.filename
+        self.explanations = []
+        self.remaining = 0  # Slides whose explanation has not been saved yet
+        self.stopped = False  # Failed, or taken over by another worker after the lease expired
+        self.heartbeat = None
+
+async def keep_lease_alive(session, upload_id, worker_id):
+    """Renew the lease on a claimed upload until cancelled or the lease is lost."""
+    while True:
+        await asyncio.sleep(DEFAULT_LEASE_SECONDS / 3)
+        try:
+            renewed = renew_lease(session, upload_id, worker_id)
+        except Exception as e:
+            # The lease outlasts a few missed renewals, so try again next time
+            session.rollback()
+            logger.warning(f"Failed to renew the lease on upload {upload_id}: {e}")
+            continue
+        if not renewed:
+            logger.warning(f"Worker {worker_id} lost its lease on upload {upload_id}.")
+            return
+
+class SlidePipeline:
+    """
+    Explains the slides of many decks in stages connected by bounded queues.
+
+    - claim: claims pending uploads while fewer than `max_decks` decks are being parsed or queued, at most
+      one of them per user, so a user's backlog never keeps other users' decks from being claimed.
+    - extract: parses claimed decks in the process pool and queues their slides, taking turns between users.
+    - dispatch: `dispatchers` tasks explain queued slides, so the slides of all decks share one pool of
+      in-flight requests and a new deck starts while the previous deck's last slides are still in flight.
+    - persist: saves each explanation as it arrives and finishes a deck once its last slide is saved.
+    - flush partials: saves the text of streamed slides that are still being generated every
+      `partial_flush_seconds`, all in one transaction, so readers can follow along.
+    """
+
+    def __init__(self, worker_id, client, cache, limiter, batcher, pool, wakeup, max_decks=CONSUMERS,
+                 dispatchers=PIPELINE_DISPATCHERS, queue_size=PIPELINE_QUEUE_SIZE,
+                 partial_flush_seconds=PARTIAL_FLUSH_SECONDS, router=None, session=None):
+        self.worker_id = worker_id
+        self.client = client
+        self.cache = cache
+        self.limiter = limiter
+        self.batcher = batcher
+        self.router = router
+        self.pool = pool
+        self.wakeup = wakeup
+        self.max_decks = max_decks
+        self.dispatchers = dispatchers
+        self.partial_flush_seconds = partial_flush_seconds
+        # The stages run on one event loop and every database call commits before the next await,
+        # so they can share a session
+        self.session = session or Session()
+        self._deck_slots = asyncio.Semaphore(max_decks)
+        self._queuing_users = set()  # Users with a claimed deck whose slides are not all queued yet
+        self._deck_queued = asyncio.Event()
+        self._claimed = asyncio.Queue(max_decks)
+        self._slides = FairQueue(queue_size)
+        self._results = asyncio.Queue(queue_size)
+        self._partials = {}  # Latest streamed text per (deck, slide number) since the last flush
+        self._partials_changed = asyncio.Event()
+        self._heartbeats = set()
+
+    def queue_depths(self):
+        """Count the items waiting between the stages, for the pipeline queue gauge."""
+        return {'claimed': self._claimed.qsize(), 'slides': len(self._slides), 'results': self._results.qsize()}
+
+    async def run(self):
+        """Run every stage until cancelled, or until one of them fails."""
+        stages = [self._claim()]
+        stages += [self._extract() for _ in range(self.max_decks)]
+        stages += [self._dispatch() for _ in range(self.dispatchers)]
+        stages.append(self._persist())
+        stages.append(self._flush_partials())
+        tasks = [asyncio.ensure_future(stage) for stage in stages]
+        try:
+            await asyncio.gather(*tasks)  # Raises as soon as a stage fails
+        finally:
+            # Stop every other stage and lease renewal before closing the session they share
+            for task in tasks + list(self._heartbeats):
+                task.cancel()
+            await asyncio.gather(*tasks, *self._heartbeats, return_exceptions=True)
+            self.session.close()
+
+    async def _with_retries(self, action, call, *args, **kwargs):
+        """
+        Run a database call on the pipeline's session, retrying it with backoff while it fails.
+
+        Args:
+            action (str): What the call does, for the log.
+            call (callable): A function of database.py taking the session as its first argument.
+            *args: Further positional arguments of `call`.
+            **kwargs: Keyword arguments of `call`.
+
+        Returns:
+            The result of `call`; the error of the last attempt is raised if every attempt fails.
+        """
+        delay = DATABASE_RETRY_SECONDS
+        for attempt in range(1, DATABASE_RETRY_ATTEMPTS + 1):
+            try:
+                return call(self.session, *args, **kwargs)
+            except Exception as e:
+                self.session.rollback()
+                if attempt >= DATABASE_RETRY_ATTEMPTS:
+                    raise
+                logger.warning(f"Failed to {action} (attempt {attempt} of {DATABASE_RETRY_ATTEMPTS}), "
+                               f"retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def _claim(self):
+        while True:
+            await self._deck_slots.acquire()
+            generation = self.wakeup.generation
+            self._deck_queued.clear()
+            try:
+                upload = await self._with_retries('claim an upload', claim_next_upload, self.worker_id,
+                                                  skip_users=self._queuing_users)
+            except Exception as e:
+                # Wait for the next wakeup or poll before trying again
+                logger.error(f"Failed to claim an upload: {e}")
+                upload = None
+            if upload is None:
+                self._deck_slots.release()
+                # Sleep until app.py announces a new upload or a skipped user's deck is queued,
+                # polling slowly as a fallback
+                waits = [asyncio.ensure_future(self.wakeup.wait(generation, FALLBACK_POLL_SECONDS)),
+                         asyncio.ensure_future(self._deck_queued.wait())]
+                try:
+                    await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for wait in waits:
+                        wait.cancel()
+                continue
+
+            if upload.upload_time:
+                QUEUE_WAIT_SECONDS.observe(max(0.0, (datetime.utcnow() - upload.upload_time).total_seconds()))
+            deck = Deck(upload)
+            self._queuing_users.add(deck.user_id)
+            deck.heartbeat = asyncio.create_task(self._keep_lease(deck))
+            self._heartbeats.add(deck.heartbeat)
+            deck.heartbeat.add_done_callback(self._heartbeats.discard)
+            await self._claimed.put(deck)
+
+    async def _keep_lease(self, deck):
+        await keep_lease_alive(self.session, deck.id, self.worker_id)
+        # Another worker has reclaimed the deck and resumes it from the saved slides
+        deck.stopped = True
+
+    async def _extract(self):
+        while True:
+            deck = await self._claimed.get()
+            try:
+                await self._extract_deck(deck)
+            except Exception as e:
+                await self._finish(deck, e)
+            finally:
+                # The deck's remaining slides are queued, so the next deck can be claimed and parsed
+                self._queuing_users.discard(deck.user_id)
+                self._deck_queued.set()
+                self._deck_slots.release()
+
+    async def _extract_deck(self, deck):
+        pptx_path = os.path.join(UPLOADS_FOLDER, deck.filename)
+        if os.path.exists(self._output_file(deck)):
+            await self._finish(deck)  # Already processed before the status was updated
+            return
+
+        logger.info(f"Processing {deck.filename}...")
+        # Parsing is CPU-bound, so it runs in the process pool while the event loop keeps serving API calls
+        started = time.perf_counter()
+        slide_texts = await asyncio.get_running_loop().run_in_executor(self.pool, extract_slide_texts, pptx_path)
+        EXTRACTION_SECONDS.observe(time.perf_counter() - started)
+        await self._with_retries(f"save the slide count of {deck.filename}", set_total_slides, deck.id,
+                                 len(slide_texts))
+        notify_status_change(deck.uid)  # Wake clients long-polling /status
+
+        # A deck reclaimed from a crashed worker only sends the slides that have no result yet,
+        # or whose earlier attempt failed
+        await self._with_retries(f"delete the failed slides of {deck.filename}", delete_failed_slide_results,
+                                 deck.id)
+        saved = await self._with_retries(f"load the saved slides of {deck.filename}", load_slide_results, deck.id)
+        deck.explanations = [saved.get(slide_number) for slide_number in range(1, len(slide_texts) + 1)]
+        deck.remaining = deck.explanations.count(None)
+        if deck.remaining < len(slide_texts):
+            SLIDES_TOTAL.inc(len(slide_texts) - deck.remaining, outcome='resumed')
+            logger.info(f"Resuming {deck.filename} with {len(slide_texts) - deck.remaining} of "
+                        f"{len(slide_texts)} slides already explained.")
+        if not deck.remaining:
+            await self._complete(deck)
+            return
+        for slide_number, slide_text in enumerate(slide_texts, start=1):
+            if deck.stopped:
+                return
+            if deck.explanations[slide_number - 1] is None:
+                await self._slides.put(deck.user_id, (deck, slide_number, slide_text))
+
+    async def _dispatch(self):
+        while True:
+            deck, slide_number, slide_text = await self._slides.get()
+            if deck.stopped:
+                continue
+            # The rate limiter shares its slots fairly between the owners of waiting requests
+            request_owner.set(deck.user_id)
+            on_partial = functools.partial(self._record_partial, deck, slide_number)
+            explanation, failed = await process_slide_text(slide_text, self.client, self.cache, self.limiter,
+                                                           self.batcher, on_partial, self.router)
+            await self._results.put((deck, slide_number, explanation, failed))
+
+    async def _persist(self):
+        while True:
+            deck, slide_number, explanation, failed = await self._results.get()
+            self._partials.pop((deck, slide_number), None)
+            if deck.stopped:
+                continue
+            try:
+                await self._with_retries(f"save slide {slide_number} of {deck.filename}", save_slide_result,
+                                         deck.id, slide_number, explanation, failed)
+            except Exception as e:
+                await self._finish(deck, e)
+                continue
+            notify_status_change(deck.uid)
+            deck.explanations[slide_number - 1] = explanation
+            deck.remaining -= 1
+            if deck.remaining == 0:
+                await self._complete(deck)
+
+    def _record_partial(self, deck, slide_number, text):
+        if not deck.stopped:
+            self._partials[(deck, slide_number)] = text
+            self._partials_changed.set()
+
+    async def _flush_partials(self):
+        while True:
+            await self._partials_changed.wait()
+            self._partials_changed.clear()
+            partials, self._partials = self._partials, {}
+            partials = {key: text for key, text in partials.items() if not key[0].stopped}
+            try:
+                save_partial_explanations(self.session, {(deck.id, slide_number): text
+                                                         for (deck, slide_number), text in partials.items()})
+            except Exception as e:
+                # Partial explanations are a preview; the final ones are saved by the persist stage
+                self.session.rollback()
+                logger.warning(f"Failed to save partial explanations: {e}")
+            else:
+                for uid in {deck.uid for deck, _ in partials}:
+                    notify_status_change(uid)  # Wake readers following the upload
+            await asyncio.sleep(self.partial_flush_seconds)
+
+    def _output_file(self, deck):
+        return os.path.join(OUTPUTS_FOLDER, f"{deck.uid}.json")
+
+    async def _complete(self, deck):
+        """Write the output file of a deck whose slides are all explained and finish it."""
+        try:
+            with open(self._output_file(deck), 'w') as f:
+                json.dump(deck.explanations, f, indent=4)
+        except Exception as e:
+            await self._finish(deck, e)
+            return
+        await self._finish(deck)
+
+    async def _finish(self, deck, error=None):
+        """Record the outcome of a deck and release its lease; never raises."""
+        status = 'done' if error is None else 'failed'
+        if error is not None:
+            deck.stopped = True
+            self.session.rollback()
+        try:
+            await self._with_retries(f"record the outcome of {deck.filename}", finish_upload, deck.id,
+                                     self.worker_id, status, None if error is None else str(error))
+        except Exception as e:
+            # Once the lease expires, a worker reclaims the deck and resumes it from the saved slides
+            deck.stopped = True
+            logger.error(f"Failed to record the outcome of {deck.filename}, leaving it to be reclaimed: {e}")
+            return
+        finally:
+            # The lease is renewed while the outcome is being retried
+            deck.heartbeat.cancel()
+        JOBS_TOTAL.inc(status=status)
+        if error is None:
+            logger.info(f"Processing {deck.filename} completed successfully.")
+        else:
+            logger.error(f"Processing {deck.filename} failed: {error}")
+        notify_status_change(deck.uid)
+        if MAX_USER_SLIDES_IN_FLIGHT:
+            notify_workers()  # Idle workers may have skipped this user's uploads because of the cap
+
+        logger.info(f"Explanation cache stats: {self.cache.stats()}")
+        logger.info(f"Rate limiter stats: {self.limiter.stats()}")
+        logger.info(f"Slide batching stats: {self.batcher.stats()}")
+        if self.router is not None:
+            logger.info(f"Model routing stats: {self.router.stats()}")
+
+def upload_queue_depth():
+    """Count the uploads in each status, for the queue depth gauge."""
+    with Session() as session:
+        return count_uploads_by_status(session)
+
+def start_metrics_server(port=WORKER_METRICS_PORT, port_range=WORKER_METRICS_PORT_RANGE):
+    """
+    Expose the worker's metrics at /metrics on the first free port from `port` on.
+
+    Several workers on one host each get their own port: the first listens on `port`,
+    the next on `port + 1` and so on, up to `port_range` ports.
+
+    Args:
+        port (int): The first port to try; 0 disables the endpoint.
+        port_range (int): How many consecutive ports to try.
+
+    Returns:
+        ThreadingHTTPServer or None: The server, or None if disabled or no port was free.
+    """
+    if not port:
+        return None
+    UPLOAD_QUEUE_DEPTH.set_function(upload_queue_depth)
+    for candidate in range(port, port + max(port_range, 1)):
+        try:
+            server = start_http_server(candidate)
+        except OSError as e:
+            error = e  # Most likely another worker on this host already uses the port
+            continue
+        logger.info(f"Serving metrics on port {candidate}.")
+        return server
+    logger.warning(f"Metrics endpoint not started, no free port in {port}-{candidate}: {error}")
+    return None
+
+def generate_worker_id():
+    """Build an identifier that is unique across processes and hosts."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
 
 async def process_presentations():
-    """Process all new presentations in the UPLOADS_FOLDER."""
+    """Process pending uploads through the slide pipeline until cancelled."""
     openai_api_key = load_env_variables()
-    client = openai.AsyncClient(api_key=openai_api_key)
-    logger.info("Slide processing script started.")
+    # Retries are handled by the shared rate limiter
+    client = openai.AsyncClient(api_key=openai_api_key, max_retries=0)
+    cache = ExplanationCache()
+    limiter = AdaptiveRateLimiter()
+    router = ModelRouter(MODEL)
+    batcher = SlideBatcher(client, limiter, router=router)
+    worker_id = generate_worker_id()
+    logger.info(f"Slide processing script started as worker {worker_id}, claiming up to {CONSUMERS} deck(s) "
+                f"at a time with {PIPELINE_DISPATCHERS} dispatchers.")
 
-<<<<<<< HEAD
-    while True:
-        pending_uploads = session.query(Upload).filter_by(status='pending').all()
-        for upload in pending_uploads:
-            pptx_path = os.path.join(UPLOADS_FOLDER, upload.filename)
-            output_file = os.path.join(OUTPUTS_FOLDER, f"{upload.uid}.json")
-=======
-    while not asyncio.get_event_loop().is_closed():
-        for filename in os.listdir(UPLOADS_FOLDER):
-            if filename.endswith('.pptx'):
-                pptx_path = os.path.join(UPLOADS_FOLDER, filename)
-                output_file = os.path.join(OUTPUTS_FOLDER, f"{os.path.splitext(filename)[0]}.json")
->>>>>>> main
-
-            if os.path.exists(output_file):
-                continue  # Skip if already processed
-
-<<<<<<< HEAD
-            logger.info(f"Processing {upload.filename}...")
-            prs = Presentation(pptx_path)
-            tasks = []
-
-            client = openai.AsyncClient(api_key=OPENAI_API_KEY)
-
-            for slide in prs.slides:
-                task = process_slide(slide, client)
-                tasks.append(task)
-=======
-                logger.info(f"Processing {filename}...")
-                presentation = Presentation(pptx_path)
-                tasks = [process_slide(slide, client) for slide in presentation.slides]
->>>>>>> main
-
-            explanations = await asyncio.gather(*tasks)
-
-            with open(output_file, 'w') as f:
-                json.dump(explanations, f, indent=4)
-
-            # Update upload status in the database
-            upload.status = 'done'
-            upload.finish_time = datetime.utcnow()
-            session.commit()
-
-            logger.info(f"Processing {upload.filename} completed successfully.")
-
-        await asyncio.sleep(10)  # Check for new uploads every 10 seconds
+    # EXTRACTION_WORKERS=0 parses in the loop's default thread pool instead of separate processes
+    pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS) if EXTRACTION_WORKERS > 0 else None
+    wakeup = WakeupListener()
+    wakeup.start()
+    metrics_server = start_metrics_server()
+    pipeline = SlidePipeline(worker_id, client, cache, limiter, batcher, pool, wakeup, router=router)
+    PIPELINE_QUEUE_DEPTH.set_function(pipeline.queue_depths)
+    try:
+        await pipeline.run()
+    finally:
+        wakeup.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
 if __name__ == '__main__':
     configure_logging()
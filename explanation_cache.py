@@ -0,0 +1,227 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+
+# Constants
+CACHE_FOLDER = 'cache'
+CACHE_DB_PATH = os.path.join(CACHE_FOLDER, 'explanations.db')
+DEFAULT_MAX_SIZE_BYTES = int(os.getenv('EXPLANATION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+DEFAULT_MAX_AGE_SECONDS = int(os.getenv('EXPLANATION_CACHE_MAX_AGE_DAYS', 30)) * 24 * 60 * 60
+EVICTION_INTERVAL = 100  # Run eviction once every N writes
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_slide_text(text):
+    """
+    Normalize slide text so that cosmetic differences do not defeat the cache.
+
+    Args:
+        text (str): The raw slide text.
+
+    Returns:
+        str: The text with unicode normalized and all whitespace runs collapsed.
+    """
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def make_cache_key(slide_text, model, system_prompt, prompt_template):
+    """
+    Build a content-addressed key for a slide explanation.
+
+    Args:
+        slide_text (str): The slide text that is being explained.
+        model (str): The model name used for the completion.
+        system_prompt (str): The system message sent with the request.
+        prompt_template (str): The user prompt template the slide text is inserted into.
+
+    Returns:
+        str: A hex digest identifying the request.
+    """
+    digest = hashlib.sha256()
+    for part in (model, system_prompt, prompt_template, normalize_slide_text(slide_text)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class ExplanationCache:
+    """
+    Persistent SQLite-backed cache of slide explanations.
+
+    Entries expire after `max_age_seconds` and the least recently used entries are
+    evicted once the stored explanations exceed `max_size_bytes`. Concurrent requests
+    for the same key are collapsed into a single in-flight fetch.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, max_size_bytes=DEFAULT_MAX_SIZE_BYTES,
+                 max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._writes = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS explanations ('
+            'key TEXT PRIMARY KEY, '
+            'explanation TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, '
+            'last_used_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS ix_explanations_last_used_at ON explanations (last_used_at)'
+        )
+        self._connection.commit()
+
+    def get(self, key):
+        """
+        Look up a cached explanation.
+
+        Args:
+            key (str): The cache key produced by `make_cache_key`.
+
+        Returns:
+            str or None: The cached explanation, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT explanation, created_at FROM explanations WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            explanation, created_at = row
+            if now - created_at > self.max_age_seconds:
+                self._connection.execute('DELETE FROM explanations WHERE key = ?', (key,))
+                self._connection.commit()
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE explanations SET last_used_at = ? WHERE key = ?', (now, key))
+            self._connection.commit()
+            self.hits += 1
+            return explanation
+
+    def set(self, key, explanation):
+        """
+        Store an explanation in the cache.
+
+        Args:
+            key (str): The cache key produced by `make_cache_key`.
+            explanation (str): The explanation to store.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO explanations (key, explanation, size, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, explanation, len(explanation.encode('utf-8')), now, now)
+            )
+            self._connection.commit()
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._evict(now)
+
+    def evict(self):
+        """Remove expired entries and trim the cache down to its size limit."""
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now):
+        cursor = self._connection.execute(
+            'DELETE FROM explanations WHERE created_at < ?', (now - self.max_age_seconds,)
+        )
+        expired = cursor.rowcount
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM explanations').fetchone()[0]
+        trimmed = 0
+        if total_size > self.max_size_bytes:
+            excess = total_size - self.max_size_bytes
+            rows = self._connection.execute(
+                'SELECT key, size FROM explanations ORDER BY last_used_at'
+            )
+            victims = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                victims.append((key,))
+                excess -= size
+            self._connection.executemany('DELETE FROM explanations WHERE key = ?', victims)
+            trimmed = len(victims)
+        self._connection.commit()
+        if expired or trimmed:
+            logger.info(f"Explanation cache evicted {expired} expired and {trimmed} least recently used entries.")
+
+    async def get_or_fetch(self, key, fetch):
+        """
+        Return the cached explanation for `key`, fetching and storing it on a miss.
+
+        Concurrent callers asking for the same key while a fetch is in flight wait
+        for that fetch instead of starting their own. If the caller running the fetch
+        is cancelled, one of the waiters takes the fetch over. Database access runs in
+        a worker thread so it does not block the event loop.
+
+        Args:
+            key (str): The cache key produced by `make_cache_key`.
+            fetch (callable): A zero-argument coroutine function producing the explanation.
+
+        Returns:
+            str: The explanation.
+        """
+        while True:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            self.coalesced += 1
+            explanation = await asyncio.shield(in_flight)
+            if explanation is not None:
+                return explanation
+            # The fetch was cancelled before it finished; retry it ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            explanation = await asyncio.to_thread(self.get, key)
+            if explanation is None:
+                explanation = await fetch()
+                await asyncio.to_thread(self.set, key, explanation)
+        except asyncio.CancelledError:
+            future.set_result(None)  # Tells the waiters to retry
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(explanation)
+        return explanation
+
+    def stats(self):
+        """
+        Report cache effectiveness.
+
+        Returns:
+            dict: Hit, miss and coalesced counts plus the number of stored entries.
+        """
+        with self._lock:
+            entries = self._connection.execute('SELECT COUNT(*) FROM explanations').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'entries': entries}
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
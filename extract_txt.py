@@ -1,4 +1,223 @@
+import os
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ElementTree
 from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+# Which extractor extract_slide_texts uses: 'python-pptx' or 'fast'
+EXTRACTOR = os.getenv('PPTX_EXTRACTOR', 'python-pptx')
+
+# XML namespaces used by the fast extractor
+NS_P = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+NS_A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+NS_R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+NOTES_SLIDE_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+
+
+def format_slide_text(shape_texts, notes_text=None):
+    """
+    Combine the texts of a slide's shapes and its speaker notes into one string.
+
+    Args:
+    - shape_texts (iterable of str): Text of each text-bearing shape, in document order.
+    - notes_text (str, optional): The slide's speaker notes.
+
+    Returns:
+    - The combined slide text; empty if the slide has no text at all.
+    """
+    slide_text = " ".join(text for text in shape_texts if text.strip()).strip()
+    if notes_text and notes_text.strip():
+        slide_text = f"{slide_text}\n\nSpeaker notes: {notes_text.strip()}".strip()
+    return slide_text
+
+
+def iter_shape_texts(shapes):
+    """
+    Yield the text of each text-bearing shape, descending into group shapes and tables.
+
+    Args:
+    - shapes: A python-pptx shape collection.
+    """
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from iter_shape_texts(shape.shapes)
+        elif getattr(shape, "has_table", False):
+            for row in shape.table.rows:
+                for cell in row.cells:
+                    yield cell.text
+        elif hasattr(shape, "text"):
+            yield shape.text
+
+
+def get_slide_text(slide):
+    """
+    Extract the text of a python-pptx slide, including group shapes, tables and speaker notes.
+
+    Args:
+    - slide: A python-pptx slide.
+
+    Returns:
+    - The combined slide text.
+    """
+    notes_text = None
+    if slide.has_notes_slide:
+        notes_placeholder = slide.notes_slide.notes_placeholder
+        if notes_placeholder is not None:
+            notes_text = notes_placeholder.text_frame.text
+    return format_slide_text(iter_shape_texts(slide.shapes), notes_text)
+
+
+def extract_slide_texts_pptx(presentation_path):
+    """
+    Extract the text of every slide using the python-pptx object model.
+
+    Args:
+    - presentation_path (str): Path to the PowerPoint presentation file.
+
+    Returns:
+    - List of strings, one per slide in presentation order (empty for slides without text).
+    """
+    presentation = Presentation(presentation_path)
+    return [get_slide_text(slide) for slide in presentation.slides]
+
+
+def _read_relationships(package, part_name):
+    """Map relationship ids to (type, part name) for the given part."""
+    directory, filename = posixpath.split(part_name)
+    rels_name = posixpath.join(directory, '_rels', f"{filename}.rels")
+    if rels_name not in package.NameToInfo:
+        return {}
+    relationships = {}
+    with package.open(rels_name) as rels_file:
+        for _, element in ElementTree.iterparse(rels_file):
+            if element.tag == NS_PKG_REL + 'Relationship' and element.get('TargetMode') != 'External':
+                target = element.get('Target')
+                if target.startswith('/'):
+                    target_name = target.lstrip('/')
+                else:
+                    target_name = posixpath.normpath(posixpath.join(directory, target))
+                relationships[element.get('Id')] = (element.get('Type'), target_name)
+    return relationships
+
+
+def _paragraph_text(paragraph):
+    """Concatenate the runs and fields of an a:p element; line breaks become vertical tabs."""
+    parts = []
+    for child in paragraph:
+        if child.tag in (NS_A + 'r', NS_A + 'fld'):
+            text_element = child.find(NS_A + 't')
+            parts.append((text_element.text or '') if text_element is not None else '')
+        elif child.tag == NS_A + 'br':
+            parts.append('\v')
+    return ''.join(parts)
+
+
+def _text_body_text(text_body):
+    """Join the paragraphs of a text body with newlines, as python-pptx does."""
+    if text_body is None:
+        return ''
+    return '\n'.join(_paragraph_text(paragraph) for paragraph in text_body.findall(NS_A + 'p'))
+
+
+def _iter_shape_tree_texts(container):
+    """
+    Yield the text of each text-bearing shape in a p:spTree or p:grpSp element.
+
+    Mirrors the python-pptx traversal: only direct shape children are considered (so
+    content inside mc:AlternateContent is ignored), groups are descended into in place
+    and table cells are yielded in row order.
+    """
+    for child in container:
+        if child.tag == NS_P + 'sp':
+            yield _text_body_text(child.find(NS_P + 'txBody'))
+        elif child.tag == NS_P + 'grpSp':
+            yield from _iter_shape_tree_texts(child)
+        elif child.tag == NS_P + 'graphicFrame':
+            for cell in child.iter(NS_A + 'tc'):
+                yield _text_body_text(cell.find(NS_A + 'txBody'))
+
+
+def _read_shape_tree(package, part_name):
+    """Parse a slide or notes part and return its p:spTree element."""
+    with package.open(part_name) as part_file:
+        root = ElementTree.parse(part_file).getroot()
+    return root.find(f'{NS_P}cSld/{NS_P}spTree')
+
+
+def _notes_text(package, notes_part):
+    """Return the text of the body placeholder of a notes slide, if it has one."""
+    shape_tree = _read_shape_tree(package, notes_part)
+    if shape_tree is None:
+        return None
+    for shape in shape_tree.findall(NS_P + 'sp'):
+        placeholder = shape.find(f'{NS_P}nvSpPr/{NS_P}nvPr/{NS_P}ph')
+        if placeholder is not None and placeholder.get('type') == 'body':
+            return _text_body_text(shape.find(NS_P + 'txBody'))
+    return None
+
+
+def extract_slide_texts_fast(presentation_path):
+    """
+    Extract the text of every slide by reading the slide XML parts straight from the zip.
+
+    Produces the same per-slide text as extract_slide_texts_pptx without building the
+    python-pptx object model. Parts are read one at a time, so memory use does not
+    grow with the number of slides.
+
+    Args:
+    - presentation_path (str): Path to the PowerPoint presentation file.
+
+    Returns:
+    - List of strings, one per slide in presentation order (empty for slides without text).
+    """
+    with zipfile.ZipFile(presentation_path) as package:
+        presentation_part = 'ppt/presentation.xml'
+        presentation_rels = _read_relationships(package, presentation_part)
+
+        slide_parts = []
+        with package.open(presentation_part) as presentation_file:
+            for _, element in ElementTree.iterparse(presentation_file):
+                if element.tag == NS_P + 'sldId':
+                    slide_parts.append(presentation_rels[element.get(NS_R + 'id')][1])
+                elif element.tag == NS_P + 'sldIdLst':
+                    break
+
+        slides_text = []
+        for slide_part in slide_parts:
+            notes_text = None
+            for rel_type, target in _read_relationships(package, slide_part).values():
+                if rel_type == NOTES_SLIDE_REL_TYPE and target in package.NameToInfo:
+                    notes_text = _notes_text(package, target)
+                    break
+            shape_tree = _read_shape_tree(package, slide_part)
+            shape_texts = _iter_shape_tree_texts(shape_tree) if shape_tree is not None else []
+            slides_text.append(format_slide_text(shape_texts, notes_text))
+        return slides_text
+
+
+EXTRACTORS = {
+    'python-pptx': extract_slide_texts_pptx,
+    'fast': extract_slide_texts_fast,
+}
+
+
+def extract_slide_texts(presentation_path, extractor=None):
+    """
+    Extract the text of every slide with the configured extractor.
+
+    Args:
+    - presentation_path (str): Path to the PowerPoint presentation file.
+    - extractor (str, optional): 'python-pptx' or 'fast'; defaults to the PPTX_EXTRACTOR setting.
+
+    Returns:
+    - List of strings, one per slide in presentation order (empty for slides without text).
+    """
+    name = extractor or EXTRACTOR
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor: {name}. Must be one of {list(EXTRACTORS)}.")
+    return EXTRACTORS[name](presentation_path)
 
 
 def extract_text_from_presentation(presentation_path):
@@ -11,24 +230,11 @@ def extract_text_from_presentation(presentation_path):
     Returns:
     - List of strings, each representing the text from a slide.
     """
-    presentation = Presentation(presentation_path)
     slides_text = []
 
-    for slide_number, slide in enumerate(presentation.slides, start=1):
-        slide_text = []
-
-        for shape_number, shape in enumerate(slide.shapes, start=1):
-            if hasattr(shape, "text"):
-                text = shape.text.strip()
-                if text:
-                    # Add slide and shape number for clarity
-                    if shape_number == 1:
-                        slide_text.append(f"Slide {slide_number}: ")
-                    slide_text.append(text)
-
+    for slide_number, slide_text in enumerate(extract_slide_texts(presentation_path), start=1):
         if slide_text:
-            # Combine all text parts into a single string
-            combined_text = " ".join(slide_text).strip()
-            slides_text.append(combined_text)
+            # Add slide number for clarity
+            slides_text.append(f"Slide {slide_number}: {slide_text}")
 
     return slides_text
@@ -0,0 +1,55 @@
+import asyncio
+from collections import deque
+
+
+class FairQueue:
+    """
+    Bounded asyncio queue that hands out items round-robin across owners.
+
+    Every owner may have up to `maxsize` items waiting. put() blocks once its owner's share
+    is full, so a producer with a large backlog is held back without blocking the producers
+    of other owners, and get() takes the oldest item of each waiting owner in turn.
+    """
+
+    def __init__(self, maxsize):
+        """
+        Args:
+            maxsize (int): Items one owner may have waiting before put() blocks.
+        """
+        self.maxsize = maxsize
+        self._items = {}  # Owner -> deque of items, in round-robin order
+        self._condition = asyncio.Condition()
+
+    def __len__(self):
+        return sum(len(items) for items in list(self._items.values()))
+
+    async def put(self, owner, item):
+        """
+        Add an item, waiting while its owner already has `maxsize` items queued.
+
+        Args:
+            owner: Whom the item belongs to, e.g. a user id.
+            item: The item to queue.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: len(self._items.get(owner, ())) < self.maxsize)
+            self._items.setdefault(owner, deque()).append(item)
+            self._condition.notify_all()
+
+    async def get(self):
+        """
+        Remove and return the next item, waiting until one is available.
+
+        Returns:
+            The oldest item of the owner whose turn it is.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._items)
+            owner, items = next(iter(self._items.items()))
+            item = items.popleft()
+            # Move the owner to the back of the rotation, or drop it once it has nothing queued
+            del self._items[owner]
+            if items:
+                self._items[owner] = items
+            self._condition.notify_all()
+            return item
@@ -1,5 +1,37 @@
+import os
+import json
+import time
 import openai
 import asyncio
+import itertools
+from types import SimpleNamespace
+from explanation_cache import make_cache_key
+from rate_limiter import request_owner
+from model_router import hedge
+from metrics import LLM_REQUEST_SECONDS, LLM_TOKENS_TOTAL, LLM_RATE_LIMITED_TOTAL, LLM_TIME_TO_FIRST_TOKEN_SECONDS
+from token_estimator import count_tokens, count_message_tokens, context_tokens, split_text, MAX_PROMPT_TOKENS
+
+MODEL = os.getenv('OPENAI_MODEL', "gpt-3.5-turbo")
+SYSTEM_PROMPT = "You are an assistant specialized in explaining presentation slides."
+PROMPT_INTRODUCTION = "Please provide a detailed explanation for the following slide content, starting with the slide number:\n\n"
+CHUNK_PROMPT_INTRODUCTION = ("The following is part {part} of {parts} of a slide that is too long to explain at once. "
+                             "Please provide a detailed explanation for this part of the slide content:\n\n")
+EXPECTED_COMPLETION_TOKENS = 500  # Budgeted against the tokens/minute limit before the real usage is known
+BATCH_PROMPT_INTRODUCTION = (
+    "Please provide a detailed explanation for each of the following presentation slides. "
+    "The slides are given as a JSON list of objects with an \"id\" and the slide \"content\". "
+    "Answer with a JSON object of the form {\"explanations\": [{\"id\": <id>, \"explanation\": \"...\"}]} "
+    "containing exactly one explanation per slide.\n\n"
+)
+
+# Small slides are packed into one request up to this many prompt tokens and slides; 1 slide disables batching
+BATCH_TOKEN_BUDGET = int(os.getenv('EXPLAINER_BATCH_TOKEN_BUDGET', 1500))
+BATCH_MAX_SLIDES = int(os.getenv('EXPLAINER_BATCH_MAX_SLIDES', 8))
+BATCH_WINDOW_SECONDS = float(os.getenv('EXPLAINER_BATCH_WINDOW_SECONDS', 0.05))
+# Stream completions token by token, so partial explanations can be shown while they are generated
+STREAM_RESPONSES = os.getenv('OPENAI_STREAM', '0') == '1'
+# Seconds an attempt may wait for its response (for streams: for each next token) before it is retried
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('OPENAI_REQUEST_TIMEOUT_SECONDS', 60))
 
 def generate_prompt(slide_content):
     """
@@ -11,45 +43,496 @@ def generate_prompt(slide_content):
     Returns:
         str: The generated prompt.
     """
-    introduction = "Please provide a detailed explanation for the following slide content, starting with the slide number:\n\n"
-    prompt = introduction + slide_content
+    prompt = PROMPT_INTRODUCTION + slide_content
     return prompt
 
-async def fetch_explanation(client, prompt):
+def generate_chunk_prompt(chunk, part, parts):
+    """
+    Generate a prompt for one part of a slide that was split into chunks.
+
+    Args:
+        chunk (str): The content of this part of the slide.
+        part (int): 1-based number of this part.
+        parts (int): Total number of parts.
+
+    Returns:
+        str: The generated prompt.
+    """
+    return CHUNK_PROMPT_INTRODUCTION.format(part=part, parts=parts) + chunk
+
+def max_prompt_tokens():
+    """Return the largest prompt that leaves room for the expected completion in the model's context."""
+    return min(MAX_PROMPT_TOKENS, context_tokens(MODEL) - EXPECTED_COMPLETION_TOKENS)
+
+def estimate_prompt_tokens(prompt):
+    """
+    Estimate the prompt tokens of a request, including the system message.
+
+    Args:
+        prompt (str): The user prompt that will be sent.
+
+    Returns:
+        int: The estimated prompt tokens.
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+    return count_message_tokens(messages, MODEL)
+
+def estimate_request_tokens(prompt):
+    """
+    Estimate the tokens a request will consume, for rate limiting.
+
+    Args:
+        prompt (str): The prompt that will be sent.
+
+    Returns:
+        int: The estimated prompt plus completion tokens.
+    """
+    return estimate_prompt_tokens(prompt) + EXPECTED_COMPLETION_TOKENS
+
+def estimate_slide_tokens(slide_content):
+    """
+    Estimate the prompt tokens a slide's content takes up.
+
+    Args:
+        slide_content (str): The content of the slide.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return count_tokens(slide_content, MODEL)
+
+async def stream_chat_completion(client, messages, model=MODEL, on_partial=None, **kwargs):
+    """
+    Request a chat completion as a stream of tokens and collect it into a whole response.
+
+    Args:
+        client (openai.AsyncOpenAI): The OpenAI client to use.
+        messages (list of dict): The chat messages to send.
+        model (str): The model to send the request to.
+        on_partial (callable, optional): Called with the text received so far after every token.
+        **kwargs: Extra arguments for the chat completions API.
+
+    Returns:
+        A response shaped like a non-streamed one, with choices[0].message.content and usage.
+    """
+    started = time.perf_counter()
+    stream = await client.chat.completions.create(
+        messages=messages,
+        model=model,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs,
+    )
+    text = ""
+    usage = None
+    try:
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage  # Sent in a last chunk without choices
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if not text:
+                LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+            text += chunk.choices[0].delta.content
+            if on_partial is not None:
+                on_partial(text)
+    finally:
+        # Closes the connection right away when the request is cancelled, e.g. as the loser of a hedge
+        await stream.close()
+    message = SimpleNamespace(role="assistant", content=text)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)], usage=usage)
+
+async def create_chat_completion(client, messages, estimated_tokens, limiter=None, stream=None, on_partial=None,
+                                 router=None, **kwargs):
+    """
+    Send a chat completion request, through the rate limiter when one is given.
+
+    Every attempt times out after REQUEST_TIMEOUT_SECONDS and is retried by the limiter.
+    With a router, every attempt goes to the model it chooses, and a request that runs
+    longer than its model usually takes is hedged with a duplicate; the first answer wins.
+
+    Args:
+        client (openai.AsyncOpenAI): The OpenAI client to use.
+        messages (list of dict): The chat messages to send.
+        estimated_tokens (int): Tokens the request is expected to consume.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the request.
+        stream (bool, optional): Whether to stream the completion; defaults to STREAM_RESPONSES.
+        on_partial (callable, optional): Called with the text received so far while streaming.
+        router (ModelRouter, optional): Chooses the model and hedging delay of the request.
+        **kwargs: Extra arguments for the chat completions API.
+
+    Returns:
+        The chat completion response.
+    """
+    if stream is None:
+        stream = STREAM_RESPONSES
+    prompt_tokens = count_message_tokens(messages, MODEL) if router is not None else 0
+    attempts = itertools.count()
+    reporting_attempt = None  # Of two hedged attempts, only one reports its text at a time
+    streamed = {}  # Latest text of every attempt that is still streaming
+    answered = False
+
+    def partial_reporter(attempt):
+        def report(text):
+            nonlocal reporting_attempt
+            if answered:
+                return
+            streamed[attempt] = text
+            # The attempt that got furthest reports, so a stalled attempt is overtaken by its hedge
+            if reporting_attempt not in streamed or len(text) > len(streamed[reporting_attempt]):
+                reporting_attempt = attempt
+            if reporting_attempt == attempt:
+                on_partial(text)
+        return report if on_partial is not None else None
+
+    def stop_reporting(attempt, succeeded):
+        # When the reporting attempt fails, the one still running takes over from its latest text
+        nonlocal reporting_attempt, answered
+        streamed.pop(attempt, None)
+        if succeeded:
+            answered = True
+        elif reporting_attempt == attempt and streamed:
+            reporting_attempt = max(streamed, key=lambda other: len(streamed[other]))
+            on_partial(streamed[reporting_attempt])
+
+    async def create_completion(model, report):
+        started = time.perf_counter()
+        try:
+            if stream:
+                # The whole stream is read inside the limiter, so the request holds its slot until the
+                # last token and errors in the middle of the stream are retried like any other
+                response = await stream_chat_completion(client, messages, model, report,
+                                                        timeout=REQUEST_TIMEOUT_SECONDS, **kwargs)
+            else:
+                response = await client.chat.completions.create(
+                    messages=messages,
+                    model=model,
+                    timeout=REQUEST_TIMEOUT_SECONDS,
+                    **kwargs,
+                )
+        except Exception as e:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome='error')
+            if getattr(e, 'status_code', None) == 429:
+                LLM_RATE_LIMITED_TOTAL.inc()
+            elif router is not None:
+                router.record_failure(model)
+            raise
+        latency = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.observe(latency, outcome='ok')
+        if router is not None:
+            router.record_success(model, latency)
+        return response
+
+    async def send(sent=None):
+        number = next(attempts)
+        report = partial_reporter(number)
+
+        async def attempt():
+            model = router.choose(prompt_tokens) if router is not None else MODEL
+            if sent is not None:
+                sent.set()
+            return await create_completion(model, report)
+
+        try:
+            if limiter is None:
+                response = await attempt()
+            else:
+                response = await limiter.run(attempt, estimated_tokens)
+        except BaseException:  # Including cancellation as the loser of a hedge
+            if report is not None:
+                stop_reporting(number, succeeded=False)
+            raise
+        if report is not None:
+            stop_reporting(number, succeeded=True)
+        return response
+
+    if router is None:
+        response = await send()
+    else:
+        response = await hedge(send, router.hedge_delay(router.choose(prompt_tokens)))
+    if response.usage is not None:
+        LLM_TOKENS_TOTAL.inc(response.usage.prompt_tokens, kind='prompt')
+        LLM_TOKENS_TOTAL.inc(response.usage.completion_tokens, kind='completion')
+        if limiter is not None:
+            limiter.record_usage(estimated_tokens, response.usage.total_tokens)
+    return response
+
+async def fetch_explanation(client, prompt, limiter=None, on_partial=None, router=None):
     """
     Fetch an explanation for a given prompt using the OpenAI API.
 
     Args:
         client (openai.AsyncOpenAI): The OpenAI client to use for fetching the explanation.
         prompt (str): The prompt to send to the OpenAI API.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the request.
+        on_partial (callable, optional): Called with the explanation generated so far while streaming.
+        router (ModelRouter, optional): Chooses the model and hedging of the request.
 
     Returns:
         str: The explanation provided by the OpenAI API.
     """
-    system_message = {"role": "system", "content": "You are an assistant specialized in explaining presentation slides."}
+    system_message = {"role": "system", "content": SYSTEM_PROMPT}
     user_message = {"role": "user", "content": prompt}
 
     messages = []
     messages.append(system_message)
     messages.append(user_message)
-    response = await client.chat.completions.create(
-        messages=messages,
-        model="gpt-3.5-turbo",
-    )
+
+    response = await create_chat_completion(client, messages, estimate_request_tokens(prompt), limiter,
+                                            on_partial=on_partial, router=router)
     explanation = response.choices[0].message.content.strip()
     return explanation
 
-async def process_all_slides(client, slides_contents):
+async def fetch_chunked_explanation(client, slide_content, limiter=None, router=None):
+    """
+    Explain a slide that is too long for one request by splitting it into chunks.
+
+    Each chunk is explained with its own request and the explanations are joined in order.
+
+    Args:
+        client (openai.AsyncOpenAI): The OpenAI client to use for fetching the explanations.
+        slide_content (str): The content of the slide.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the requests.
+        router (ModelRouter, optional): Chooses the model and hedging of the requests.
+
+    Returns:
+        str: The merged explanation for the slide.
+    """
+    # Leave room for the chunk introduction, whose part numbers take a few tokens at most
+    overhead = estimate_prompt_tokens(generate_chunk_prompt("", 999, 999))
+    chunks = split_text(slide_content, max_prompt_tokens() - overhead, MODEL)
+    tasks = [fetch_explanation(client, generate_chunk_prompt(chunk, part, len(chunks)), limiter, router=router)
+             for part, chunk in enumerate(chunks, start=1)]
+    explanations = await asyncio.gather(*tasks)
+    return "\n\n".join(explanations)
+
+def generate_batch_prompt(slide_contents):
+    """
+    Generate a prompt asking for one explanation per slide in a structured response.
+
+    Args:
+        slide_contents (list of str): The contents of the slides, in order.
+
+    Returns:
+        str: The generated prompt.
+    """
+    slides = [{"id": index, "content": content} for index, content in enumerate(slide_contents, start=1)]
+    return BATCH_PROMPT_INTRODUCTION + json.dumps(slides, ensure_ascii=False)
+
+def parse_batch_response(text, slide_count):
+    """
+    Split a structured batch response back into per-slide explanations.
+
+    Args:
+        text (str): The model's answer to a batch prompt.
+        slide_count (int): Number of slides in the batch.
+
+    Returns:
+        list of str: The explanations in slide order, or None if the answer does not
+        contain exactly one non-empty explanation per slide.
+    """
+    try:
+        items = json.loads(text)["explanations"]
+        explanations = {int(item["id"]): item["explanation"].strip() for item in items}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    if sorted(explanations) != list(range(1, slide_count + 1)) or not all(explanations.values()):
+        return None
+    return [explanations[index] for index in range(1, slide_count + 1)]
+
+async def fetch_batch_explanations(client, slide_contents, limiter=None, router=None):
+    """
+    Fetch explanations for several slides with a single chat completion.
+
+    Args:
+        client (openai.AsyncOpenAI): The OpenAI client to use for fetching the explanations.
+        slide_contents (list of str): The contents of the slides, in order.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the request.
+        router (ModelRouter, optional): Chooses the model and hedging of the request.
+
+    Returns:
+        list of str: The explanations in slide order, or None if the response could not be parsed.
+    """
+    prompt = generate_batch_prompt(slide_contents)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+    estimated_tokens = estimate_request_tokens(prompt) + EXPECTED_COMPLETION_TOKENS * (len(slide_contents) - 1)
+    response = await create_chat_completion(client, messages, estimated_tokens, limiter, router=router,
+                                            response_format={"type": "json_object"})
+    return parse_batch_response(response.choices[0].message.content or "", len(slide_contents))
+
+class SlideBatcher:
+    """
+    Packs small slides that are explained at about the same time into shared requests.
+
+    Callers await explain() per slide as usual; slides submitted within a short window
+    are sent together in one chat completion, up to a prompt token budget and a maximum
+    number of slides. Slides of different owners (see rate_limiter.request_owner) are never
+    batched together, so every batch waits only for its own owner's turn in the limiter.
+    If the structured answer cannot be split back into per-slide explanations, the slides
+    of that batch are explained one per request instead.
+    """
+
+    def __init__(self, client, limiter=None, token_budget=BATCH_TOKEN_BUDGET, max_slides=BATCH_MAX_SLIDES,
+                 window_seconds=BATCH_WINDOW_SECONDS, router=None):
+        """
+        Args:
+            client (openai.AsyncOpenAI): The OpenAI client to use for fetching explanations.
+            limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the requests.
+            token_budget (int): Maximum estimated prompt tokens of the slides in one batch.
+            max_slides (int): Maximum number of slides in one batch.
+            window_seconds (float): How long the first slide of a batch waits for others to join.
+            router (ModelRouter, optional): Chooses the model and hedging of the requests.
+        """
+        self.client = client
+        self.limiter = limiter
+        self.router = router
+        self.token_budget = token_budget
+        self.max_slides = max_slides
+        self.window_seconds = window_seconds
+        # Slides waiting to be sent, their estimated tokens and the timer that sends them, per owner
+        self._pending = {}
+        self._pending_tokens = {}
+        self._flush_handles = {}
+        self._tasks = set()
+        self.batches = 0
+        self.batched_slides = 0
+        self.fallbacks = 0
+
+    def accepts(self, slide_content):
+        """Return whether a slide is small enough to share a request with others."""
+        return self.max_slides > 1 and estimate_slide_tokens(slide_content) <= self.token_budget // 2
+
+    async def explain(self, slide_content, on_partial=None):
+        """
+        Explain a slide as part of the next batch.
+
+        Args:
+            slide_content (str): The content of the slide.
+            on_partial (callable, optional): Called with the explanation generated so far while streaming,
+                if the slide ends up in a request of its own.
+
+        Returns:
+            str: The explanation for the slide.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        owner = request_owner.get()
+        tokens = estimate_slide_tokens(slide_content)
+        if owner in self._pending and self._pending_tokens[owner] + tokens > self.token_budget:
+            self._flush(owner)
+        pending = self._pending.setdefault(owner, [])
+        pending.append((slide_content, future, on_partial))
+        self._pending_tokens[owner] = self._pending_tokens.get(owner, 0) + tokens
+        if len(pending) >= self.max_slides:
+            self._flush(owner)
+        elif owner not in self._flush_handles:
+            self._flush_handles[owner] = loop.call_later(self.window_seconds, self._flush, owner)
+        return await future
+
+    def _flush(self, owner):
+        """Send the pending slides of an owner as one batch."""
+        flush_handle = self._flush_handles.pop(owner, None)
+        if flush_handle is not None:
+            flush_handle.cancel()
+        batch = self._pending.pop(owner, [])
+        self._pending_tokens.pop(owner, None)
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        """Explain one batch and resolve the futures of its slides."""
+        contents = [content for content, _, _ in batch]
+        try:
+            if len(batch) == 1:
+                _, _, on_partial = batch[0]
+                results = [await fetch_explanation(self.client, generate_prompt(contents[0]), self.limiter,
+                                                   on_partial, self.router)]
+            else:
+                self.batches += 1
+                self.batched_slides += len(batch)
+                results = await fetch_batch_explanations(self.client, contents, self.limiter, self.router)
+                if results is None:
+                    self.fallbacks += 1
+                    results = await asyncio.gather(
+                        *(fetch_explanation(self.client, generate_prompt(content), self.limiter, router=self.router)
+                          for content in contents),
+                        return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue  # The waiting slide was cancelled
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Return how many batches were sent, the slides they held and how many fell back to single requests."""
+        return {'batches': self.batches, 'batched_slides': self.batched_slides, 'fallbacks': self.fallbacks}
+
+async def explain_slide(client, slide_content, cache=None, limiter=None, batcher=None, on_partial=None,
+                        router=None):
+    """
+    Explain a single slide, consulting the explanation cache first when one is given.
+
+    Slides too long for a single request are split into chunks that are explained
+    separately and merged, so they never fail on the model's context limit.
+
+    Args:
+        client (openai.AsyncOpenAI): The OpenAI client to use for fetching the explanation.
+        slide_content (str): The content of the slide.
+        cache (ExplanationCache, optional): Cache of previously generated explanations.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the request.
+        batcher (SlideBatcher, optional): Packs small slides into shared requests.
+        on_partial (callable, optional): Called with the explanation generated so far while streaming.
+            Slides explained in a shared batch or in chunks only report their final explanation.
+        router (ModelRouter, optional): Chooses the model and hedging of the requests; batched
+            slides use the batcher's router.
+
+    Returns:
+        str: The explanation for the slide.
+    """
+    prompt = generate_prompt(slide_content)
+    prompt_tokens = estimate_prompt_tokens(prompt)
+
+    async def fetch():
+        if batcher is not None and batcher.accepts(slide_content):
+            return await batcher.explain(slide_content, on_partial)
+        if prompt_tokens > max_prompt_tokens():
+            return await fetch_chunked_explanation(client, slide_content, limiter, router)
+        return await fetch_explanation(client, prompt, limiter, on_partial, router)
+
+    if cache is None:
+        return await fetch()
+
+    # The key deliberately holds the configured MODEL rather than the model a request went to:
+    # the router may answer with the fast or the fallback model, or either of two hedged attempts,
+    # and which one answered is only known after the fact. Their explanations are interchangeable,
+    # while changing OPENAI_MODEL still starts a fresh cache.
+    key = make_cache_key(slide_content, MODEL, SYSTEM_PROMPT, PROMPT_INTRODUCTION)
+    return await cache.get_or_fetch(key, fetch)
+
+async def process_all_slides(client, slides_contents, cache=None, limiter=None, batcher=None, router=None):
     """
     Process all slides to fetch explanations for each one using the OpenAI API.
 
     Args:
         client (openai.AsyncOpenAI): The OpenAI client to use for fetching the explanations.
         slides_contents (list of str): A list of slide contents to process.
+        cache (ExplanationCache, optional): Cache of previously generated explanations.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the requests.
+        batcher (SlideBatcher, optional): Packs small slides into shared requests.
+        router (ModelRouter, optional): Chooses the model and hedging of the requests.
 
     Returns:
         list of str: A list of explanations for each slide.
     """
-    tasks = [fetch_explanation(client, generate_prompt(content)) for content in slides_contents]
+    tasks = [explain_slide(client, content, cache, limiter, batcher, router=router) for content in slides_contents]
     explanations = await asyncio.gather(*tasks)
     return explanations
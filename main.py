@@ -5,7 +5,10 @@ from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from extract_txt import extract_text_from_presentation
 from to_json import save_to_json
-from gpt_explainer import process_all_slides
+from gpt_explainer import process_all_slides, SlideBatcher, MODEL
+from explanation_cache import ExplanationCache
+from rate_limiter import AdaptiveRateLimiter
+from model_router import ModelRouter
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -64,7 +67,8 @@ def create_openai_client(api_key):
     Returns:
         AsyncOpenAI: An instance of the AsyncOpenAI client.
     """
-    client = AsyncOpenAI(api_key=api_key)
+    # Retries are handled by the shared rate limiter
+    client = AsyncOpenAI(api_key=api_key, max_retries=0)
     logging.info("OpenAI client initialized.")
     return client
 
@@ -84,20 +88,30 @@ def extract_slide_texts(presentation_path):
     return slides_text
 
 
-async def fetch_slide_explanations(client, slide_texts):
+async def fetch_slide_explanations(client, slide_texts, cache=None, limiter=None, batcher=None, router=None):
     """
     Fetch explanations for each slide's text using the OpenAI client.
 
     Args:
         client (AsyncOpenAI): The OpenAI client to use for fetching explanations.
         slide_texts (list of str): A list of texts extracted from each slide.
+        cache (ExplanationCache, optional): Cache of previously generated explanations.
+        limiter (AdaptiveRateLimiter, optional): Shared limiter that paces and retries the requests.
+        batcher (SlideBatcher, optional): Packs small slides into shared requests.
+        router (ModelRouter, optional): Chooses the model and hedging of the requests.
 
     Returns:
         list of str: A list of explanations for each slide's text.
     """
     logging.info("Fetching explanations for slides...")
-    explanations = await process_all_slides(client, slide_texts)
+    explanations = await process_all_slides(client, slide_texts, cache, limiter, batcher, router)
     logging.info("Explanations fetched successfully.")
+    if cache is not None:
+        logging.info(f"Explanation cache stats: {cache.stats()}")
+    if batcher is not None:
+        logging.info(f"Slide batching stats: {batcher.stats()}")
+    if router is not None:
+        logging.info(f"Model routing stats: {router.stats()}")
     return explanations
 
 
@@ -146,7 +160,15 @@ async def execute_main(presentation_path):
 
         slide_texts = extract_slide_texts(presentation_path)
 
-        explanations = await fetch_slide_explanations(client, slide_texts)
+        cache = ExplanationCache()
+
+        limiter = AdaptiveRateLimiter()
+
+        router = ModelRouter(MODEL)
+
+        batcher = SlideBatcher(client, limiter, router=router)
+
+        explanations = await fetch_slide_explanations(client, slide_texts, cache, limiter, batcher, router)
 
         output_file = save_explanations(presentation_path, explanations)
 
@@ -0,0 +1,221 @@
+import os
+import math
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Constants
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# First port tried for the explainer worker's metrics endpoint; 0 disables it
+WORKER_METRICS_PORT = int(os.getenv('EXPLAINER_METRICS_PORT', 9101))
+# Further workers on the same host take the next free port, up to this many ports in total
+WORKER_METRICS_PORT_RANGE = int(os.getenv('EXPLAINER_METRICS_PORT_RANGE', 16))
+
+logger = logging.getLogger(__name__)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Registry:
+    """A set of metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return the current value of every metric as Prometheus text."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._labelset = frozenset(self.labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if labels.keys() != self._labelset:
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as a number of requests."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, either set directly or computed when the metrics are rendered."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """
+        Compute the gauge when the metrics are rendered, instead of storing a value.
+
+        Args:
+            function (callable): Returns a dict from label value (or tuple of label values) to value.
+        """
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                values = {key if isinstance(key, tuple) else (key,): value
+                          for key, value in self._function().items()}
+            except Exception as e:
+                logger.warning(f"Failed to compute {self.name}: {e}")
+                return []
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Counts observations, such as latencies, in cumulative buckets, along with their sum."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)  # The first bucket whose upper bound is >= value
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+def start_http_server(port, registry=REGISTRY, host='0.0.0.0'):
+    """
+    Serve the metrics at /metrics on a background thread.
+
+    Args:
+        port (int): Port to listen on.
+        registry (Registry): The metrics to serve.
+        host (str): Address to listen on.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the worker's log
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+# Metrics of the upload server and the explainer workers. Every process exposes its own
+# values, so dashboards aggregate them across processes with sum().
+UPLOAD_SIZE_BYTES = Histogram(
+    'upload_size_bytes', 'Size of uploaded presentations.',
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2))
+UPLOAD_QUEUE_DEPTH = Gauge('upload_queue_depth', 'Uploads in the database by status.', ['status'])
+PIPELINE_QUEUE_DEPTH = Gauge('explainer_pipeline_queue_depth', 'Items waiting between explainer pipeline stages.',
+                            ['stage'])
+QUEUE_WAIT_SECONDS = Histogram(
+    'upload_queue_wait_seconds', 'Time from upload until a worker claims the upload.',
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600))
+EXTRACTION_SECONDS = Histogram('extraction_seconds', 'Time to extract the slide texts of a deck.')
+JOBS_TOTAL = Counter('explainer_jobs_total', 'Finished uploads by final status.', ['status'])
+SLIDES_TOTAL = Counter('explainer_slides_total', 'Processed slides by outcome.', ['outcome'])
+LLM_REQUEST_SECONDS = Histogram('llm_request_seconds', 'Latency of OpenAI requests, per attempt.', ['outcome'])
+LLM_TOKENS_TOTAL = Counter('llm_tokens_total', 'Tokens used by OpenAI requests.', ['kind'])
+LLM_RETRIES_TOTAL = Counter('llm_retries_total', 'OpenAI requests retried after an error.')
+LLM_RATE_LIMITED_TOTAL = Counter('llm_rate_limited_total', 'OpenAI requests rejected with 429.')
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    'llm_time_to_first_token_seconds', 'Time until the first token of a streamed OpenAI request, per attempt.')
+LLM_HEDGED_REQUESTS_TOTAL = Counter(
+    'llm_hedged_requests_total', 'OpenAI requests duplicated after the hedging delay, by the one that won.', ['winner'])
+LLM_MODEL_FALLBACKS_TOTAL = Counter('llm_model_fallbacks_total', 'Times a model was avoided after repeated failures.',
+                                    ['model'])
@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque, defaultdict
+from metrics import LLM_HEDGED_REQUESTS_TOTAL, LLM_MODEL_FALLBACKS_TOTAL
+
+# Constants
+# Prompts of at most this many tokens go to OPENAI_FAST_MODEL, when one is set
+FAST_MODEL = os.getenv('OPENAI_FAST_MODEL') or None
+SHORT_PROMPT_TOKENS = int(os.getenv('OPENAI_SHORT_PROMPT_TOKENS', 300))
+# Requests go to OPENAI_FALLBACK_MODEL, when one is set, while their model keeps failing
+FALLBACK_MODEL = os.getenv('OPENAI_FALLBACK_MODEL') or None
+FALLBACK_AFTER_FAILURES = int(os.getenv('OPENAI_FALLBACK_AFTER_FAILURES', 3))
+FALLBACK_COOLDOWN_SECONDS = float(os.getenv('OPENAI_FALLBACK_COOLDOWN_SECONDS', 60))
+# Send a duplicate of requests still running after this quantile of the model's recent latency; 0 disables hedging
+HEDGE_QUANTILE = float(os.getenv('OPENAI_HEDGE_QUANTILE', 0.95))
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before a model's requests are hedged
+LATENCY_WINDOW = 200  # Recent latencies kept per model
+
+logger = logging.getLogger(__name__)
+
+
+async def hedge(call, delay):
+    """
+    Run `call`, and if it has not finished `delay` seconds after sending its request, run it a second time.
+
+    The first call to succeed wins and the other is cancelled. If both fail, the error of
+    the last one to fail is raised.
+
+    Args:
+        call (callable): A coroutine function performing the request. It is passed an
+            asyncio.Event to set once the request is sent, so time spent waiting for the
+            rate limiter does not count towards the delay.
+        delay (float or None): Seconds to wait before hedging; None never hedges.
+
+    Returns:
+        The result of the winning call.
+    """
+    sent = asyncio.Event()
+    tasks = [asyncio.ensure_future(call(sent))]
+    try:
+        if delay is not None:
+            sending = asyncio.ensure_future(sent.wait())
+            try:
+                await asyncio.wait([tasks[0], sending], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sending.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.append(asyncio.ensure_future(call(asyncio.Event())))
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1:
+                        LLM_HEDGED_REQUESTS_TOTAL.inc(winner='original' if task is tasks[0] else 'hedge')
+                    return task.result()
+            if not pending:
+                return task.result()  # Raises the error of the last call
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class ModelRouter:
+    """
+    Chooses the model of each request and when to hedge it.
+
+    Short prompts go to `fast_model` when one is given, everything else to `model`. Once a
+    model has failed `failure_threshold` times in a row (rate limiting aside), its requests
+    go to `fallback_model` for `cooldown_seconds`; after that the model is tried again.
+    Successful latencies are tracked per model, and requests that run longer than the
+    `hedge_quantile` of their model's recent latencies are hedged with a duplicate.
+    """
+
+    def __init__(self, model, fast_model=FAST_MODEL, short_prompt_tokens=SHORT_PROMPT_TOKENS,
+                 fallback_model=FALLBACK_MODEL, failure_threshold=FALLBACK_AFTER_FAILURES,
+                 cooldown_seconds=FALLBACK_COOLDOWN_SECONDS, hedge_quantile=HEDGE_QUANTILE,
+                 min_samples=HEDGE_MIN_SAMPLES):
+        """
+        Args:
+            model (str): The model for requests that are not routed elsewhere.
+            fast_model (str, optional): A faster or cheaper model for short prompts.
+            short_prompt_tokens (int): Largest prompt, in tokens, sent to `fast_model`.
+            fallback_model (str, optional): The model used while another one keeps failing.
+            failure_threshold (int): Consecutive failures after which a model falls back.
+            cooldown_seconds (float): How long a failing model is avoided.
+            hedge_quantile (float): Latency quantile after which requests are hedged; 0 disables hedging.
+            min_samples (int): Latencies a model needs before its requests are hedged.
+        """
+        self.model = model
+        self.fast_model = fast_model
+        self.short_prompt_tokens = short_prompt_tokens
+        self.fallback_model = fallback_model
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._failures = defaultdict(int)  # Consecutive failures per model
+        self._avoid_until = {}  # Model -> monotonic time until which it falls back
+        self.fallbacks = 0
+
+    def preferred_model(self, prompt_tokens):
+        """Return the model a prompt of `prompt_tokens` tokens is meant for, ignoring failures."""
+        if self.fast_model and prompt_tokens <= self.short_prompt_tokens:
+            return self.fast_model
+        return self.model
+
+    def choose(self, prompt_tokens):
+        """
+        Pick the model for the next attempt of a request.
+
+        Args:
+            prompt_tokens (int): The estimated prompt tokens of the request.
+
+        Returns:
+            str: The model to send the request to.
+        """
+        model = self.preferred_model(prompt_tokens)
+        if self.fallback_model and self._avoid_until.get(model, 0) > time.monotonic():
+            return self.fallback_model
+        return model
+
+    def hedge_delay(self, model):
+        """Return how long a request to `model` may run before it is hedged, or None to not hedge it."""
+        latencies = self._latencies[model]
+        if not self.hedge_quantile or not latencies or len(latencies) < self.min_samples:
+            return None
+        latencies = sorted(latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_quantile))]
+
+    def record_success(self, model, latency):
+        """
+        Record a successful request.
+
+        Args:
+            model (str): The model that answered.
+            latency (float): Duration of the request in seconds.
+        """
+        self._failures[model] = 0
+        self._latencies[model].append(latency)
+
+    def record_failure(self, model):
+        """
+        Record a failed request, falling back from the model once it failed too often in a row.
+
+        Args:
+            model (str): The model that failed.
+        """
+        self._failures[model] += 1
+        if (self.fallback_model and model != self.fallback_model
+                and self._failures[model] >= self.failure_threshold
+                and self._avoid_until.get(model, 0) <= time.monotonic()):
+            self._avoid_until[model] = time.monotonic() + self.cooldown_seconds
+            self.fallbacks += 1
+            LLM_MODEL_FALLBACKS_TOTAL.inc(model=model)
+            logger.warning(f"Model {model} failed {self._failures[model]} times in a row; "
+                           f"using {self.fallback_model} for {self.cooldown_seconds:.0f}s")
+
+    def stats(self):
+        """
+        Report the hedging delay of each model and how often a model fell back.
+
+        Returns:
+            dict: The current hedge delay per model and the number of fallbacks.
+        """
+        return {'hedge_delays': {model: self.hedge_delay(model) for model in list(self._latencies)},
+                'fallbacks': self.fallbacks}
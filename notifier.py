@@ -0,0 +1,342 @@
+import os
+import glob
+import socket
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+# Constants
+RUN_FOLDER = 'run'
+WORKER_SOCKET_PREFIX = 'explainer-'
+STATUS_SOCKET_PREFIX = 'app-'
+FALLBACK_POLL_SECONDS = int(os.getenv('EXPLAINER_POLL_SECONDS', 60))
+MAX_TRACKED_CHANGES = 10000  # Uploads whose latest change StatusListener remembers
+
+logger = logging.getLogger(__name__)
+
+
+def notifications_supported():
+    """Return True if this platform supports Unix datagram sockets."""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def _notify_sockets(run_folder, prefix, message):
+    """Send a datagram to every socket in `run_folder` whose name starts with `prefix`."""
+    if not notifications_supported():
+        return 0
+
+    notified = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        for path in glob.glob(os.path.join(run_folder, f'{prefix}*.sock')):
+            try:
+                sock.sendto(message, path)
+                notified += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody is listening any more; clean up after the dead process
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                notified += 1  # The listener's queue is full, so it has wakeups pending anyway
+            except OSError as e:
+                logger.warning(f"Failed to notify listener at {path}: {e}")
+    return notified
+
+
+def notify_workers(run_folder=RUN_FOLDER, message=b'upload'):
+    """
+    Wake up every explainer worker listening in `run_folder`.
+
+    Notification is best-effort: workers still poll as a fallback, so a lost
+    datagram only delays processing. Sockets left behind by dead workers are removed.
+
+    Args:
+        run_folder (str): Folder holding the workers' sockets.
+        message (bytes): Payload to send.
+
+    Returns:
+        int: The number of workers notified.
+    """
+    return _notify_sockets(run_folder, WORKER_SOCKET_PREFIX, message)
+
+
+def notify_status_change(upload_uid, run_folder=RUN_FOLDER):
+    """
+    Tell every server process that the status or progress of an upload changed.
+
+    Best-effort like notify_workers: long-polling clients fall back to their timeout
+    if a datagram is lost.
+
+    Args:
+        upload_uid (str): The uid of the upload that changed.
+        run_folder (str): Folder holding the server processes' sockets.
+
+    Returns:
+        int: The number of server processes notified.
+    """
+    return _notify_sockets(run_folder, STATUS_SOCKET_PREFIX, upload_uid.encode())
+
+
+class StatusListener:
+    """
+    Receives upload status notifications on a background thread, for request threads to wait on.
+
+    Every notification advances `generation`. Callers take a snapshot of it before
+    reading the current state and pass it to `wait`, so a change that happens between
+    the read and the wait is not lost.
+    """
+
+    def __init__(self, run_folder=RUN_FOLDER):
+        self.path = os.path.join(run_folder, f'{STATUS_SOCKET_PREFIX}{os.getpid()}.sock')
+        self.generation = 0
+        self._changes = OrderedDict()  # upload uid -> generation of its latest change
+        self._condition = threading.Condition()
+        self._sock = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Bind the socket and start the receiving thread; does nothing if already started."""
+        with self._condition:
+            if self._thread is not None or not notifications_supported():
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)  # Left behind by a previous process with the same pid
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self.path)
+            self._thread = threading.Thread(target=self._receive, args=(self._sock,), name='status-listener',
+                                            daemon=True)
+            self._thread.start()
+
+    def _receive(self, sock):
+        while True:
+            try:
+                message = sock.recv(1024)
+            except OSError:
+                return  # The socket was closed
+            if self._sock is not sock:
+                return  # close() shut the socket down to end the blocking recv
+            with self._condition:
+                self.generation += 1
+                uid = message.decode(errors='replace')
+                self._changes[uid] = self.generation
+                self._changes.move_to_end(uid)
+                if len(self._changes) > MAX_TRACKED_CHANGES:
+                    self._changes.popitem(last=False)
+                self._condition.notify_all()
+
+    def wait(self, upload_uid, since_generation, timeout):
+        """
+        Wait for a change of an upload newer than `since_generation`.
+
+        Args:
+            upload_uid (str): The uid of the upload to wait for.
+            since_generation (int): The value of `generation` seen before reading the upload's state.
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the upload changed, False if the timeout expired or the listener is not running.
+        """
+        if not self.running:
+            return False
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._changes.get(upload_uid, 0) > since_generation, timeout)
+
+    def close(self):
+        """Stop listening and remove the socket file."""
+        with self._condition:
+            if self._sock is None:
+                return
+            sock, self._sock, self._thread = self._sock, None, None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)  # Wakes the receiving thread, which close() alone would not
+        except OSError:
+            pass
+        sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class AsyncStatusListener:
+    """
+    Receives upload status notifications on the running event loop, for coroutines to wait on.
+
+    The asyncio counterpart of StatusListener: waiting costs a future rather than a
+    thread, so thousands of clients can long-poll at once. Only the waiters of the
+    upload named in a notification are woken.
+    """
+
+    def __init__(self, run_folder=RUN_FOLDER):
+        self.path = os.path.join(run_folder, f'{STATUS_SOCKET_PREFIX}{os.getpid()}.sock')
+        self.generation = 0
+        self._changes = OrderedDict()  # upload uid -> generation of its latest change
+        self._waiters = {}  # upload uid -> futures of the coroutines waiting for it
+        self._sock = None
+
+    @property
+    def running(self):
+        return self._sock is not None
+
+    def start(self):
+        """Bind the socket and start receiving notifications on the running event loop."""
+        if self._sock is not None or not notifications_supported():
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left behind by a previous process with the same pid
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self.path)
+        try:
+            asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+        except NotImplementedError:
+            logger.info("Event loop cannot watch sockets; long-polling requests will wait for their timeout.")
+            self.close()
+
+    def _on_readable(self):
+        while True:
+            try:
+                message = self._sock.recv(1024)
+            except (BlockingIOError, InterruptedError):
+                break
+            self.generation += 1
+            uid = message.decode(errors='replace')
+            self._changes[uid] = self.generation
+            self._changes.move_to_end(uid)
+            if len(self._changes) > MAX_TRACKED_CHANGES:
+                self._changes.popitem(last=False)
+            for future in self._waiters.pop(uid, ()):
+                if not future.done():
+                    future.set_result(True)
+
+    async def wait(self, upload_uid, since_generation, timeout):
+        """
+        Wait for a change of an upload newer than `since_generation`.
+
+        Args:
+            upload_uid (str): The uid of the upload to wait for.
+            since_generation (int): The value of `generation` seen before reading the upload's state.
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the upload changed, False if the timeout expired or the listener is not running.
+        """
+        if self._changes.get(upload_uid, 0) > since_generation:
+            return True
+        if not self.running:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(upload_uid, set())
+        waiters.add(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters.discard(future)
+            if not waiters and self._waiters.get(upload_uid) is waiters:
+                del self._waiters[upload_uid]
+
+    def close(self):
+        """Stop listening and remove the socket file."""
+        if self._sock is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        except (RuntimeError, NotImplementedError):
+            pass
+        self._sock.close()
+        self._sock = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class WakeupListener:
+    """
+    Receives worker notifications on a per-process Unix datagram socket.
+
+    Callers take a snapshot of `generation` before checking for work and pass it to
+    `wait`, so a notification that arrives between the check and the wait is not lost.
+    """
+
+    def __init__(self, run_folder=RUN_FOLDER):
+        self.path = os.path.join(run_folder, f'{WORKER_SOCKET_PREFIX}{os.getpid()}.sock')
+        self.generation = 0
+        self._sock = None
+        self._event = None
+
+    def start(self):
+        """Bind the socket and start receiving notifications on the running event loop."""
+        self._event = asyncio.Event()
+        if not notifications_supported():
+            logger.info("Unix sockets are not available; falling back to polling for new uploads.")
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left behind by a previous process with the same pid
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self.path)
+        try:
+            asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+        except NotImplementedError:
+            logger.info("Event loop cannot watch sockets; falling back to polling for new uploads.")
+            self.close()
+
+    def _on_readable(self):
+        # Drain everything queued so a burst of uploads causes a single wakeup
+        while True:
+            try:
+                self._sock.recv(1024)
+            except (BlockingIOError, InterruptedError):
+                break
+        self.generation += 1
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def wait(self, since_generation, timeout=FALLBACK_POLL_SECONDS):
+        """
+        Wait for a notification newer than `since_generation`.
+
+        Args:
+            since_generation (int): The value of `generation` seen before checking for work.
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if woken by a notification, False if the timeout expired.
+        """
+        if self.generation != since_generation:
+            return True
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        """Stop listening and remove the socket file."""
+        if self._sock is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        except (RuntimeError, NotImplementedError):
+            pass
+        self._sock.close()
+        self._sock = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,304 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from collections import deque
+import openai
+from metrics import LLM_RETRIES_TOTAL
+
+# Constants
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 3500))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', 90000))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 32))
+DEFAULT_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 6))
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+LATENCY_TOLERANCE = 2.0  # Shrink concurrency once recent latency exceeds this multiple of the long-run average
+DECREASE_COOLDOWN_SECONDS = 1.0  # Collapse a burst of errors into a single decrease
+
+logger = logging.getLogger(__name__)
+
+# Who the requests of the current task are made for, e.g. a user id. Concurrency slots are
+# granted round-robin across owners, so one owner's backlog cannot starve the others.
+request_owner = contextvars.ContextVar('request_owner', default=None)
+
+
+def retry_after_seconds(error):
+    """
+    Read the server-requested retry delay from an API error, if any.
+
+    Args:
+        error (Exception): The exception raised by the OpenAI client.
+
+    Returns:
+        float or None: The number of seconds to wait, or None if the server gave no hint.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            return None
+    return None
+
+
+def is_retryable_error(error):
+    """
+    Decide whether a failed API call is worth retrying.
+
+    Args:
+        error (Exception): The exception raised by the OpenAI client.
+
+    Returns:
+        bool: True for rate limiting, server errors and connection problems.
+    """
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class _TokenBucket:
+    """A token bucket refilled continuously at `capacity` per minute."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def take(self, amount):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def give_back(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveRateLimiter:
+    """
+    Shared limiter for OpenAI calls driven by requests/minute, tokens/minute and concurrency.
+
+    The concurrency limit follows an additive-increase/multiplicative-decrease policy:
+    it grows by roughly one slot per window of successful calls, is halved on 429s and
+    server errors, and shrinks by one when recent latency climbs well above the long-run
+    average. It never exceeds `max_concurrency`. Waiting calls are admitted round-robin
+    across the owners set in `request_owner`, oldest call first per owner, so whichever
+    limit is the bottleneck, no owner's backlog starves the others.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.concurrency_limit = float(max(1, max_concurrency // 4))
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.latency_baseline = None
+        self.errors = 0
+        self.retries = 0
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._turn_taken = False
+        self._waiters = {}  # Owner -> deque of futures waiting for their turn, in round-robin order
+        self._slot_freed = None
+
+    async def acquire(self, estimated_tokens=0):
+        """
+        Wait for a concurrency slot and for request and token budget.
+
+        Args:
+            estimated_tokens (int): Tokens the request is expected to consume.
+        """
+        # Callers pass through one at a time, taking turns between owners, and wait for the slot
+        # and the budget only once it is their turn
+        await self._take_turn()
+        try:
+            while self.in_flight >= int(self.concurrency_limit):
+                slot_freed = self._get_slot_freed()
+                slot_freed.clear()
+                await slot_freed.wait()
+            self.in_flight += 1
+            try:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                await self._requests.take(1)
+                await self._tokens.take(estimated_tokens)
+            except BaseException:
+                await self._release_slot()
+                raise
+        finally:
+            self._pass_turn()
+
+    async def release(self, latency=None, error=None):
+        """
+        Return a concurrency slot and feed the outcome into the adaptive limit.
+
+        Args:
+            latency (float, optional): Duration of the call in seconds, for successful calls.
+            error (Exception, optional): The error raised by the call, if it failed.
+        """
+        if error is not None and is_retryable_error(error):
+            self.errors += 1
+            self._decrease(multiplicative=True)
+            retry_after = retry_after_seconds(error)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        elif latency is not None:
+            self._observe_latency(latency)
+        await self._release_slot()
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """
+        Correct the token budget once the real usage of a request is known.
+
+        Args:
+            estimated_tokens (int): The estimate passed to `acquire`.
+            actual_tokens (int): The tokens reported by the API.
+        """
+        if actual_tokens < estimated_tokens:
+            self._tokens.give_back(estimated_tokens - actual_tokens)
+        else:
+            self._tokens.tokens -= actual_tokens - estimated_tokens
+
+    async def run(self, call, estimated_tokens=0):
+        """
+        Run `call` under the limiter, retrying rate limits and transient errors.
+
+        Args:
+            call (callable): A zero-argument coroutine function performing the request.
+            estimated_tokens (int): Tokens the request is expected to consume.
+
+        Returns:
+            The result of `call`.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(estimated_tokens)
+            started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                await self.release(error=e)
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = retry_after_seconds(e) or self._backoff(attempt)
+                attempt += 1
+                self.retries += 1
+                LLM_RETRIES_TOTAL.inc()
+                logger.warning(f"OpenAI request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                await self.release()
+                raise
+            await self.release(latency=time.monotonic() - started)
+            return result
+
+    def stats(self):
+        """
+        Report the current state of the limiter.
+
+        Returns:
+            dict: Concurrency limit, in-flight count, retries, errors and smoothed latency.
+        """
+        return {
+            'concurrency_limit': int(self.concurrency_limit),
+            'in_flight': self.in_flight,
+            'retries': self.retries,
+            'errors': self.errors,
+            'latency_ewma': self.latency_ewma,
+        }
+
+    def _get_slot_freed(self):
+        # Created lazily so the limiter can be built outside of a running event loop
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Event()
+        return self._slot_freed
+
+    async def _take_turn(self):
+        if not self._turn_taken and not self._waiters:
+            self._turn_taken = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        owner = request_owner.get()
+        self._waiters.setdefault(owner, deque()).append(future)
+        try:
+            await future  # Resolved by _pass_turn once it is our turn
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._pass_turn()  # The turn arrived just before the cancellation
+            else:
+                queue = self._waiters.get(owner)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[owner]
+            raise
+
+    def _pass_turn(self):
+        if not self._waiters:
+            self._turn_taken = False
+            return
+        owner, queue = next(iter(self._waiters.items()))
+        future = queue.popleft()
+        # Move the owner to the back of the rotation, or drop it once it has no waiters left
+        del self._waiters[owner]
+        if queue:
+            self._waiters[owner] = queue
+        future.set_result(None)
+
+    async def _release_slot(self):
+        self.in_flight -= 1
+        self._get_slot_freed().set()
+
+    def _backoff(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+
+    def _observe_latency(self, latency):
+        if self.latency_ewma is None:
+            self.latency_ewma = self.latency_baseline = latency
+        self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+        self.latency_baseline = 0.98 * self.latency_baseline + 0.02 * latency
+        if self.latency_ewma > LATENCY_TOLERANCE * self.latency_baseline:
+            self._decrease(multiplicative=False)
+        else:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def _decrease(self, multiplicative):
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        if multiplicative:
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+        else:
+            self.concurrency_limit = max(1.0, self.concurrency_limit - 1)
+        logger.info(f"OpenAI concurrency limit lowered to {int(self.concurrency_limit)}")
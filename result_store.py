@@ -0,0 +1,89 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+
+COMPRESSION_LEVEL = 6
+
+
+class ResultStore:
+    """
+    Gzip-compressed JSON documents on disk, each stored with a precomputed strong ETag.
+
+    Documents are immutable once written, so they can be served straight from the stored
+    bytes: compressed to clients that accept gzip, and decompressed (but never parsed and
+    re-encoded) to clients that do not. Each document is a single file holding its ETag on
+    the first line followed by the compressed body, so one read always returns an ETag and
+    the body it belongs to, even while the document is being rewritten.
+    """
+
+    def __init__(self, folder):
+        """
+        Args:
+            folder (str): Directory the documents are stored in.
+        """
+        self.folder = folder
+
+    def path(self, key):
+        """Return the path of a stored document, for callers doing their own I/O."""
+        return os.path.join(self.folder, f"{key}.result")
+
+    @staticmethod
+    def parse(data):
+        """
+        Split the contents of a stored document.
+
+        Args:
+            data (bytes): The file contents, as read from `path`.
+
+        Returns:
+            tuple: (etag, gzip-compressed JSON bytes).
+        """
+        etag, _, compressed = data.partition(b'\n')
+        return etag.decode('ascii'), compressed
+
+    def _write_atomically(self, path, data):
+        """Write a file so that readers never see it half-written."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, key):
+        """
+        Load a stored document.
+
+        Args:
+            key (str): The document's key.
+
+        Returns:
+            tuple or None: (etag, gzip-compressed JSON bytes), or None if nothing is stored under the key.
+        """
+        try:
+            with open(self.path(key), 'rb') as document_file:
+                return self.parse(document_file.read())
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, document):
+        """
+        Serialize, compress and store a document.
+
+        Args:
+            key (str): The document's key.
+            document: A JSON-serializable value.
+
+        Returns:
+            tuple: (etag, gzip-compressed JSON bytes) of the stored document.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        body = json.dumps(document, ensure_ascii=False).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        compressed = gzip.compress(body, compresslevel=COMPRESSION_LEVEL, mtime=0)
+        self._write_atomically(self.path(key), etag.encode('ascii') + b'\n' + compressed)
+        return etag, compressed
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+# Constants
+DEFAULT_MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 200 * 1024 * 1024))
+SESSION_MAX_AGE_SECONDS = 24 * 60 * 60
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class UploadSessionError(Exception):
+    """Base class for resumable upload errors; `status_code` is the matching HTTP status."""
+    status_code = 400
+
+
+class UploadSessionNotFound(UploadSessionError):
+    status_code = 404
+
+
+class UploadOffsetMismatch(UploadSessionError):
+    status_code = 409
+
+    def __init__(self, expected_offset, received_offset):
+        super().__init__(f"Chunk offset {received_offset} does not match the current upload offset {expected_offset}")
+        self.expected_offset = expected_offset
+
+
+class UploadTooLarge(UploadSessionError):
+    status_code = 413
+
+
+class ResumableUploadStore:
+    """
+    Keeps partially uploaded files on disk until they are finalized.
+
+    Each session consists of a metadata file and a data file that chunks are appended
+    to in order. A SHA-256 of the data is updated as chunks stream in; if the server
+    restarts mid-upload the hash is rebuilt from the data already on disk.
+    """
+
+    def __init__(self, folder, max_size=DEFAULT_MAX_UPLOAD_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        self._hashers = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _metadata_path(self, upload_id):
+        return os.path.join(self.folder, f"{upload_id}.json")
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.folder, f"{upload_id}.part")
+
+    def _lock_for(self, upload_id):
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load_metadata(self, upload_id):
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise UploadSessionNotFound(f"Upload session {upload_id} does not exist")
+        try:
+            with open(self._metadata_path(upload_id), 'r') as metadata_file:
+                return json.load(metadata_file)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(f"Upload session {upload_id} does not exist")
+
+    def _hasher_for(self, upload_id, offset):
+        hasher_offset, hasher = self._hashers.get(upload_id, (None, None))
+        if hasher_offset != offset:
+            # Rebuild the running hash from what is already on disk
+            hasher = hashlib.sha256()
+            with open(self._data_path(upload_id), 'rb') as data_file:
+                for block in iter(lambda: data_file.read(READ_BUFFER_SIZE), b''):
+                    hasher.update(block)
+        return hasher
+
+    def create(self, filename, email=None, total_size=None):
+        """
+        Start a new resumable upload.
+
+        Args:
+            filename (str): The name of the file being uploaded.
+            email (str, optional): Email address the upload belongs to.
+            total_size (int, optional): The announced size of the file in bytes.
+
+        Returns:
+            str: The id of the new upload session.
+        """
+        if total_size is not None and total_size > self.max_size:
+            raise UploadTooLarge(f"File size {total_size} exceeds the maximum of {self.max_size} bytes")
+        os.makedirs(self.folder, exist_ok=True)
+        self.cleanup_expired()
+
+        upload_id = str(uuid.uuid4())
+        metadata = {'filename': filename, 'email': email, 'total_size': total_size, 'created_at': time.time()}
+        open(self._data_path(upload_id), 'wb').close()
+        with open(self._metadata_path(upload_id), 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return upload_id
+
+    def get_offset(self, upload_id):
+        """
+        Return the number of bytes received so far, which is where the next chunk must start.
+
+        Args:
+            upload_id (str): The id of the upload session.
+
+        Returns:
+            tuple: The current offset and the session metadata.
+        """
+        metadata = self._load_metadata(upload_id)
+        return os.path.getsize(self._data_path(upload_id)), metadata
+
+    def append_chunk(self, upload_id, offset, stream):
+        """
+        Append a chunk read from `stream` to the upload, hashing it on the way to disk.
+
+        Args:
+            upload_id (str): The id of the upload session.
+            offset (int): The offset the client believes the chunk starts at.
+            stream (file-like): The request body.
+
+        Returns:
+            int: The new offset.
+        """
+        with self._lock_for(upload_id):
+            current_offset, metadata = self.get_offset(upload_id)
+            if offset != current_offset:
+                raise UploadOffsetMismatch(current_offset, offset)
+            limit = metadata['total_size'] if metadata['total_size'] is not None else self.max_size
+
+            hasher = self._hasher_for(upload_id, current_offset).copy()
+            new_offset = current_offset
+            with open(self._data_path(upload_id), 'ab') as data_file:
+                for block in iter(lambda: stream.read(READ_BUFFER_SIZE), b''):
+                    new_offset += len(block)
+                    if new_offset > limit:
+                        data_file.truncate(current_offset)
+                        raise UploadTooLarge(f"Upload exceeds the limit of {limit} bytes")
+                    data_file.write(block)
+                    hasher.update(block)
+            self._hashers[upload_id] = (new_offset, hasher)
+            return new_offset
+
+    def complete(self, upload_id, destination_path, expected_sha256=None):
+        """
+        Verify a finished upload and move it to its final location.
+
+        Args:
+            upload_id (str): The id of the upload session.
+            destination_path (str): Where the finished file should be stored.
+            expected_sha256 (str, optional): Hex digest the client computed for the file.
+
+        Returns:
+            tuple: The session metadata and the hex SHA-256 of the file.
+        """
+        with self._lock_for(upload_id):
+            offset, metadata = self.get_offset(upload_id)
+            if metadata['total_size'] is not None and offset != metadata['total_size']:
+                raise UploadSessionError(f"Upload is incomplete: received {offset} of {metadata['total_size']} bytes")
+            sha256 = self._hasher_for(upload_id, offset).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                raise UploadSessionError("Uploaded data does not match the expected SHA-256")
+
+            os.replace(self._data_path(upload_id), destination_path)
+            os.remove(self._metadata_path(upload_id))
+            self._hashers.pop(upload_id, None)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+        return metadata, sha256
+
+    def cleanup_expired(self, max_age_seconds=SESSION_MAX_AGE_SECONDS):
+        """Remove sessions that have not received data for `max_age_seconds`."""
+        if not os.path.isdir(self.folder):
+            return
+        cutoff = time.time() - max_age_seconds
+        for name in os.listdir(self.folder):
+            upload_id, extension = os.path.splitext(name)
+            if extension != '.part':
+                continue
+            try:
+                if os.path.getmtime(self._data_path(upload_id)) >= cutoff:
+                    continue
+                for path in (self._data_path(upload_id), self._metadata_path(upload_id)):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._hashers.pop(upload_id, None)
+            except OSError:
+                pass
@@ -0,0 +1,513 @@
+import os
+import gzip
+import json
+import hashlib
+import time
+import base64
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+from sqlalchemy import create_engine
+import app as flask_app_module
+from app import app
+from database import (Base, Session, Upload, User, session as db_session, save_slide_result, save_partial_explanations,
+                      finish_upload)
+from notifier import StatusListener, notify_status_change, notifications_supported
+from result_store import ResultStore
+from resumable_upload import ResumableUploadStore, DEFAULT_MAX_UPLOAD_SIZE
+import client
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs the Flask app against a database and folders of its own."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.uploads = os.path.join(self.tmp_dir.name, 'uploads')
+        self.outputs = os.path.join(self.tmp_dir.name, 'outputs')
+        self.run_folder = os.path.join(self.tmp_dir.name, 'run')
+        self.database_url = f"sqlite:///{os.path.join(self.tmp_dir.name, 'database.db')}"
+        self.engine = create_engine(self.database_url)
+        Base.metadata.create_all(self.engine)
+        self.addCleanup(self.engine.dispose)
+
+        # The app's sessions are bound to the test database for the duration of the test
+        db_session.remove()
+        Session.configure(bind=self.engine)
+        self.addCleanup(Session.configure, bind=Session.kw['bind'])
+        self.addCleanup(db_session.remove)
+        self.session = Session()
+        self.addCleanup(self.session.close)
+
+        self.status_listener = StatusListener(self.run_folder)
+        self.addCleanup(self.status_listener.close)
+        for name, value in [('UPLOAD_FOLDER', self.uploads), ('OUTPUT_FOLDER', self.outputs),
+                            ('status_store', ResultStore(os.path.join(self.outputs, 'status'))),
+                            ('upload_store', ResumableUploadStore(os.path.join(self.uploads, '.partial'),
+                                                                  DEFAULT_MAX_UPLOAD_SIZE)),
+                            ('status_listener', self.status_listener)]:
+            patcher = patch.object(flask_app_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.dict(app.config, {'UPLOAD_FOLDER': self.uploads, 'OUTPUT_FOLDER': self.outputs})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('app.notify_workers')
+        self.notify_workers = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Validating email addresses would look up their domain
+        patcher = patch('database.normalize_email', side_effect=str.lower)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def add_upload(self, uid, status='pending', total_slides=None, **fields):
+        upload = Upload(uid=uid, filename=f"{uid}.pptx", status=status, total_slides=total_slides, **fields)
+        self.session.add(upload)
+        self.session.commit()
+        return upload
+
+    def write_output(self, uid, explanations):
+        os.makedirs(self.outputs, exist_ok=True)
+        with open(os.path.join(self.outputs, f"{uid}.json"), 'w') as f:
+            json.dump(explanations, f)
+
+
+def read_events(chunks, count=None):
+    """Parse Server-Sent Events from an iterator of response chunks, stopping after `count` events."""
+    events = []
+    for chunk in chunks:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith(':'):
+            continue  # Keep-alive comment
+        event, data = chunk.strip().split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        if count is not None and len(events) == count:
+            break
+    return events
+
+
+class TestSlideProgress(AppTestCase):
+
+    def test_status_reports_progress_of_unfinished_upload(self):
+        """Pending uploads report how many of their slides are explained; partial text does not count."""
+        upload = self.add_upload('deck', status='processing', total_slides=3)
+        save_slide_result(self.session, upload.id, 1, "one")
+        save_slide_result(self.session, upload.id, 2, "two")
+        save_partial_explanations(self.session, {(upload.id, 3): "thr"})
+
+        response = self.client.get('/status?uid=deck')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['status'], 'pending')
+        self.assertIsNone(response.json['explanation'])
+        self.assertEqual(response.json['progress'], {'done': 2, 'total': 3})
+        self.assertEqual(response.headers['ETag'], 'W/"processing-2-3"')
+
+    def test_duplicate_upload_reports_progress_of_its_source(self):
+        """An upload attached to an identical one reports the progress of that upload's slides."""
+        source = self.add_upload('source', status='processing', total_slides=2)
+        self.add_upload('copy', source_uid='source')
+        save_slide_result(self.session, source.id, 1, "one")
+
+        response = self.client.get('/status?uid=copy')
+
+        self.assertEqual(response.json['progress'], {'done': 1, 'total': 2})
+
+    def test_saving_a_slide_twice_counts_it_once(self):
+        """A slide saved again, e.g. by a worker that lost its lease, keeps its first explanation."""
+        upload = self.add_upload('deck', status='processing', total_slides=2)
+        save_slide_result(self.session, upload.id, 1, "first")
+        save_slide_result(self.session, upload.id, 1, "second")
+
+        response = self.client.get('/status?uid=deck')
+
+        self.assertEqual(response.json['progress'], {'done': 1, 'total': 2})
+        upload.status, upload.finish_time = 'done', datetime.utcnow()
+        self.session.commit()
+        events = read_events(self.client.get('/status/stream?uid=deck').response)
+        self.assertEqual([data for event, data in events if event == 'slide'],
+                         [{'slide_number': 1, 'explanation': "first"}])
+
+    def test_finished_upload_returns_every_explanation(self):
+        """Once finished, /status returns the explanations with the final progress."""
+        upload = self.add_upload('deck', status='done', total_slides=2, finish_time=datetime.utcnow())
+        save_slide_result(self.session, upload.id, 1, "one")
+        save_slide_result(self.session, upload.id, 2, "two")
+        self.write_output('deck', ["one", "two"])
+
+        response = self.client.get('/status?uid=deck')
+
+        self.assertEqual(response.json['status'], 'done')
+        self.assertEqual(response.json['explanation'], ["one", "two"])
+        self.assertEqual(response.json['progress'], {'done': 2, 'total': 2})
+
+
+class TestBulkStatus(AppTestCase):
+
+    def test_mix_of_unknown_pending_and_done_uploads(self):
+        """Every requested uid gets an entry, with the progress of the upload it shares its result with."""
+        finish_time = datetime(2024, 1, 1, 12)
+        source = self.add_upload('source', status='processing', total_slides=3)
+        save_slide_result(self.session, source.id, 1, "one")
+        self.add_upload('copy', source_uid='source')
+        done = self.add_upload('done', status='done', total_slides=1, finish_time=finish_time)
+        save_slide_result(self.session, done.id, 1, "explained")
+        self.write_output('done', ["explained"])
+
+        response = self.client.post('/status/bulk', json={'uids': ['missing', 'copy', 'done', 'source']})
+
+        self.assertEqual(response.status_code, 200)
+        statuses = response.json['statuses']
+        self.assertEqual(set(statuses), {'missing', 'copy', 'done', 'source'})
+        self.assertEqual(statuses['missing'], {'status': 'not found'})
+        self.assertEqual(statuses['copy'], {'status': 'pending', 'finish_time': None,
+                                            'progress': {'done': 1, 'total': 3}})
+        self.assertEqual(statuses['done'], {'status': 'done', 'finish_time': finish_time.isoformat(),
+                                            'progress': {'done': 1, 'total': 1}})
+        self.assertEqual(statuses['source']['progress'], {'done': 1, 'total': 3})
+
+        with_explanations = self.client.post('/status/bulk', json={'uids': ['done', 'copy', 'missing'],
+                                                                   'include_explanations': True})
+        self.assertEqual(with_explanations.json['statuses']['done']['explanation'], ["explained"])
+        self.assertNotIn('explanation', with_explanations.json['statuses']['copy'])
+        self.assertNotIn('explanation', with_explanations.json['statuses']['missing'])
+
+    def test_too_many_uids_are_rejected(self):
+        """Up to MAX_BULK_STATUS_UIDS uids are looked up; one more is a 400."""
+        limit = flask_app_module.MAX_BULK_STATUS_UIDS
+
+        at_limit = self.client.post('/status/bulk', json={'uids': [f"uid-{n}" for n in range(limit)]})
+        over_limit = self.client.post('/status/bulk', json={'uids': [f"uid-{n}" for n in range(limit + 1)]})
+
+        self.assertEqual(at_limit.status_code, 200)
+        self.assertEqual(len(at_limit.json['statuses']), limit)
+        self.assertEqual(over_limit.status_code, 400)
+        self.assertIn(str(limit), over_limit.json['error'])
+
+    def test_malformed_bodies_are_rejected(self):
+        """Bodies without a list of string uids are a 400, not a server error."""
+        for body in [['a', 'b'], 'a', 1, None, {}, {'uids': 'a'}, {'uids': {'a': 1}}, {'uids': [1, 2]}]:
+            response = self.client.post('/status/bulk', json=body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json, {'error': 'Expected a JSON body with a list of uids'})
+
+        not_json = self.client.post('/status/bulk', data='uids=a', content_type='application/x-www-form-urlencoded')
+        self.assertEqual(not_json.status_code, 400)
+
+
+class TestFinishedStatus(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_upload('deck', status='done', total_slides=1, finish_time=datetime.utcnow())
+        self.write_output('deck', ["explained"])
+
+    def test_gzip_is_sent_to_clients_that_accept_it(self):
+        """The stored document is sent compressed, under an ETag of its own, and plain to other clients."""
+        plain = self.client.get('/status?uid=deck')
+        compressed = self.client.get('/status?uid=deck', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(compressed.data)), plain.json)
+        self.assertEqual(compressed.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+
+    def test_matching_etag_is_not_modified(self):
+        """A client holding the current ETag of a finished upload gets 304 without a body, in either encoding."""
+        for headers in [{}, {'Accept-Encoding': 'gzip'}]:
+            tag = self.client.get('/status?uid=deck', headers=headers).headers['ETag']
+
+            response = self.client.get('/status?uid=deck', headers={**headers, 'If-None-Match': tag})
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], tag)
+
+        stale = self.client.get('/status?uid=deck', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.json['explanation'], ["explained"])
+
+    def test_finished_status_is_served_from_the_store(self):
+        """Once stored, the finished status no longer needs the output file."""
+        first = self.client.get('/status?uid=deck')
+        os.remove(os.path.join(self.outputs, 'deck.json'))
+
+        second = self.client.get('/status?uid=deck')
+
+        self.assertEqual(second.json, first.json)
+        self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+
+
+@unittest.skipUnless(notifications_supported(), "Unix sockets are not available")
+class TestStatusStream(AppTestCase):
+
+    def test_stream_sends_each_slide_as_it_is_saved_and_ends_with_the_deck(self):
+        """Every saved slide and partial text is sent once, and the stream closes when the deck is done."""
+        upload = self.add_upload('deck', status='processing', total_slides=2, worker_id='worker-1')
+
+        with patch('app.STREAM_HEARTBEAT_SECONDS', 5):
+            response = self.client.get('/status/stream?uid=deck', buffered=False)
+            chunks = iter(response.response)
+            self.assertEqual(read_events(chunks, 1), [('progress', {'done': 0, 'total': 2})])
+
+            save_slide_result(self.session, upload.id, 1, "one")
+            save_partial_explanations(self.session, {(upload.id, 2): "tw"})
+            notify_status_change('deck', self.run_folder)
+            self.assertEqual(read_events(chunks, 3), [('slide', {'slide_number': 1, 'explanation': "one"}),
+                                                      ('partial', {'slide_number': 2, 'explanation': "tw"}),
+                                                      ('progress', {'done': 1, 'total': 2})])
+
+            save_slide_result(self.session, upload.id, 2, "two")
+            finish_upload(self.session, upload.id, 'worker-1', 'done')
+            notify_status_change('deck', self.run_folder)
+            self.assertEqual(read_events(chunks), [('slide', {'slide_number': 2, 'explanation': "two"}),
+                                                   ('progress', {'done': 2, 'total': 2}),
+                                                   ('done', {'status': 'done'})])
+            response.close()
+
+    def test_stream_of_unknown_upload_is_not_found(self):
+        """Streaming an unknown uid fails right away instead of opening a stream."""
+        self.assertEqual(self.client.get('/status/stream?uid=missing').status_code, 404)
+        self.assertEqual(self.client.get('/status/stream').status_code, 400)
+
+
+
+class TestLongPoll(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.upload = self.add_upload('deck', status='processing', total_slides=2)
+
+    def get_status_timed(self, query):
+        started = time.monotonic()
+        response = self.client.get(f'/status?uid=deck&{query}')
+        return response, time.monotonic() - started
+
+    @unittest.skipUnless(notifications_supported(), "Unix sockets are not available")
+    def test_wait_returns_once_the_upload_changes(self):
+        """A waiting request answers as soon as a worker reports a saved slide."""
+        def explain_slide():
+            save_slide_result(self.session, self.upload.id, 1, "one")
+            notify_status_change('deck', self.run_folder)
+
+        timer = threading.Timer(0.2, explain_slide)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        response, elapsed = self.get_status_timed('wait=30')
+
+        self.assertLess(elapsed, 10)
+        self.assertEqual(response.json['progress'], {'done': 1, 'total': 2})
+
+    def test_long_waits_are_capped(self):
+        """A wait above MAX_STATUS_WAIT_SECONDS, even an infinite one, only waits for the maximum."""
+        with patch('app.MAX_STATUS_WAIT_SECONDS', 0.2):
+            for wait in ['1000000', 'inf', '1e308']:
+                response, elapsed = self.get_status_timed(f'wait={wait}')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertLess(elapsed, 5)
+
+    def test_negative_or_invalid_waits_are_rejected(self):
+        """Waits that are not a non-negative number of seconds are a 400 and never reach the listener."""
+        with patch.object(flask_app_module.status_listener, 'wait') as listener_wait:
+            for wait in ['-1', '-inf', 'nan', 'soon']:
+                response, _ = self.get_status_timed(f'wait={wait}')
+
+                self.assertEqual(response.status_code, 400, wait)
+                self.assertEqual(response.json, {'error': 'Wait must be a non-negative number of seconds'})
+        listener_wait.assert_not_called()
+
+        for wait in ['', '0']:
+            self.assertEqual(self.get_status_timed(f'wait={wait}')[0].status_code, 200)
+
+
+
+class TestResumableUpload(AppTestCase):
+
+    content = bytes(range(256)) * 40
+
+    def start_upload(self, size=None):
+        response = self.client.post('/upload/init', json={'filename': 'deck.pptx',
+                                                          'size': len(self.content) if size is None else size})
+        self.assertEqual(response.status_code, 201)
+        return response.json['upload_id']
+
+    def put_chunk(self, upload_id, offset, chunk):
+        return self.client.put(f'/upload/{upload_id}?offset={offset}', data=chunk,
+                               content_type='application/octet-stream')
+
+    def finalize(self, upload_id, client=None):
+        return (client or self.client).post(f'/upload/{upload_id}/finalize',
+                                            json={'sha256': hashlib.sha256(self.content).hexdigest()})
+
+    def stored_files(self):
+        return [name for name in os.listdir(self.uploads) if not name.startswith('.')]
+
+    def test_out_of_order_chunk_is_rejected_with_the_current_offset(self):
+        """A chunk that does not start where the received data ends is a 409 that tells the client where to resume."""
+        upload_id = self.start_upload()
+        self.assertEqual(self.put_chunk(upload_id, 0, self.content[:1000]).json['offset'], 1000)
+
+        for offset in [0, 500, 2000]:
+            response = self.put_chunk(upload_id, offset, self.content[offset:offset + 1000])
+
+            self.assertEqual(response.status_code, 409, offset)
+            self.assertEqual(response.json['offset'], 1000)
+        self.assertEqual(self.client.get(f'/upload/{upload_id}').json['offset'], 1000)
+        self.assertEqual(self.put_chunk(upload_id, 'end', b'x').status_code, 400)
+
+    def test_upload_resumes_after_a_partial_upload(self):
+        """After an interrupted upload, even across a server restart, the rest is sent from the reported offset."""
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:3000])
+        # A restarted server has no running hash and rebuilds it from the data on disk
+        restarted_store = ResumableUploadStore(flask_app_module.upload_store.folder, DEFAULT_MAX_UPLOAD_SIZE)
+
+        with patch.object(flask_app_module, 'upload_store', restarted_store):
+            status = self.client.get(f'/upload/{upload_id}')
+            self.assertEqual(status.json, {'upload_id': upload_id, 'offset': 3000, 'size': len(self.content)})
+            offset = status.json['offset']
+            self.assertEqual(self.put_chunk(upload_id, offset, self.content[offset:]).json['offset'],
+                             len(self.content))
+            response = self.finalize(upload_id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['sha256'], hashlib.sha256(self.content).hexdigest())
+        with open(os.path.join(self.uploads, self.stored_files()[0]), 'rb') as stored_file:
+            self.assertEqual(stored_file.read(), self.content)
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        """Finalizing before every byte has arrived fails and keeps the session open for the rest."""
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:1000])
+
+        self.assertEqual(self.finalize(upload_id).status_code, 400)
+        self.assertEqual(self.client.get(f'/upload/{upload_id}').json['offset'], 1000)
+        self.assertEqual(self.stored_files(), [])
+        self.notify_workers.assert_not_called()
+
+    def test_finished_upload_is_queued_exactly_once(self):
+        """Finalizing twice, also concurrently, creates one Upload and wakes the workers once."""
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content)
+        barrier = threading.Barrier(2)
+        responses = []
+
+        def finalize():
+            client = app.test_client()
+            barrier.wait()
+            responses.append(self.finalize(upload_id, client))
+
+        threads = [threading.Thread(target=finalize) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 404])
+        self.assertEqual(self.finalize(upload_id).status_code, 404)
+        self.assertEqual(self.put_chunk(upload_id, len(self.content), b'more').status_code, 404)
+        self.session.expire_all()
+        self.assertEqual([upload.uid for upload in self.session.query(Upload).all()],
+                         [response.json['uid'] for response in responses if response.status_code == 200])
+        self.assertEqual(self.session.query(Upload).one().status, 'pending')
+        self.assertEqual(len(self.stored_files()), 1)
+        self.notify_workers.assert_called_once_with()
+
+
+
+class TestHistory(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User(email='user@example.com')
+        self.session.add(user)
+        self.session.commit()
+        # Seven uploads, three of which share one upload time across the boundary of the pages
+        start = datetime(2024, 1, 1)
+        times = [start, start + timedelta(minutes=1), start + timedelta(minutes=2), start + timedelta(minutes=2),
+                 start + timedelta(minutes=2), start + timedelta(minutes=3), start + timedelta(minutes=4)]
+        for number, upload_time in enumerate(times):
+            self.add_upload(f"upload-{number}", status='failed' if number % 3 == 0 else 'pending',
+                            upload_time=upload_time, user_id=user.id)
+        self.newest_first = [f"upload-{number}" for number in (6, 5, 4, 3, 2, 1, 0)]
+
+    def get_pages(self, **params):
+        pages = []
+        params = dict(email='user@example.com', **params)
+        while True:
+            response = self.client.get('/history', query_string=params)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json)
+            if not response.json['next_cursor']:
+                return pages
+            params['cursor'] = response.json['next_cursor']
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        """Paging through more uploads than the limit returns each exactly once, newest first."""
+        for limit in (1, 2, 3, 7, 100):
+            pages = self.get_pages(limit=limit)
+            uids = [upload['uid'] for page in pages for upload in page['uploads']]
+            self.assertEqual(uids, self.newest_first, f"limit={limit}")
+            self.assertTrue(all(page['uploads'] for page in pages), f"limit={limit}")
+            self.assertEqual(len(pages), -(-7 // limit), f"limit={limit}")
+
+    def test_next_cursor_is_null_on_the_last_page(self):
+        """A page that ends exactly at the last upload does not point to an empty page."""
+        pages = self.get_pages(limit=7)
+
+        self.assertEqual(len(pages), 1)
+        self.assertIsNone(pages[0]['next_cursor'])
+
+    def test_filters_apply_to_every_page(self):
+        """The status filter and the time range are kept while paging."""
+        pages = self.get_pages(limit=1, status='failed')
+        self.assertEqual([upload['uid'] for page in pages for upload in page['uploads']],
+                         ["upload-6", "upload-3", "upload-0"])
+
+        pages = self.get_pages(limit=2, since='2024-01-01T00:02:00', until='2024-01-01T00:04:00')
+        self.assertEqual([upload['uid'] for page in pages for upload in page['uploads']],
+                         ["upload-5", "upload-4", "upload-3", "upload-2"])
+
+    def test_malformed_or_tampered_cursor_is_rejected(self):
+        """Cursors the server did not produce are answered with 400 instead of failing mid-response."""
+        def encode(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        for cursor in ['not a cursor', '%%%', base64.urlsafe_b64encode(b'\xff\xfe').decode(), encode("text"),
+                       encode([]), encode(["2024-01-01T00:00:00"]), encode(["yesterday", 1]),
+                       encode(["2024-01-01T00:00:00", "one"]), encode([1, 2]),
+                       encode(["2024-01-01T00:00:00", 2 ** 64]), encode(["2024-01-01T00:00:00", -1])]:
+            response = self.client.get('/history', query_string={'email': 'user@example.com', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json, {'error': 'Invalid cursor'})
+
+    def test_invalid_parameters_are_rejected(self):
+        """Limits out of range, unknown statuses and malformed times are answered with 400."""
+        for params in [{'limit': 0}, {'limit': 1001}, {'limit': 'ten'}, {'status': 'lost'}, {'since': 'monday'}]:
+            response = self.client.get('/history', query_string=dict(email='user@example.com', **params))
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(self.client.get('/history', query_string={'email': 'other@example.com'}).status_code, 404)
+
+    def test_client_follows_the_cursor(self):
+        """client.iter_history requests page after page until next_cursor is null."""
+        def get(url, params, timeout):
+            response = self.client.get('/history', query_string=params)
+            self.assertEqual(response.status_code, 200)
+            return SimpleNamespace(json=lambda: response.json, raise_for_status=lambda: None)
+
+        with patch('client.requests.get', side_effect=get) as requests_get:
+            uids = [record['uid'] for record in client.iter_history('user@example.com', page_size=3)]
+
+        self.assertEqual(uids, self.newest_first)
+        self.assertEqual(requests_get.call_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
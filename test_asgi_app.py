@@ -0,0 +1,198 @@
+import io
+import os
+import gzip
+import json
+import time
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.testclient import TestClient
+import app as flask_app_module
+import asgi_app
+from database import User, save_slide_result
+from notifier import AsyncStatusListener, notify_status_change, notifications_supported
+from test_app import AppTestCase
+
+
+class AsgiTestCase(AppTestCase):
+    """Runs the ASGI app next to the Flask app, on the same database and folders."""
+
+    def setUp(self):
+        super().setUp()
+        self.asgi_run_folder = os.path.join(self.tmp_dir.name, 'asgi-run')
+        async_engine = create_async_engine(self.database_url.replace('sqlite://', 'sqlite+aiosqlite://', 1),
+                                           poolclass=NullPool)
+        for name, value in [('AsyncSession', async_sessionmaker(async_engine, expire_on_commit=False)),
+                            ('UPLOAD_FOLDER', self.uploads), ('OUTPUT_FOLDER', self.outputs),
+                            ('status_store', flask_app_module.status_store),
+                            ('status_listener', AsyncStatusListener(self.asgi_run_folder))]:
+            patcher = patch.object(asgi_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.asgi_client = TestClient(asgi_app.app)
+        self.asgi_client.headers['Accept-Encoding'] = 'identity'  # Like the Flask test client, unless asked
+        self.asgi_client.__enter__()  # Runs the lifespan, which starts the status listener
+        self.addCleanup(self.asgi_client.__exit__, None, None, None)
+
+    def assertSameResponse(self, flask_response, asgi_response):
+        self.assertEqual(asgi_response.status_code, flask_response.status_code)
+        if flask_response.status_code != 304:
+            self.assertEqual(asgi_response.json(), flask_response.json)
+        self.assertEqual(asgi_response.headers.get('ETag'), flask_response.headers.get('ETag'))
+
+    def upload_to_flask(self, content, **form):
+        return self.client.post('/upload', data=dict(file=(io.BytesIO(content), 'deck.pptx'), **form),
+                                content_type='multipart/form-data')
+
+    def upload_to_asgi(self, content, **form):
+        return self.asgi_client.post('/upload', files={'file': ('deck.pptx', content)}, data=form)
+
+
+class TestAsgiUpload(AsgiTestCase):
+
+    def test_upload_is_recorded_like_the_flask_upload(self):
+        """Both front ends store the file and record the upload, and the second identical upload is attached."""
+        flask_response = self.upload_to_flask(b'deck', email='user@example.com', priority='2')
+        asgi_response = self.upload_to_asgi(b'deck', email='user@example.com', priority='2')
+
+        self.assertEqual(asgi_response.status_code, flask_response.status_code)
+        self.assertEqual(asgi_response.json().keys(), flask_response.json.keys())
+        self.assertIsNone(flask_response.json['duplicate_of'])
+        self.assertEqual(asgi_response.json()['duplicate_of'], flask_response.json['uid'])
+        self.session.expire_all()
+        user = self.session.query(User).one()
+        self.assertEqual(sorted((upload.priority, upload.status) for upload in user.uploads),
+                         [(2, 'pending'), (2, 'pending')])
+        self.assertEqual(len(os.listdir(self.uploads)), 2)
+
+    def test_invalid_uploads_are_rejected_like_flask(self):
+        """Missing files and invalid priorities get the same 400 responses."""
+        self.assertSameResponse(self.client.post('/upload', data={'email': 'user@example.com'}),
+                                self.asgi_client.post('/upload', data={'email': 'user@example.com'}))
+        self.assertSameResponse(self.upload_to_flask(b'deck', priority='11'),
+                                self.upload_to_asgi(b'deck', priority='11'))
+
+    def test_failed_upload_leaves_no_file_behind(self):
+        """A file whose upload cannot be recorded is removed again."""
+        with patch('asgi_app.create_upload_record', side_effect=RuntimeError("database is locked")):
+            asgi_response = self.upload_to_asgi(b'deck')
+        with patch('app.create_upload_record', side_effect=RuntimeError("database is locked")):
+            flask_response = self.upload_to_flask(b'deck')
+
+        self.assertEqual(asgi_response.status_code, 500)
+        self.assertSameResponse(flask_response, asgi_response)
+        self.assertEqual(os.listdir(self.uploads), [])
+
+
+class TestAsgiStatus(AsgiTestCase):
+
+    def test_status_matches_flask(self):
+        """Pending, finished, missing and invalid requests get the same responses from both apps."""
+        pending = self.add_upload('pending', status='processing', total_slides=2)
+        save_slide_result(self.session, pending.id, 1, "one")
+        self.add_upload('done', status='done', total_slides=1, finish_time=datetime.utcnow())
+        self.write_output('done', ["explained"])
+        self.add_upload('lost', status='done', total_slides=1, finish_time=datetime.utcnow())
+
+        for query in ['uid=pending', 'uid=done', 'uid=lost', 'uid=missing', '', 'uid=pending&wait=soon',
+                      'uid=pending&wait=-1', 'uid=pending&wait=nan']:
+            self.assertSameResponse(self.client.get(f'/status?{query}'), self.asgi_client.get(f'/status?{query}'))
+
+        tag = self.client.get('/status?uid=pending').headers['ETag']
+        self.assertSameResponse(self.client.get('/status?uid=pending', headers={'If-None-Match': tag}),
+                                self.asgi_client.get('/status?uid=pending', headers={'If-None-Match': tag}))
+
+    def test_finished_status_is_served_compressed_like_flask(self):
+        """Finished uploads are sent gzipped to clients that accept it, with the same strong ETag."""
+        self.add_upload('done', status='done', total_slides=1, finish_time=datetime.utcnow())
+        self.write_output('done', ["explained"])
+        gzip_headers = {'Accept-Encoding': 'gzip'}
+
+        flask_response = self.client.get('/status?uid=done', headers=gzip_headers)
+        asgi_response = self.asgi_client.get('/status?uid=done', headers=gzip_headers)
+
+        self.assertEqual(asgi_response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(asgi_response.headers['ETag'], flask_response.headers['ETag'])
+        self.assertEqual(asgi_response.json(), json.loads(gzip.decompress(flask_response.data)))
+        tag = asgi_response.headers['ETag']
+        self.assertEqual(self.asgi_client.get('/status?uid=done', headers={**gzip_headers, 'If-None-Match': tag})
+                         .status_code, 304)
+
+    @unittest.skipUnless(notifications_supported(), "Unix sockets are not available")
+    def test_wait_returns_once_the_upload_changes(self):
+        """A long poll answers as soon as a worker reports a change instead of after the whole wait."""
+        upload = self.add_upload('deck', status='processing', total_slides=2)
+
+        def explain_slide():
+            save_slide_result(self.session, upload.id, 1, "one")
+            notify_status_change('deck', self.asgi_run_folder)
+
+        timer = threading.Timer(0.2, explain_slide)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        started = time.monotonic()
+        response = self.asgi_client.get('/status?uid=deck&wait=30')
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(response.json()['progress'], {'done': 1, 'total': 2})
+
+
+class TestAsgiBulkStatusHistoryAndMetrics(AsgiTestCase):
+
+    def test_bulk_status_matches_flask(self):
+        """The bulk lookup returns the same statuses, explanations and errors as the Flask app."""
+        source = self.add_upload('source', status='processing', total_slides=2)
+        save_slide_result(self.session, source.id, 1, "one")
+        self.add_upload('copy', source_uid='source')
+        self.add_upload('done', status='done', total_slides=1, finish_time=datetime.utcnow())
+        self.write_output('done', ["explained"])
+
+        for body in [{'uids': ['copy', 'missing', 'done', 'source']},
+                     {'uids': ['done', 'copy'], 'include_explanations': True},
+                     {'uids': []}, {'uids': 'done'}, {'uids': ['x'] * 1001}, {}, ['done']]:
+            self.assertSameResponse(self.client.post('/status/bulk', json=body),
+                                    self.asgi_client.post('/status/bulk', json=body))
+
+    def test_history_pages_match_flask(self):
+        """Every page of the history, and its cursor, is the same in both apps."""
+        user = User(email='user@example.com')
+        self.session.add(user)
+        self.session.commit()
+        for number in range(5):
+            self.add_upload(f"upload-{number}", upload_time=datetime(2024, 1, 1, number // 2), user_id=user.id)
+
+        params = {'email': 'user@example.com', 'limit': 2}
+        pages = 0
+        while True:
+            flask_response = self.client.get('/history', query_string=params)
+            asgi_response = self.asgi_client.get('/history', params=params)
+            self.assertSameResponse(flask_response, asgi_response)
+            pages += 1
+            if not flask_response.json['next_cursor']:
+                break
+            params['cursor'] = flask_response.json['next_cursor']
+        self.assertEqual(pages, 3)
+
+        for params in [{'email': 'user@example.com', 'cursor': 'tampered'}, {'email': 'other@example.com'}, {}]:
+            self.assertSameResponse(self.client.get('/history', query_string=params),
+                                    self.asgi_client.get('/history', params=params))
+
+    def test_metrics_are_served_like_flask(self):
+        """Both apps expose the same metrics in the Prometheus text format."""
+        self.add_upload('deck')
+
+        flask_response = self.client.get('/metrics')
+        asgi_response = self.asgi_client.get('/metrics')
+
+        self.assertEqual(asgi_response.status_code, 200)
+        self.assertEqual(asgi_response.headers['Content-Type'], flask_response.headers['Content-Type'])
+        self.assertIn('upload_queue_depth{status="pending"} 1', asgi_response.text)
+        self.assertEqual([line for line in asgi_response.text.splitlines() if line.startswith('# ')],
+                         [line for line in flask_response.text.splitlines() if line.startswith('# ')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+import requests
+import client
+
+
+class FakeSession:
+    """Stands in for the client's `requests` session and answers like the server would."""
+
+    def __init__(self, statuses=(), failing=()):
+        self.uploaded = []
+        self.status_requests = []
+        self.statuses = list(statuses)
+        self.failing = set(failing)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def post(self, url, files=None, data=None, json=None, timeout=None):
+        if url == client.UPLOAD_URL:
+            filename = os.path.basename(files['file'].name)
+            if filename in self.failing:
+                raise requests.exceptions.ConnectionError("connection reset")
+            self.uploaded.append(filename)
+            return self.response({'uid': f"uid-{filename}", 'duplicate_of': None})
+        self.status_requests.append(json['uids'])
+        round_statuses = self.statuses.pop(0) if self.statuses else {}
+        return self.response({'statuses': {uid: {'status': round_statuses.get(uid, 'pending')}
+                                           for uid in json['uids']}})
+
+    @staticmethod
+    def response(body):
+        return SimpleNamespace(json=lambda: body, raise_for_status=lambda: None)
+
+
+class TestUploadDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.directory = self.tmp_dir.name
+        os.makedirs(os.path.join(self.directory, 'nested'))
+        for name in ['a.pptx', 'b.pptx', 'notes.txt', 'old.ppt', os.path.join('nested', 'c.pptx')]:
+            self.write_file(name)
+        self.manifest_path = os.path.join(self.directory, client.MANIFEST_FILENAME)
+        self.http = FakeSession()
+        patcher = patch('client.create_http_session', side_effect=lambda *args: self.http)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_file(self, name):
+        with open(os.path.join(self.directory, name), 'wb') as file:
+            file.write(name.encode())
+
+    def read_manifest(self):
+        with open(self.manifest_path) as manifest_file:
+            return {os.path.relpath(entry['file'], self.directory): entry for entry in json.load(manifest_file)}
+
+    def test_only_presentations_are_uploaded(self):
+        """Only .pptx files, including those in subdirectories, are uploaded and written to the manifest."""
+        manifest = client.upload_directory(self.directory, 'user@example.com', parallelism=2)
+
+        self.assertCountEqual(self.http.uploaded, ['a.pptx', 'b.pptx', 'c.pptx'])
+        self.assertEqual([entry['uid'] for entry in manifest], ['uid-a.pptx', 'uid-b.pptx', 'uid-c.pptx'])
+        self.assertEqual(set(self.read_manifest()), {'a.pptx', 'b.pptx', os.path.join('nested', 'c.pptx')})
+
+    def test_rerun_skips_files_already_in_the_manifest(self):
+        """A second run only uploads the files that failed or are new, and keeps the earlier uids."""
+        self.http.failing = {'b.pptx'}
+        client.upload_directory(self.directory)
+        first = self.read_manifest()
+        self.assertIsNone(first['b.pptx']['uid'])
+        self.assertIn('connection reset', first['b.pptx']['error'])
+
+        self.http = FakeSession()
+        self.write_file('d.pptx')
+        client.upload_directory(self.directory)
+
+        self.assertCountEqual(self.http.uploaded, ['b.pptx', 'd.pptx'])
+        second = self.read_manifest()
+        self.assertEqual(second['a.pptx'], first['a.pptx'])
+        self.assertEqual(second['b.pptx']['uid'], 'uid-b.pptx')
+        self.assertEqual(len(second), 4)
+
+
+class TestWaitForUploads(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+        patcher = patch('client.time', SimpleNamespace(monotonic=lambda: self.now, sleep=self.sleep))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def wait(self, http, uids, **kwargs):
+        with patch('client.create_http_session', return_value=http):
+            return client.wait_for_uploads(uids, poll_seconds=5, **kwargs)
+
+    def test_stops_once_every_upload_is_done_or_failed(self):
+        """Finished uploads are no longer polled, and waiting ends when the last one is done or failed."""
+        http = FakeSession(statuses=[{'b': 'done'}, {}, {'a': 'failed'}])
+
+        finished = self.wait(http, ['a', 'b'])
+
+        self.assertEqual(finished, {'a': {'status': 'failed'}, 'b': {'status': 'done'}})
+        self.assertEqual(http.status_requests, [['a', 'b'], ['a'], ['a']])
+        self.assertEqual(self.sleeps, [5, 5])
+
+    def test_gives_up_after_the_timeout(self):
+        """Uploads still pending at the timeout are left out, without sleeping past the deadline."""
+        http = FakeSession(statuses=[{'b': 'done'}])
+
+        finished = self.wait(http, ['a', 'b'], timeout=12)
+
+        self.assertEqual(finished, {'b': {'status': 'done'}})
+        self.assertEqual(self.sleeps, [5, 5, 2])
+        self.assertEqual(len(http.status_requests), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from database import (Base, Upload, User, claim_next_upload, renew_lease, finish_upload, find_upload_by_hash,
+                      get_or_create_user, save_slide_result, load_slide_results, delete_failed_slide_results,
+                      save_partial_explanations, load_partial_explanations, count_slide_results_by_upload, count_uploads_by_status)
+
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def add_upload(self, uid, status='pending', content_hash=None, source_uid=None, **fields):
+        upload = Upload(uid=uid, filename=f"{uid}.pptx", status=status, content_hash=content_hash,
+                        source_uid=source_uid, **fields)
+        self.session.add(upload)
+        self.session.commit()
+        return upload
+
+
+class TestUploadClaims(DatabaseTestCase):
+
+    def test_claim_moves_upload_to_processing(self):
+        """Claiming sets the status, worker id and lease expiry."""
+        self.add_upload('a')
+
+        upload = claim_next_upload(self.session, 'worker-1')
+
+        self.assertEqual(upload.uid, 'a')
+        self.assertEqual(upload.status, 'processing')
+        self.assertEqual(upload.worker_id, 'worker-1')
+        self.assertIsNotNone(upload.lease_expires_at)
+
+    def test_each_upload_is_claimed_once(self):
+        """Two workers never receive the same upload."""
+        self.add_upload('a')
+        self.add_upload('b')
+        other_session = self.Session()
+
+        first = claim_next_upload(self.session, 'worker-1')
+        second = claim_next_upload(other_session, 'worker-2')
+        third = claim_next_upload(self.session, 'worker-1')
+
+        self.assertNotEqual(first.uid, second.uid)
+        self.assertIsNone(third)
+        other_session.close()
+
+    def test_only_lease_holder_can_finish(self):
+        """A worker that does not hold the lease cannot record an outcome."""
+        self.add_upload('a')
+        upload = claim_next_upload(self.session, 'worker-1')
+
+        self.assertFalse(renew_lease(self.session, upload.id, 'worker-2'))
+        self.assertFalse(finish_upload(self.session, upload.id, 'worker-2', 'done'))
+        self.assertTrue(renew_lease(self.session, upload.id, 'worker-1'))
+        self.assertTrue(finish_upload(self.session, upload.id, 'worker-1', 'done'))
+
+        upload = self.session.get(Upload, upload.id)
+        self.assertEqual(upload.status, 'done')
+        self.assertIsNotNone(upload.finish_time)
+        self.assertIsNone(upload.lease_expires_at)
+
+    def test_expired_lease_is_reclaimed(self):
+        """An upload whose worker stopped renewing its lease is claimed by another worker."""
+        self.add_upload('a', status='processing', worker_id='worker-1',
+                        lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+        self.add_upload('b', status='processing', worker_id='worker-1',
+                        lease_expires_at=datetime.utcnow() + timedelta(minutes=5))
+
+        upload = claim_next_upload(self.session, 'worker-2')
+
+        self.assertEqual(upload.uid, 'a')
+        self.assertEqual(upload.worker_id, 'worker-2')
+        self.assertGreater(upload.lease_expires_at, datetime.utcnow())
+        self.assertIsNone(claim_next_upload(self.session, 'worker-3'))
+        self.assertFalse(renew_lease(self.session, upload.id, 'worker-1'))
+        self.assertFalse(finish_upload(self.session, upload.id, 'worker-1', 'done'))
+
+    def test_attached_uploads_follow_their_source(self):
+        """Uploads attached to an identical upload are not claimed and finish with it."""
+        self.add_upload('a', content_hash='hash')
+        self.assertEqual(find_upload_by_hash(self.session, 'hash').uid, 'a')
+        self.add_upload('b', content_hash='hash', source_uid='a')
+
+        upload = claim_next_upload(self.session, 'worker-1')
+        self.assertEqual(upload.uid, 'a')
+        self.assertIsNone(claim_next_upload(self.session, 'worker-1'))
+
+        finish_upload(self.session, upload.id, 'worker-1', 'done')
+        attached = self.session.query(Upload).filter_by(uid='b').one()
+        self.assertEqual(attached.status, 'done')
+        self.assertEqual(attached.result_uid, 'a')
+
+
+    @patch('database.normalize_email', side_effect=str.lower)
+    def test_get_or_create_user_is_idempotent(self, mock_normalize_email):
+        """Looking up a user twice creates a single row."""
+        first = get_or_create_user(self.session, 'Someone@Example.com')
+        other_session = self.Session()
+        second = get_or_create_user(other_session, 'someone@example.com')
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(self.session.query(User).count(), 1)
+        other_session.close()
+
+    def test_upload_queries_are_indexed(self):
+        """The claim and history queries have matching indexes."""
+        indexes = {tuple(index['column_names']) for index in inspect(self.engine).get_indexes('Uploads')}
+
+        self.assertIn(('status', 'upload_time'), indexes)
+        self.assertIn(('user_id', 'upload_time'), indexes)
+
+    def test_slide_results_are_counted_per_upload(self):
+        """Uploads without results are counted as zero."""
+        first = self.add_upload('a')
+        second = self.add_upload('b')
+        save_slide_result(self.session, first.id, 1, 'one')
+        save_slide_result(self.session, first.id, 2, 'two')
+
+        self.assertEqual(count_slide_results_by_upload(self.session, [first.id, second.id]),
+                         {first.id: 2, second.id: 0})
+
+    def test_saved_slide_results_are_kept(self):
+        """Saving a slide twice keeps the first explanation, and saved slides can be loaded for resuming."""
+        upload = self.add_upload('a')
+        save_slide_result(self.session, upload.id, 1, 'one')
+        save_slide_result(self.session, upload.id, 3, 'three')
+        save_slide_result(self.session, upload.id, 1, 'one again')
+
+        self.assertEqual(load_slide_results(self.session, upload.id), {1: 'one', 3: 'three'})
+
+    def test_failed_slide_results_are_retried(self):
+        """Failed slides are not loaded for resuming, and deleting them lets their retry be saved."""
+        upload = self.add_upload('a')
+        save_slide_result(self.session, upload.id, 1, 'one')
+        save_slide_result(self.session, upload.id, 2, 'Failed to process slide: timeout', failed=True)
+
+        self.assertEqual(load_slide_results(self.session, upload.id), {1: 'one'})
+        self.assertEqual(delete_failed_slide_results(self.session, upload.id), 1)
+        save_slide_result(self.session, upload.id, 2, 'two')
+        self.assertEqual(load_slide_results(self.session, upload.id), {1: 'one', 2: 'two'})
+
+    def test_partial_explanations_are_replaced_until_the_slide_is_explained(self):
+        """Only the latest partial text of unexplained slides is loaded, and finishing clears it."""
+        self.add_upload('a')
+        upload = claim_next_upload(self.session, 'worker-1')
+        save_partial_explanations(self.session, {(upload.id, 1): 'On', (upload.id, 2): 'Th'})
+        save_partial_explanations(self.session, {(upload.id, 1): 'One slide'})
+        save_slide_result(self.session, upload.id, 2, 'Two')
+
+        self.assertEqual(load_partial_explanations(self.session, upload.id), {1: 'One slide'})
+        finish_upload(self.session, upload.id, 'worker-1', 'failed', 'stopped')
+        self.assertEqual(load_partial_explanations(self.session, upload.id), {})
+
+    def test_uploads_are_counted_by_status(self):
+        """Every status is reported, including those without uploads."""
+        self.add_upload('a')
+        self.add_upload('b')
+        self.add_upload('c', status='done')
+
+        self.assertEqual(count_uploads_by_status(self.session),
+                         {'pending': 2, 'processing': 0, 'done': 1, 'failed': 0})
+
+
+class TestFairScheduling(DatabaseTestCase):
+
+    def claim_all(self, **kwargs):
+        """Claim and finish uploads one at a time, returning their uids in claim order."""
+        order = []
+        while True:
+            upload = claim_next_upload(self.session, 'worker-1', **kwargs)
+            if upload is None:
+                return order
+            order.append(upload.uid)
+            finish_upload(self.session, upload.id, 'worker-1', 'done')
+
+    def test_users_take_turns(self):
+        """A user with a backlog does not delay another user's later upload until the backlog is done."""
+        start = datetime(2024, 1, 1)
+        for number in range(3):
+            self.add_upload(f"bulk-{number}", user_id=1, upload_time=start + timedelta(minutes=number))
+        self.add_upload('small', user_id=2, upload_time=start + timedelta(minutes=10))
+
+        self.assertEqual(self.claim_all(), ['bulk-0', 'small', 'bulk-1', 'bulk-2'])
+
+    def test_higher_priority_is_claimed_first(self):
+        """Priorities override the turn order, across and within users."""
+        start = datetime(2024, 1, 1)
+        self.add_upload('backfill', user_id=1, upload_time=start, priority=-1)
+        self.add_upload('normal', user_id=1, upload_time=start + timedelta(minutes=1))
+        self.add_upload('urgent', user_id=2, upload_time=start + timedelta(minutes=2), priority=5)
+
+        self.assertEqual(self.claim_all(), ['urgent', 'normal', 'backfill'])
+
+    def test_users_with_slides_in_flight_yield(self):
+        """Users whose decks already occupy workers wait behind users with nothing in processing."""
+        start = datetime(2024, 1, 1)
+        self.add_upload('running', status='processing', user_id=1, total_slides=400, worker_id='worker-2',
+                        lease_expires_at=datetime.utcnow() + timedelta(minutes=5))
+        self.add_upload('bulk', user_id=1, upload_time=start)
+        self.add_upload('small', user_id=2, upload_time=start + timedelta(minutes=1))
+
+        self.assertEqual(claim_next_upload(self.session, 'worker-1').uid, 'small')
+
+    def test_skipped_users_are_not_claimed(self):
+        """Uploads of skipped users, including anonymous ones, stay pending."""
+        self.add_upload('anonymous')
+        self.add_upload('bulk', user_id=1)
+        self.add_upload('small', user_id=2)
+
+        self.assertEqual(self.claim_all(skip_users={None, 1}), ['small'])
+        self.assertEqual(self.claim_all(), ['anonymous', 'bulk'])
+
+    def test_users_at_the_slide_cap_are_skipped(self):
+        """Capped users get no further uploads until their slides in processing finish."""
+        self.add_upload('running', status='processing', user_id=1, total_slides=400, worker_id='worker-2',
+                        lease_expires_at=datetime.utcnow() + timedelta(minutes=5))
+        self.add_upload('bulk', user_id=1)
+
+        self.assertIsNone(claim_next_upload(self.session, 'worker-1', max_user_slides=100))
+        self.assertEqual(claim_next_upload(self.session, 'worker-1').uid, 'bulk')
+
+    def test_decks_larger_than_the_cap_are_still_processed(self):
+        """A user with nothing in processing can always claim one upload."""
+        self.add_upload('huge', user_id=1, total_slides=1000)
+
+        self.assertEqual(claim_next_upload(self.session, 'worker-1', max_user_slides=100).uid, 'huge')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,21 @@
+import os
+import json
+import asyncio
+import tempfile
 import unittest
-from unittest.mock import patch, AsyncMock
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
 from pptx import Presentation
-from explainer import combine_slide_text, process_slide, process_presentations
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import (Base, Upload, PartialExplanation, save_slide_result, load_slide_results, claim_next_upload,
+                      finish_upload, set_total_slides, delete_failed_slide_results)
+from metrics import Registry, start_http_server
+from explainer import combine_slide_text, process_slide, SlidePipeline, start_metrics_server
 
-class TestExplainer(unittest.TestCase):
+class TestExplainer(unittest.IsolatedAsyncioTestCase):
 
     def test_combine_slide_text_with_content(self):
         """Test combine_slide_text with a slide containing text shapes."""
@@ -19,7 +31,7 @@ class TestExplainer(unittest.TestCase):
         p.text = "world"
 
         combined_text = combine_slide_text(slide)
-        self.assertEqual(combined_text, "Hello world")
+        self.assertEqual(combined_text, "Hello\nworld")
 
     def test_combine_slide_text_no_content(self):
         """Test combine_slide_text with a slide containing no text shapes."""
@@ -30,9 +42,8 @@ class TestExplainer(unittest.TestCase):
         combined_text = combine_slide_text(slide)
         self.assertEqual(combined_text, "")
 
-    @patch('explainer.generate_prompt', return_value="test_prompt")
-    @patch('explainer.fetch_explanation', new_callable=AsyncMock, return_value="test_explanation")
-    async def test_process_slide_with_content(self, mock_fetch_explanation, mock_generate_prompt):
+    @patch('explainer.explain_slide', new_callable=AsyncMock, return_value="test_explanation")
+    async def test_process_slide_with_content(self, mock_explain_slide):
         """Test process_slide with a slide containing text."""
         prs = Presentation()
         slide_layout = prs.slide_layouts[5]
@@ -57,18 +68,249 @@ class TestExplainer(unittest.TestCase):
         explanation = await process_slide(slide, client)
         self.assertEqual(explanation, "No text content")
 
-    @patch('explainer.os.listdir', return_value=['test.pptx'])
-    @patch('explainer.Presentation')
-    @patch('explainer.process_slide', new_callable=AsyncMock, return_value="test_explanation")
-    @patch('explainer.openai.AsyncClient')
-    async def test_process_presentations(self, mock_openai_client, mock_process_slide, mock_presentation, mock_listdir):
-        """Test process_presentations to ensure it processes files correctly."""
-        mock_presentation_instance = mock_presentation.return_value
-        mock_presentation_instance.slides = [AsyncMock()]
-
-        await process_presentations()
-        mock_openai_client.assert_called_once()
-        mock_process_slide.assert_awaited()
+    def test_metrics_server_moves_to_the_next_free_port(self):
+        """A second worker on the same host serves its metrics on another port instead of none."""
+        taken = start_http_server(0, Registry())
+        self.addCleanup(taken.server_close)
+        self.addCleanup(taken.shutdown)
+        port = taken.server_address[1]
+
+        server = start_metrics_server(port, port_range=16)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.assertIn(server.server_address[1], range(port + 1, port + 16))
+
+class TestSlidePipeline(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.outputs = tempfile.TemporaryDirectory()
+        self.slides = {'slow.pptx': ["fast", "fast", "slow"], 'small.pptx': ["fast", "fast"], 'empty.pptx': []}
+        # Idle claims sleep briefly instead of waiting for a notification
+        self.wakeup = SimpleNamespace(generation=0, wait=lambda generation, timeout: asyncio.sleep(0.01))
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.outputs.cleanup()
+
+    async def explain(self, slide_text, *args):
+        await asyncio.sleep(0.5 if slide_text == 'slow' else 0.01)
+        return f"explained {slide_text}", False
+
+    async def run_until_finished(self, uids):
+        pipeline = SlidePipeline('worker-1', MagicMock(), MagicMock(), MagicMock(), MagicMock(), None,
+                                 self.wakeup, max_decks=1, dispatchers=4, queue_size=2, partial_flush_seconds=0.01,
+                                 session=self.session)
+        task = asyncio.create_task(pipeline.run())
+        try:
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                self.session.expire_all()
+                uploads = self.session.query(Upload).filter(Upload.uid.in_(uids)).all()
+                if all(upload.finish_time for upload in uploads):
+                    return {upload.uid: upload for upload in uploads}
+            self.fail("The pipeline did not finish every upload")
+        finally:
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+    async def test_next_deck_does_not_wait_for_stragglers(self):
+        """A deck claimed after another finishes first when the earlier deck has a slow last slide."""
+        for uid in ('slow', 'small', 'empty'):
+            self.session.add(Upload(uid=uid, filename=f"{uid}.pptx", status='pending'))
+        self.session.commit()
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', side_effect=self.explain), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['slow', 'small', 'empty'])
+
+        self.assertTrue(all(upload.status == 'done' for upload in uploads.values()))
+        self.assertLess(uploads['small'].finish_time, uploads['slow'].finish_time)
+        with open(os.path.join(self.outputs.name, 'slow.json')) as f:
+            self.assertEqual(json.load(f), ["explained fast", "explained fast", "explained slow"])
+        with open(os.path.join(self.outputs.name, 'empty.json')) as f:
+            self.assertEqual(json.load(f), [])
+
+    async def test_reclaimed_deck_only_sends_missing_slides(self):
+        """A deck left behind by a crashed worker is resumed from its saved slide results."""
+        upload = Upload(uid='slow', filename='slow.pptx', status='processing', worker_id='crashed-worker',
+                        lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+        self.session.add(upload)
+        self.session.commit()
+        save_slide_result(self.session, upload.id, 1, "saved before the crash")
+        explain = AsyncMock(side_effect=self.explain)
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', explain), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['slow'])
+
+        self.assertEqual(uploads['slow'].status, 'done')
+        self.assertEqual([call.args[0] for call in explain.await_args_list], ["fast", "slow"])
+        with open(os.path.join(self.outputs.name, 'slow.json')) as f:
+            self.assertEqual(json.load(f), ["saved before the crash", "explained fast", "explained slow"])
+
+    async def test_reclaimed_deck_retries_failed_slides(self):
+        """Slides that failed before the crash are explained again when the deck is resumed."""
+        upload = Upload(uid='slow', filename='slow.pptx', status='processing', worker_id='crashed-worker',
+                        lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+        self.session.add(upload)
+        self.session.commit()
+        save_slide_result(self.session, upload.id, 1, "saved before the crash")
+        save_slide_result(self.session, upload.id, 2, "Failed to process slide: timed out", failed=True)
+        explain = AsyncMock(side_effect=self.explain)
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', explain), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['slow'])
+
+        self.assertEqual(uploads['slow'].status, 'done')
+        self.assertEqual([call.args[0] for call in explain.await_args_list], ["fast", "slow"])
+        with open(os.path.join(self.outputs.name, 'slow.json')) as f:
+            self.assertEqual(json.load(f), ["saved before the crash", "explained fast", "explained slow"])
+
+    async def test_failed_slide_is_saved_as_failed(self):
+        """A slide that could not be explained appears in the output but is marked for a retry."""
+        self.session.add(Upload(uid='small', filename='small.pptx', status='pending'))
+        self.session.commit()
+        explain = AsyncMock(side_effect=[("explained fast", False), ("Failed to process slide: timed out", True)])
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', explain), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['small'])
+
+        self.assertEqual(uploads['small'].status, 'done')
+        self.assertEqual(load_slide_results(self.session, uploads['small'].id), {1: "explained fast"})
+        with open(os.path.join(self.outputs.name, 'small.json')) as f:
+            self.assertEqual(json.load(f), ["explained fast", "Failed to process slide: timed out"])
+
+    async def test_streamed_text_is_saved_until_the_slide_is_explained(self):
+        """Partial text of a slide that is still being generated is readable from the database meanwhile."""
+        self.session.add(Upload(uid='slow', filename='slow.pptx', status='pending'))
+        self.session.commit()
+        seen = []
+
+        async def explain(slide_text, client, cache, limiter, batcher, on_partial, router):
+            on_partial(f"explaining {slide_text}")
+            await asyncio.sleep(0.2)
+            self.session.expire_all()
+            seen.extend(partial.text for partial in self.session.query(PartialExplanation).all())
+            return f"explained {slide_text}", False
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', side_effect=explain), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['slow'])
+
+        self.assertEqual(uploads['slow'].status, 'done')
+        self.assertIn("explaining slow", seen)
+        self.assertEqual(self.session.query(PartialExplanation).count(), 0)
+
+    async def test_failed_extraction_fails_only_that_deck(self):
+        """A deck that cannot be parsed is marked failed while the others are processed."""
+        for uid in ('broken', 'small'):
+            self.session.add(Upload(uid=uid, filename=f"{uid}.pptx", status='pending'))
+        self.session.commit()
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', side_effect=self.explain), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['broken', 'small'])
+
+        self.assertEqual(uploads['broken'].status, 'failed')
+        self.assertIn('broken.pptx', uploads['broken'].error_message)
+        self.assertEqual(uploads['small'].status, 'done')
+
+
+    async def test_locked_database_delays_the_claim(self):
+        """A claim that fails because the database is locked is retried instead of stopping the worker."""
+        self.session.add(Upload(uid='small', filename='small.pptx', status='pending'))
+        self.session.commit()
+        attempts = []
+
+        def locked_once(*args, **kwargs):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise OperationalError("UPDATE", {}, Exception("database is locked"))
+            return claim_next_upload(*args, **kwargs)
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', side_effect=self.explain), \
+                patch('explainer.claim_next_upload', side_effect=locked_once), \
+                patch('explainer.DATABASE_RETRY_SECONDS', 0.01), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['small'])
+
+        self.assertEqual(uploads['small'].status, 'done')
+        self.assertGreater(len(attempts), 1)
+
+    async def test_locked_database_does_not_fail_the_parsed_deck(self):
+        """Saving the slide count and loading the saved slides of a deck are retried while the database is locked."""
+        self.session.add(Upload(uid='small', filename='small.pptx', status='pending'))
+        self.session.commit()
+
+        def locked_once(call):
+            calls = []
+
+            def locked(*args, **kwargs):
+                calls.append(args)
+                if len(calls) == 1:
+                    raise OperationalError("UPDATE", {}, Exception("database is locked"))
+                return call(*args, **kwargs)
+            return locked
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', side_effect=self.explain), \
+                patch('explainer.set_total_slides', side_effect=locked_once(set_total_slides)), \
+                patch('explainer.delete_failed_slide_results', side_effect=locked_once(delete_failed_slide_results)), \
+                patch('explainer.load_slide_results', side_effect=locked_once(load_slide_results)), \
+                patch('explainer.DATABASE_RETRY_SECONDS', 0.01), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['small'])
+
+        self.assertEqual(uploads['small'].status, 'done')
+        self.assertEqual(uploads['small'].total_slides, 2)
+        with open(os.path.join(self.outputs.name, 'small.json')) as f:
+            self.assertEqual(json.load(f), ["explained fast", "explained fast"])
+
+    async def test_unrecorded_outcome_stays_with_that_deck(self):
+        """A deck whose outcome cannot be saved is left to be reclaimed while the others are processed."""
+        for uid in ('slow', 'small'):
+            self.session.add(Upload(uid=uid, filename=f"{uid}.pptx", status='pending'))
+        self.session.commit()
+        slow_id = self.session.query(Upload).filter_by(uid='slow').one().id
+
+        def locked_for_slow(session, upload_id, *args):
+            if upload_id == slow_id:
+                raise OperationalError("UPDATE", {}, Exception("database is locked"))
+            return finish_upload(session, upload_id, *args)
+
+        with patch('explainer.extract_slide_texts', side_effect=lambda path: self.slides[os.path.basename(path)]), \
+                patch('explainer.process_slide_text', side_effect=self.explain), \
+                patch('explainer.finish_upload', side_effect=locked_for_slow), \
+                patch('explainer.DATABASE_RETRY_SECONDS', 0.01), \
+                patch('explainer.notify_status_change'), \
+                patch('explainer.OUTPUTS_FOLDER', self.outputs.name):
+            uploads = await self.run_until_finished(['small'])
+
+        self.assertEqual(uploads['small'].status, 'done')
+        self.assertEqual(self.session.get(Upload, slow_id).status, 'processing')
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+from explanation_cache import ExplanationCache, make_cache_key, normalize_slide_text
+
+
+class TestExplanationCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ExplanationCache(os.path.join(self.tmp_dir.name, 'cache.db'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_key_ignores_whitespace_differences(self):
+        """Slides that differ only in whitespace share a cache key."""
+        key_a = make_cache_key("Hello   world\n", "model", "system", "prompt")
+        key_b = make_cache_key(" Hello world", "model", "system", "prompt")
+        self.assertEqual(key_a, key_b)
+        self.assertEqual(normalize_slide_text(" Hello \t world\n"), "Hello world")
+
+    def test_key_depends_on_model_and_prompts(self):
+        """Changing the model or prompt template invalidates the key."""
+        base = make_cache_key("text", "model", "system", "prompt")
+        self.assertNotEqual(base, make_cache_key("text", "other-model", "system", "prompt"))
+        self.assertNotEqual(base, make_cache_key("text", "model", "other system", "prompt"))
+        self.assertNotEqual(base, make_cache_key("text", "model", "system", "other prompt"))
+
+    async def test_get_or_fetch_counts_hits_and_misses(self):
+        """A second request for the same key is served from the cache."""
+        fetch = AsyncMock(return_value="explanation")
+
+        first = await self.cache.get_or_fetch("key", fetch)
+        second = await self.cache.get_or_fetch("key", fetch)
+
+        self.assertEqual(first, "explanation")
+        self.assertEqual(second, "explanation")
+        fetch.assert_awaited_once()
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    async def test_concurrent_duplicates_share_one_fetch(self):
+        """Duplicate keys requested concurrently result in a single fetch."""
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "explanation"
+
+        results = await asyncio.gather(*[self.cache.get_or_fetch("key", fetch) for _ in range(5)])
+
+        self.assertEqual(results, ["explanation"] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(self.cache.stats()['coalesced'], 4)
+
+    async def test_cancelled_fetch_is_taken_over_by_a_waiter(self):
+        """Cancelling the caller running the fetch does not cancel the callers waiting on it."""
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05 if calls == 1 else 0.01)
+            return "explanation"
+
+        leader = asyncio.create_task(self.cache.get_or_fetch("key", fetch))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(self.cache.get_or_fetch("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        results = await asyncio.gather(*waiters)
+
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(results, ["explanation"] * 3)
+        self.assertEqual(calls, 2)
+
+    async def test_failed_fetch_is_not_cached(self):
+        """Errors propagate to every waiter and leave no entry behind."""
+        fetch = AsyncMock(side_effect=RuntimeError("boom"))
+
+        with self.assertRaises(RuntimeError):
+            await self.cache.get_or_fetch("key", fetch)
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_expired_entries_are_misses(self):
+        """Entries older than max_age_seconds are not returned."""
+        self.cache.max_age_seconds = -1
+        self.cache.set("key", "explanation")
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_evict_trims_least_recently_used(self):
+        """Eviction removes the least recently used entries first."""
+        self.cache.max_size_bytes = 10
+        self.cache.set("old", "a" * 6)
+        self.cache.set("new", "b" * 6)
+        self.cache.evict()
+        self.assertIsNone(self.cache.get("old"))
+        self.assertEqual(self.cache.get("new"), "b" * 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
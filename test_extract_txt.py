@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from pptx import Presentation
+from pptx.util import Inches
+from extract_txt import (extract_slide_texts, extract_slide_texts_pptx, extract_slide_texts_fast,
+                         extract_text_from_presentation)
+
+
+class TestExtractors(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'deck.pptx')
+
+        prs = Presentation()
+        layout = prs.slide_layouts[5]
+
+        first = prs.slides.add_slide(layout)
+        first.shapes.title.text = "Title"
+        text_frame = first.shapes.add_textbox(0, 0, Inches(4), Inches(1)).text_frame
+        text_frame.text = "Line one\vstill one"
+        text_frame.add_paragraph().text = "Paragraph two"
+        first.notes_slide.notes_text_frame.text = "Remember this"
+
+        second = prs.slides.add_slide(layout)
+        table = second.shapes.add_table(2, 2, 0, 0, Inches(4), Inches(1)).table
+        for row_index, row in enumerate(table.rows):
+            for column_index, cell in enumerate(row.cells):
+                cell.text = f"cell {row_index}{column_index}"
+        group = second.shapes.add_group_shape()
+        group.shapes.add_textbox(0, 0, Inches(1), Inches(1)).text_frame.text = "grouped"
+
+        prs.slides.add_slide(layout)  # A slide without any text
+
+        # Move the last slide to the front to check that presentation order is kept
+        slide_ids = prs.slides._sldIdLst
+        slide_ids.insert(0, slide_ids[-1])
+
+        prs.save(self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_pptx_extractor_covers_groups_tables_and_notes(self):
+        """Groups, table cells and speaker notes are all part of the slide text."""
+        texts = extract_slide_texts_pptx(self.path)
+
+        self.assertEqual(texts[0], "")
+        self.assertEqual(texts[1], "Title Line one\vstill one\nParagraph two\n\nSpeaker notes: Remember this")
+        self.assertEqual(texts[2], "cell 00 cell 01 cell 10 cell 11 grouped")
+
+    def test_fast_extractor_matches_pptx_extractor(self):
+        """The streaming extractor produces exactly the same text per slide."""
+        self.assertEqual(extract_slide_texts_fast(self.path), extract_slide_texts_pptx(self.path))
+
+    def test_extractor_is_selectable(self):
+        """extract_slide_texts dispatches to the requested extractor."""
+        self.assertEqual(extract_slide_texts(self.path, 'fast'), extract_slide_texts_pptx(self.path))
+        with self.assertRaises(ValueError):
+            extract_slide_texts(self.path, 'unknown')
+
+    def test_extract_text_from_presentation_skips_empty_slides(self):
+        """Only slides with text are returned, prefixed with their slide number."""
+        texts = extract_text_from_presentation(self.path)
+
+        self.assertEqual(len(texts), 2)
+        self.assertTrue(texts[0].startswith("Slide 2: Title"))
+        self.assertTrue(texts[1].startswith("Slide 3: cell 00"))
+
+
+if __name__ == '__main__':
+    unittest.main()
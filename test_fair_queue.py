@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+from fair_queue import FairQueue
+
+
+class TestFairQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def test_owners_take_turns(self):
+        """Items are handed out round-robin across owners, oldest first per owner."""
+        queue = FairQueue(10)
+        for number in range(3):
+            await queue.put('bulk', f"bulk-{number}")
+        await queue.put('interactive', 'interactive-0')
+
+        items = [await queue.get() for _ in range(4)]
+
+        self.assertEqual(items, ['bulk-0', 'interactive-0', 'bulk-1', 'bulk-2'])
+        self.assertEqual(len(queue), 0)
+
+    async def test_full_owner_does_not_block_others(self):
+        """put() waits only for the owner whose share is full."""
+        queue = FairQueue(1)
+        await queue.put('bulk', 'bulk-0')
+        blocked = asyncio.create_task(queue.put('bulk', 'bulk-1'))
+        await asyncio.sleep(0)
+
+        await asyncio.wait_for(queue.put('interactive', 'interactive-0'), 1)
+        self.assertFalse(blocked.done())
+
+        self.assertEqual(await queue.get(), 'bulk-0')
+        await asyncio.wait_for(blocked, 1)
+        self.assertEqual(len(queue), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,55 @@ import os
 import asyncio
 import pytest
 import json
+from types import SimpleNamespace
 from main import execute_main
+from unittest.mock import patch
+from gpt_explainer import (SlideBatcher, BATCH_PROMPT_INTRODUCTION, parse_batch_response, process_all_slides,
+                           explain_slide, create_chat_completion)
+from rate_limiter import request_owner
+from model_router import ModelRouter
+
+
+class FakeClient:
+    """Stand-in for openai.AsyncOpenAI that records requests, answers batch prompts and streams word by word."""
+
+    def __init__(self, batch_answer=None):
+        self.requests = []
+        self.models = []
+        self.batch_answer = batch_answer
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, model, **kwargs):
+        self.requests.append(kwargs)
+        self.models.append(model)
+        prompt = messages[-1]["content"]
+        if "response_format" in kwargs:
+            slides = json.loads(prompt[len(BATCH_PROMPT_INTRODUCTION):])
+            answer = self.batch_answer or json.dumps(
+                {"explanations": [{"id": slide["id"], "explanation": f"about {slide['content']}"}
+                                  for slide in slides]})
+        else:
+            answer = f"single {prompt.rsplit(chr(10), 1)[-1]}"
+        if kwargs.get("stream"):
+            return FakeStream(answer)
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+
+class FakeStream:
+    """Stand-in for openai.AsyncStream that yields an answer word by word."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.closed = False
+
+    async def __aiter__(self):
+        for index, word in enumerate(self.answer.split(" ")):
+            delta = SimpleNamespace(content=word if index == 0 else " " + word)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+        yield SimpleNamespace(usage=None, choices=[])
+
+    async def close(self):
+        self.closed = True
 
 
 @pytest.fixture
@@ -61,5 +109,143 @@ async def test_gpt_explainer(sample_presentation_path, output_json_path):
     os.remove(output_json_path)
 
 
+
+def test_parse_batch_response_requires_one_explanation_per_slide():
+    answer = json.dumps({"explanations": [{"id": 2, "explanation": "b"}, {"id": 1, "explanation": "a"}]})
+    assert parse_batch_response(answer, 2) == ["a", "b"]
+    assert parse_batch_response(answer, 3) is None
+    assert parse_batch_response("not json", 2) is None
+
+
+@pytest.mark.asyncio
+async def test_small_slides_share_one_request():
+    client = FakeClient()
+    batcher = SlideBatcher(client, max_slides=3)
+
+    explanations = await process_all_slides(client, ["a", "b", "c", "d"], batcher=batcher)
+
+    assert explanations == ["about a", "about b", "about c", "single d"]
+    assert len(client.requests) == 2
+    assert batcher.stats() == {"batches": 1, "batched_slides": 3, "fallbacks": 0}
+
+
+@pytest.mark.asyncio
+async def test_unparsable_batch_falls_back_to_single_requests():
+    client = FakeClient(batch_answer="Sorry, here is some prose instead.")
+    batcher = SlideBatcher(client)
+
+    explanations = await process_all_slides(client, ["a", "b"], batcher=batcher)
+
+    assert explanations == ["single a", "single b"]
+    assert batcher.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slides_of_different_owners_are_not_batched_together():
+    client = FakeClient()
+    batcher = SlideBatcher(client)
+
+    async def explain_as(owner, slides):
+        request_owner.set(owner)
+        return await process_all_slides(client, slides, batcher=batcher)
+
+    explanations = await asyncio.gather(explain_as("bulk", ["a", "b"]), explain_as("interactive", ["c", "d"]))
+
+    assert explanations == [["about a", "about b"], ["about c", "about d"]]
+    assert batcher.stats() == {"batches": 2, "batched_slides": 4, "fallbacks": 0}
+
+
+@pytest.mark.asyncio
+async def test_large_slides_are_not_batched():
+    client = FakeClient()
+    batcher = SlideBatcher(client, token_budget=10)
+
+    explanations = await process_all_slides(client, ["x" * 100, "y" * 100], batcher=batcher)
+
+    assert explanations == ["single " + "x" * 100, "single " + "y" * 100]
+    assert batcher.stats()["batches"] == 0
+
+
+@pytest.mark.asyncio
+async def test_streamed_explanation_reports_partial_text():
+    client = FakeClient()
+    partials = []
+
+    with patch("gpt_explainer.STREAM_RESPONSES", True):
+        explanation = await explain_slide(client, "a b", on_partial=partials.append)
+
+    assert explanation == "single a b"
+    assert partials == ["single", "single a", "single a b"]
+    assert client.requests[0]["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_streamed_batches_are_parsed_without_partial_text():
+    client = FakeClient()
+    batcher = SlideBatcher(client)
+    partials = []
+
+    with patch("gpt_explainer.STREAM_RESPONSES", True):
+        explanations = await asyncio.gather(*(explain_slide(client, slide, batcher=batcher, on_partial=partials.append)
+                                              for slide in ["a", "b"]))
+
+    assert explanations == ["about a", "about b"]
+    assert partials == []
+
+@pytest.mark.asyncio
+async def test_short_slides_are_routed_to_the_fast_model():
+    client = FakeClient()
+    router = ModelRouter("main", fast_model="fast", short_prompt_tokens=100, fallback_model=None)
+
+    await explain_slide(client, "short", router=router)
+    await explain_slide(client, "long " * 200, router=router)
+
+    assert client.models == ["fast", "main"]
+    assert all(request["timeout"] > 0 for request in client.requests)
+
+
+@pytest.mark.asyncio
+async def test_partial_text_follows_the_hedge_that_overtakes_a_stalled_stream():
+    class StallingClient(FakeClient):
+        async def create(self, messages, model, **kwargs):
+            self.models.append(model)
+            if len(self.models) == 1:
+                return PacedStream("stalled forever", pause=10)
+            return PacedStream("a much longer answer", pause=0.01)
+
+    class PacedStream(FakeStream):
+        def __init__(self, answer, pause):
+            super().__init__(answer)
+            self.pause = pause
+
+        async def __aiter__(self):
+            async for chunk in super().__aiter__():
+                yield chunk
+                await asyncio.sleep(self.pause)
+
+    client = StallingClient()
+    router = ModelRouter("main", fast_model=None, fallback_model=None, min_samples=1)
+    router.record_success("main", 0.05)
+    partials = []
+
+    response = await create_chat_completion(client, [{"role": "user", "content": "slide"}], 10, stream=True,
+                                            on_partial=partials.append, router=router)
+
+    assert response.choices[0].message.content == "a much longer answer"
+    assert partials == ["stalled", "a much longer", "a much longer answer"]
+
+
+@pytest.mark.asyncio
+async def test_oversized_slide_is_explained_in_chunks():
+    client = FakeClient()
+    slide = "\n\n".join(f"Row {i}: " + "value " * 50 for i in range(20))
+
+    with patch("gpt_explainer.MAX_PROMPT_TOKENS", 200):
+        explanation = await explain_slide(client, slide)
+
+    assert len(client.requests) > 1
+    assert explanation.count("single ") == len(client.requests)
+
+
 if __name__ == "__main__":
     pytest.main()
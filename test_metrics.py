@@ -0,0 +1,83 @@
+import unittest
+import urllib.request
+from metrics import Registry, Counter, Gauge, Histogram, start_http_server
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_renders_one_sample_per_label_set(self):
+        """Counters accumulate separately for every combination of label values."""
+        counter = Counter('jobs_total', 'Finished jobs.', ['status'], registry=self.registry)
+        counter.inc(status='done')
+        counter.inc(2, status='done')
+        counter.inc(status='failed')
+
+        self.assertEqual(self.registry.render(),
+                         '# HELP jobs_total Finished jobs.\n'
+                         '# TYPE jobs_total counter\n'
+                         'jobs_total{status="done"} 3.0\n'
+                         'jobs_total{status="failed"} 1.0\n')
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Each bucket counts the observations up to its bound, followed by the sum and count."""
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1), registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        samples = self.registry.render().splitlines()[2:]
+        self.assertEqual(samples, [
+            'latency_seconds_bucket{le="0.1"} 2.0',
+            'latency_seconds_bucket{le="1.0"} 3.0',
+            'latency_seconds_bucket{le="+Inf"} 4.0',
+            'latency_seconds_sum 3.65',
+            'latency_seconds_count 4.0',
+        ])
+
+    def test_gauge_function_is_called_on_render(self):
+        """A gauge with a function reports its current result."""
+        gauge = Gauge('queue_depth', 'Queue depth.', ['status'], registry=self.registry)
+        depth = {'pending': 1}
+        gauge.set_function(lambda: depth)
+        depth['pending'] = 5
+
+        self.assertIn('queue_depth{status="pending"} 5.0', self.registry.render())
+
+    def test_failing_gauge_function_does_not_break_rendering(self):
+        """Other metrics are still rendered when a gauge cannot be computed."""
+        gauge = Gauge('queue_depth', 'Queue depth.', ['status'], registry=self.registry)
+        gauge.set_function(lambda: 1 / 0)
+        Counter('jobs_total', 'Finished jobs.', registry=self.registry).inc()
+
+        self.assertIn('jobs_total 1.0', self.registry.render())
+
+    def test_label_values_are_escaped(self):
+        """Quotes, backslashes and newlines in label values are escaped."""
+        counter = Counter('errors_total', 'Errors.', ['message'], registry=self.registry)
+        counter.inc(message='say "hi"\\\n')
+
+        self.assertIn(r'errors_total{message="say \"hi\"\\\n"} 1.0', self.registry.render())
+
+    def test_wrong_labels_are_rejected(self):
+        """Observations must name exactly the metric's labels."""
+        counter = Counter('jobs_total', 'Finished jobs.', ['status'], registry=self.registry)
+
+        with self.assertRaises(ValueError):
+            counter.inc(outcome='done')
+
+    def test_http_server_serves_metrics(self):
+        """The background server exposes the registry at /metrics."""
+        Counter('jobs_total', 'Finished jobs.', registry=self.registry).inc()
+        server = start_http_server(0, self.registry, host='127.0.0.1')
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertIn('jobs_total 1.0', response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
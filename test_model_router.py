@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from model_router import ModelRouter, hedge
+
+
+class TestHedge(unittest.IsolatedAsyncioTestCase):
+
+    async def test_duplicate_wins_and_the_slow_call_is_cancelled(self):
+        """A call still running after the delay is duplicated, and the first answer wins."""
+        delays = [10, 0]
+        started = []
+        cancelled = []
+
+        async def call(sent):
+            number = len(started)
+            started.append(number)
+            sent.set()
+            try:
+                await asyncio.sleep(delays[number])
+            except asyncio.CancelledError:
+                cancelled.append(number)
+                raise
+            return number
+
+        self.assertEqual(await asyncio.wait_for(hedge(call, 0.01), 1), 1)
+        self.assertEqual(cancelled, [0])
+
+    async def test_delay_starts_once_the_request_is_sent(self):
+        """Time spent waiting to send the request, e.g. for the rate limiter, is not hedged."""
+        calls = []
+
+        async def call(sent):
+            calls.append(1)
+            await asyncio.sleep(0.1)  # Queued behind other requests
+            sent.set()
+            await asyncio.sleep(0.01)
+            return 'answer'
+
+        self.assertEqual(await hedge(call, 0.05), 'answer')
+        self.assertEqual(len(calls), 1)
+
+    async def test_fast_call_is_not_duplicated(self):
+        """Calls answering within the delay, or without a delay, are sent once."""
+        calls = []
+
+        async def call(sent):
+            calls.append(1)
+            return 'answer'
+
+        self.assertEqual(await hedge(call, 1), 'answer')
+        self.assertEqual(await hedge(call, None), 'answer')
+        self.assertEqual(len(calls), 2)
+
+    async def test_original_answers_when_the_duplicate_fails(self):
+        """A failing duplicate does not fail a call whose original still answers."""
+        started = []
+
+        async def call(sent):
+            started.append(1)
+            sent.set()
+            if len(started) == 2:
+                raise RuntimeError("duplicate failed")
+            await asyncio.sleep(0.05)
+            return 'original'
+
+        self.assertEqual(await hedge(call, 0.01), 'original')
+
+        async def failing(sent):
+            raise RuntimeError("failed")
+
+        with self.assertRaises(RuntimeError):
+            await hedge(failing, 0.01)
+
+
+class TestModelRouter(unittest.TestCase):
+
+    def test_short_prompts_go_to_the_fast_model(self):
+        router = ModelRouter('main', fast_model='fast', short_prompt_tokens=100)
+
+        self.assertEqual(router.choose(100), 'fast')
+        self.assertEqual(router.choose(101), 'main')
+        self.assertEqual(ModelRouter('main', fast_model=None).choose(1), 'main')
+
+    def test_failing_model_falls_back_until_the_cooldown_ends(self):
+        """Repeated failures switch to the fallback model, which is left again after the cooldown."""
+        router = ModelRouter('main', fast_model=None, fallback_model='backup', failure_threshold=2,
+                             cooldown_seconds=30)
+        router.record_failure('main')
+        self.assertEqual(router.choose(1), 'main')
+        router.record_failure('main')
+        self.assertEqual(router.choose(1), 'backup')
+
+        with patch('model_router.time.monotonic', return_value=router._avoid_until['main'] + 1):
+            self.assertEqual(router.choose(1), 'main')
+        self.assertEqual(router.stats()['fallbacks'], 1)
+
+    def test_success_resets_the_failure_count(self):
+        router = ModelRouter('main', fast_model=None, fallback_model='backup', failure_threshold=2)
+        router.record_failure('main')
+        router.record_success('main', 1.0)
+        router.record_failure('main')
+
+        self.assertEqual(router.choose(1), 'main')
+
+    def test_hedge_delay_follows_the_latency_quantile(self):
+        """Requests are hedged only once enough latencies are known, after their 95th percentile."""
+        router = ModelRouter('main', fast_model=None, hedge_quantile=0.95, min_samples=20)
+        for latency in range(1, 20):
+            router.record_success('main', latency)
+        self.assertIsNone(router.hedge_delay('main'))
+
+        router.record_success('main', 20)
+        self.assertEqual(router.hedge_delay('main'), 20)
+        for latency in range(21, 101):
+            router.record_success('main', latency)
+        self.assertEqual(router.hedge_delay('main'), 96)
+        self.assertIsNone(ModelRouter('main', hedge_quantile=0).hedge_delay('main'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import socket
+import asyncio
+import tempfile
+import threading
+import unittest
+from notifier import (WakeupListener, StatusListener, AsyncStatusListener, notify_workers, notify_status_change,
+                      notifications_supported)
+
+
+@unittest.skipUnless(notifications_supported(), "Unix sockets are not available")
+class TestNotifier(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.listener = WakeupListener(self.tmp_dir.name)
+        self.listener.start()
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        self.tmp_dir.cleanup()
+
+    async def test_notification_wakes_listener(self):
+        """A notification sent after the snapshot ends the wait early."""
+        generation = self.listener.generation
+
+        self.assertEqual(notify_workers(self.tmp_dir.name), 1)
+
+        self.assertTrue(await self.listener.wait(generation, timeout=5))
+        self.assertEqual(self.listener.generation, generation + 1)
+
+    async def test_wait_times_out_without_notification(self):
+        """Without a notification the wait falls back to the timeout."""
+        self.assertFalse(await self.listener.wait(self.listener.generation, timeout=0.01))
+
+    async def test_stale_sockets_are_removed(self):
+        """Sockets whose worker is gone are cleaned up instead of notified."""
+        stale_path = os.path.join(self.tmp_dir.name, 'explainer-0.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as stale:
+            stale.bind(stale_path)
+
+        self.assertEqual(notify_workers(self.tmp_dir.name), 1)
+        self.assertFalse(os.path.exists(stale_path))
+
+    async def test_close_removes_socket(self):
+        """Closing the listener removes its socket file."""
+        self.listener.close()
+        self.assertFalse(os.path.exists(self.listener.path))
+
+
+@unittest.skipUnless(notifications_supported(), "Unix sockets are not available")
+class TestStatusListener(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.listener = StatusListener(self.tmp_dir.name)
+        self.listener.start()
+
+    def tearDown(self):
+        self.listener.close()
+        self.tmp_dir.cleanup()
+
+    def test_change_of_the_upload_ends_the_wait(self):
+        """A notification for the awaited upload wakes the waiting thread."""
+        generation = self.listener.generation
+        timer = threading.Timer(0.05, notify_status_change, args=('uid-1', self.tmp_dir.name))
+        timer.start()
+
+        self.assertTrue(self.listener.wait('uid-1', generation, timeout=5))
+        timer.join()
+
+    def test_change_of_another_upload_is_ignored(self):
+        """Notifications for other uploads do not end the wait."""
+        generation = self.listener.generation
+        notify_status_change('uid-2', self.tmp_dir.name)
+
+        self.assertFalse(self.listener.wait('uid-1', generation, timeout=0.1))
+
+    def test_change_before_the_wait_is_not_lost(self):
+        """A change between the snapshot and the wait returns immediately."""
+        generation = self.listener.generation
+        notify_status_change('uid-1', self.tmp_dir.name)
+
+        self.assertTrue(self.listener.wait('uid-1', generation, timeout=5))
+
+
+@unittest.skipUnless(notifications_supported(), "Unix sockets are not available")
+class TestAsyncStatusListener(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.listener = AsyncStatusListener(self.tmp_dir.name)
+        self.listener.start()
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        self.tmp_dir.cleanup()
+
+    async def test_change_of_the_upload_ends_the_wait(self):
+        """A notification for the awaited upload wakes the waiting coroutine."""
+        generation = self.listener.generation
+        asyncio.get_running_loop().call_later(0.05, notify_status_change, 'uid-1', self.tmp_dir.name)
+
+        self.assertTrue(await self.listener.wait('uid-1', generation, timeout=5))
+
+    async def test_change_of_another_upload_is_ignored(self):
+        """Notifications for other uploads do not end the wait."""
+        generation = self.listener.generation
+        notify_status_change('uid-2', self.tmp_dir.name)
+
+        self.assertFalse(await self.listener.wait('uid-1', generation, timeout=0.1))
+        self.assertEqual(self.listener._waiters, {})
+
+    async def test_change_before_the_wait_is_not_lost(self):
+        """A change between the snapshot and the wait returns immediately."""
+        generation = self.listener.generation
+        notify_status_change('uid-1', self.tmp_dir.name)
+        await asyncio.sleep(0.05)  # Let the event loop receive the notification
+
+        self.assertTrue(await self.listener.wait('uid-1', generation, timeout=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from rate_limiter import AdaptiveRateLimiter, retry_after_seconds, is_retryable_error, request_owner
+
+
+class FakeAPIError(Exception):
+    """Stand-in for an openai.APIStatusError carrying a status code and headers."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def test_retry_after_header_is_parsed(self):
+        """Retry-After and retry-after-ms headers are both understood."""
+        self.assertEqual(retry_after_seconds(FakeAPIError(429, {'retry-after': '3'})), 3.0)
+        self.assertEqual(retry_after_seconds(FakeAPIError(429, {'retry-after-ms': '250'})), 0.25)
+        self.assertIsNone(retry_after_seconds(FakeAPIError(429)))
+
+    def test_retryable_errors(self):
+        """Only rate limits and server errors are retried."""
+        self.assertTrue(is_retryable_error(FakeAPIError(429)))
+        self.assertTrue(is_retryable_error(FakeAPIError(503)))
+        self.assertFalse(is_retryable_error(FakeAPIError(400)))
+        self.assertFalse(is_retryable_error(ValueError("bad")))
+
+    @patch('rate_limiter.asyncio.sleep')
+    async def test_run_retries_rate_limited_calls(self, mock_sleep):
+        """A 429 is retried after the server-provided delay and the limit is halved."""
+        limiter = AdaptiveRateLimiter(max_concurrency=16)
+        responses = [FakeAPIError(429, {'retry-after': '2'}), "ok"]
+
+        async def call():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        result = await limiter.run(call)
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(limiter.retries, 1)
+        self.assertEqual(limiter.stats()['concurrency_limit'], 2)
+        mock_sleep.assert_any_await(2.0)
+
+    async def test_run_does_not_retry_client_errors(self):
+        """Non-retryable errors are raised straight away."""
+        limiter = AdaptiveRateLimiter()
+
+        async def call():
+            raise FakeAPIError(400)
+
+        with self.assertRaises(FakeAPIError):
+            await limiter.run(call)
+        self.assertEqual(limiter.retries, 0)
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_concurrency_never_exceeds_limit(self):
+        """No more calls than the concurrency limit run at the same time."""
+        limiter = AdaptiveRateLimiter(max_concurrency=8)
+        running = 0
+        peak = 0
+
+        async def call():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "ok"
+
+        await asyncio.gather(*[limiter.run(call) for _ in range(20)])
+
+        self.assertLessEqual(peak, limiter.max_concurrency)
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_waiting_calls_are_served_round_robin_by_owner(self):
+        """An owner with a long backlog does not delay the calls of an owner that arrives later."""
+        limiter = AdaptiveRateLimiter(max_concurrency=4)  # Starts with a single slot
+        order = []
+
+        async def call(owner):
+            order.append(owner)
+            await asyncio.sleep(0.01)
+
+        async def run_as(owner, calls):
+            request_owner.set(owner)
+            await asyncio.gather(*[limiter.run(lambda: call(owner)) for _ in range(calls)])
+
+        bulk = asyncio.create_task(run_as('bulk', 6))
+        await asyncio.sleep(0)
+        await asyncio.gather(bulk, run_as('interactive', 2))
+
+        # The first bulk call runs and the second already holds the turn when the interactive calls arrive
+        self.assertEqual(order[:6], ['bulk', 'bulk', 'bulk', 'interactive', 'bulk', 'interactive'])
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_cancelled_waiters_give_up_their_turn(self):
+        """A call cancelled while waiting for a slot neither holds a slot nor blocks later calls."""
+        limiter = AdaptiveRateLimiter(max_concurrency=4)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        await limiter.release()
+        await limiter.acquire()
+        self.assertEqual(limiter.in_flight, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
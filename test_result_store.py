@@ -0,0 +1,63 @@
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+import unittest
+from result_store import ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResultStore(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_missing_document(self):
+        """Nothing is returned for a key that was never stored."""
+        self.assertIsNone(self.store.get('missing'))
+
+    def test_round_trip(self):
+        """Stored documents come back compressed with the same ETag."""
+        etag, compressed = self.store.put('uid', {'explanation': ['é', 'b']})
+
+        self.assertEqual(self.store.get('uid'), (etag, compressed))
+        self.assertEqual(json.loads(gzip.decompress(compressed)), {'explanation': ['é', 'b']})
+
+    def test_etag_depends_on_content_only(self):
+        """Identical documents get identical ETags and different documents different ones."""
+        first, _ = self.store.put('a', ['x'])
+        second, _ = self.store.put('b', ['x'])
+        third, _ = self.store.put('c', ['y'])
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+
+    def test_reads_during_rewrites_return_matching_etags(self):
+        """A document read while it is being replaced comes with the ETag of the body that was read."""
+        documents = [{'explanation': ['first'] * 100}, {'explanation': ['second'] * 1000}]
+        self.store.put('uid', documents[0])
+        stop = threading.Event()
+
+        def rewrite():
+            count = 0
+            while not stop.is_set():
+                count += 1
+                self.store.put('uid', documents[count % 2])
+
+        writer = threading.Thread(target=rewrite)
+        writer.start()
+        try:
+            for _ in range(500):
+                etag, compressed = self.store.get('uid')
+                self.assertEqual(etag, hashlib.sha256(gzip.decompress(compressed)).hexdigest()[:32])
+        finally:
+            stop.set()
+            writer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import io
+import os
+import hashlib
+import tempfile
+import unittest
+from resumable_upload import ResumableUploadStore, UploadOffsetMismatch, UploadTooLarge, UploadSessionError
+
+
+class TestResumableUploadStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResumableUploadStore(os.path.join(self.tmp_dir.name, '.partial'), max_size=100)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_chunks_are_assembled_and_hashed(self):
+        """Chunks appended in order produce the original file and its SHA-256."""
+        upload_id = self.store.create('deck.pptx', total_size=10)
+        self.assertEqual(self.store.append_chunk(upload_id, 0, io.BytesIO(b'hello')), 5)
+        self.assertEqual(self.store.append_chunk(upload_id, 5, io.BytesIO(b'world')), 10)
+
+        destination = os.path.join(self.tmp_dir.name, 'deck.pptx')
+        metadata, sha256 = self.store.complete(upload_id, destination, hashlib.sha256(b'helloworld').hexdigest())
+
+        self.assertEqual(metadata['filename'], 'deck.pptx')
+        self.assertEqual(sha256, hashlib.sha256(b'helloworld').hexdigest())
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b'helloworld')
+
+    def test_hash_is_rebuilt_after_restart(self):
+        """A new store instance picks up a session left by a previous process."""
+        upload_id = self.store.create('deck.pptx')
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b'hello'))
+
+        restarted = ResumableUploadStore(self.store.folder, max_size=100)
+        self.assertEqual(restarted.get_offset(upload_id)[0], 5)
+        restarted.append_chunk(upload_id, 5, io.BytesIO(b'world'))
+        _, sha256 = restarted.complete(upload_id, os.path.join(self.tmp_dir.name, 'deck.pptx'))
+
+        self.assertEqual(sha256, hashlib.sha256(b'helloworld').hexdigest())
+
+    def test_wrong_offset_is_rejected(self):
+        """A chunk that does not start at the current offset reports the expected offset."""
+        upload_id = self.store.create('deck.pptx')
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b'hello'))
+
+        with self.assertRaises(UploadOffsetMismatch) as context:
+            self.store.append_chunk(upload_id, 0, io.BytesIO(b'hello'))
+        self.assertEqual(context.exception.expected_offset, 5)
+
+    def test_size_limit_is_enforced(self):
+        """Data beyond the maximum size is refused and not kept on disk."""
+        with self.assertRaises(UploadTooLarge):
+            self.store.create('deck.pptx', total_size=101)
+
+        upload_id = self.store.create('deck.pptx')
+        with self.assertRaises(UploadTooLarge):
+            self.store.append_chunk(upload_id, 0, io.BytesIO(b'x' * 101))
+        self.assertEqual(self.store.get_offset(upload_id)[0], 0)
+
+    def test_hash_mismatch_is_rejected(self):
+        """Finalizing with the wrong checksum fails."""
+        upload_id = self.store.create('deck.pptx')
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b'hello'))
+
+        with self.assertRaises(UploadSessionError):
+            self.store.complete(upload_id, os.path.join(self.tmp_dir.name, 'deck.pptx'), 'not-the-hash')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from token_estimator import count_tokens, count_message_tokens, split_text
+
+
+class TestTokenEstimator(unittest.TestCase):
+
+    def test_count_tokens_grows_with_text(self):
+        """Longer text never has fewer tokens, and empty text has none."""
+        self.assertEqual(count_tokens(""), 0)
+        self.assertGreater(count_tokens("Quarterly revenue grew by 12%."), 0)
+        self.assertGreater(count_tokens("word " * 100), count_tokens("word " * 10))
+
+    def test_message_tokens_include_overhead(self):
+        """Every chat message costs more than its content alone."""
+        messages = [{"role": "system", "content": "Hi"}, {"role": "user", "content": "There"}]
+        self.assertGreater(count_message_tokens(messages), count_tokens("Hi") + count_tokens("There"))
+
+    def test_short_text_is_not_split(self):
+        """Text within the limit comes back as a single chunk."""
+        self.assertEqual(split_text("A short slide.", 100), ["A short slide."])
+
+    def test_long_text_is_split_within_limit(self):
+        """Every chunk fits the limit and no words are lost."""
+        text = "\n\n".join(f"Paragraph {i}. " + "Some table cell text. " * 20 for i in range(10))
+
+        chunks = split_text(text, 60)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(count_tokens(chunk) <= 60 for chunk in chunks))
+        self.assertEqual(" ".join(chunks).split(), text.split())
+
+    def test_text_without_separators_is_cut(self):
+        """A single overlong word is cut into pieces that fit."""
+        chunks = split_text("x" * 1000, 30)
+
+        self.assertTrue(all(count_tokens(chunk) <= 30 for chunk in chunks))
+        self.assertEqual("".join(chunks), "x" * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import re
+import math
+
+try:
+    import tiktoken
+except ImportError:  # The heuristic below is used when tiktoken is not installed
+    tiktoken = None
+
+# Context windows of the models we use, in tokens
+MODEL_CONTEXT_TOKENS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4o-mini': 128000,
+    'gpt-4o': 128000,
+}
+DEFAULT_CONTEXT_TOKENS = 4096
+# Upper bound on the prompt of a single request; larger slides are split into chunks
+MAX_PROMPT_TOKENS = int(os.getenv('EXPLAINER_MAX_PROMPT_TOKENS', 6000))
+# Tokens every chat message costs on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Words, numbers and individual punctuation marks, roughly how BPE tokenizers split text
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+CHARACTERS_PER_WORD_TOKEN = 4
+# Where oversized text is split, from coarsest to finest: paragraphs, lines, sentences, words
+SPLIT_SEPARATORS = [r"\n\s*\n", r"\n", r"(?<=[.!?])\s+", r"\s+"]
+
+_encodings = {}
+
+
+def _get_encoding(model):
+    """Return the tiktoken encoding for a model, or None if tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding('cl100k_base')
+    return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    """
+    Estimate the number of tokens in a text, without any network access.
+
+    Uses tiktoken when it is installed. Otherwise every punctuation mark counts as one
+    token and every word as one token per four characters, which slightly overestimates
+    the count for English text, so budgets stay on the safe side.
+
+    Args:
+        text (str): The text to measure.
+        model (str, optional): Model whose tokenizer to use when tiktoken is available.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    encoding = _get_encoding(model or 'gpt-3.5-turbo')
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / CHARACTERS_PER_WORD_TOKEN) for piece in TOKEN_PATTERN.findall(text))
+
+
+def count_message_tokens(messages, model=None):
+    """
+    Estimate the prompt tokens of a list of chat messages.
+
+    Args:
+        messages (list of dict): Chat messages with a "content" key.
+        model (str, optional): Model whose tokenizer to use when tiktoken is available.
+
+    Returns:
+        int: The estimated number of prompt tokens.
+    """
+    return sum(count_tokens(message['content'], model) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def context_tokens(model):
+    """Return the context window of a model in tokens."""
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+def _split_pieces(text, separators):
+    """
+    Split text on the first separator that yields more than one piece.
+
+    Returns the pieces, each with its trailing separator attached so that joining them
+    restores the text, and the separators finer than the one used.
+    """
+    for index, separator in enumerate(separators):
+        parts = re.split(f"({separator})", text)
+        if len(parts) > 1:
+            return [''.join(parts[i:i + 2]) for i in range(0, len(parts), 2)], separators[index + 1:]
+    return None, []
+
+
+def split_text(text, max_tokens, model=None, separators=SPLIT_SEPARATORS):
+    """
+    Split a text into chunks of at most max_tokens tokens.
+
+    Splits on paragraph breaks first, then on line breaks, sentence ends and finally
+    whitespace, and packs consecutive pieces into as few chunks as possible. A single word
+    longer than the limit is cut by characters as a last resort.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int): Maximum estimated tokens per chunk.
+        model (str, optional): Model whose tokenizer to use when tiktoken is available.
+
+    Returns:
+        list of str: The chunks, in order; a single chunk if the text already fits.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    pieces, finer_separators = _split_pieces(text, list(separators))
+    if pieces is None:
+        # No separator left: cut the text into equal character slices that fit
+        size = max(1, len(text) * max_tokens // count_tokens(text, model))
+        while size > 1 and any(count_tokens(text[i:i + size], model) > max_tokens
+                               for i in range(0, len(text), size)):
+            size = size * 9 // 10
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if count_tokens(piece, model) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.extend(split_text(piece, max_tokens, model, finer_separators))
+        elif current and count_tokens(current + piece, model) > max_tokens:
+            chunks.append(current)
+            current = piece
+        else:
+            current += piece
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]